@@ -13,6 +13,7 @@ from langchain.prompts import (
 from langchain_openai import ChatOpenAI
 from phoenix.otel import register
 from openinference.instrumentation.langchain import LangChainInstrumentor
+from http_transport import get_http_client, get_async_http_client, get_settings, prewarm_connections
 
 # --- Phoenix Setup ---
 os.environ["PHOENIX_CLIENT_HEADERS"] = f"api_key={st.secrets['PHOENIX_API_KEY']}"
@@ -20,7 +21,8 @@ os.environ["PHOENIX_COLLECTOR_ENDPOINT"] = "https://app.phoenix.arize.com"
 
 # --- Secrets / API Key ---
 os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
-openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# The raw client and ChatOpenAI share one tuned connection pool, see http_transport.py
+openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=get_http_client(), timeout=get_settings().timeout())
 
 # --- Tracing Setup ---
 from phoenix.otel import register
@@ -35,7 +37,21 @@ tracer_provider = register(
 LangChainInstrumentor().instrument()
 
 # --- LLM Setup ---
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+llm = ChatOpenAI(
+    model="gpt-4o-mini",
+    temperature=0.7,
+    http_client=get_http_client(),
+    http_async_client=get_async_http_client(),
+    timeout=get_settings().timeout(),
+)
+
+# Open the OpenAI connection once per server process, before the first recipe request
+@st.cache_resource
+def prewarm_openai_connection():
+    prewarm_connections(["https://api.openai.com"])
+    return True
+
+prewarm_openai_connection()
 
 prompt = ChatPromptTemplate.from_messages([
     SystemMessagePromptTemplate.from_template("You are a helpful, budget-conscious home cook assistant."),
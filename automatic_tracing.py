@@ -9,9 +9,13 @@ from typing import Union
 from anthropic.types import ContentBlock, TextBlock
 from dotenv import load_dotenv
 import json
+import time
+import contextvars
 from openinference.semconv.trace import SpanAttributes
 
 from openai.types.chat import ChatCompletionToolParam
+from http_transport import get_http_client, get_settings, prewarm_connections, get_transport_stats
+from manual_tracing import get_tool_executor
 
 # Load environment variables from .env file
 load_dotenv()
@@ -60,10 +64,54 @@ OpenAIInstrumentor().instrument(tracer_provider=tracer_provider)
 
 
 # --- Model Providers Setup ---
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
+# Both clients share one tuned connection pool, see http_transport.py
+openai_client = OpenAI(api_key=OPENAI_API_KEY, http_client=get_http_client(), timeout=get_settings().timeout())
+anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY, http_client=get_http_client(), timeout=get_settings().timeout())
 
-def call_openai(prompt: str, model: str = "gpt-3.5-turbo") -> str:
+# Thread pool used to run the tool calls of a single response concurrently (TOOL_POOL_SIZE)
+tool_executor = get_tool_executor()
+
+# Simulate a tool's response
+def execute_tool_call(model: str, tool_call, main_span) -> str:
+    tracer = trace.get_tracer(__name__)
+    tool_name = tool_call.function.name
+    tool_args = tool_call.function.arguments
+
+    # Create a span for the tool call
+    with tracer.start_as_current_span(f"tool_call.{tool_name}") as tool_span:
+        # Link this span to the main span
+        tool_span.add_link(main_span.get_span_context())
+        tool_span.set_attribute("tool.name", tool_name)
+        tool_span.set_attribute("tool.args", str(tool_args))
+        tool_span.set_attribute("tool.call_id", tool_call.id)
+        tool_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "TOOL")
+
+        if tool_name == "get_weather":
+            # This OpenAI call will be auto-instrumented and show up as a separate span
+            city = json.loads(tool_args).get('city', 'London')
+            weather_prompt = f"What is the weather in {city}?"
+            weather_response = openai_client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": weather_prompt}]
+            )
+            tool_response = weather_response.choices[0].message.content or ""
+        else:
+            tool_response = ""
+
+        tool_span.set_attribute("tool.response", tool_response)
+    return tool_response
+
+def execute_tool_calls(model: str, tool_calls: list, main_span, parallel: bool = True) -> list[str]:
+    if not parallel or len(tool_calls) == 1:
+        return [execute_tool_call(model, tool_call, main_span) for tool_call in tool_calls]
+    # Copy the current context into each worker so the tool spans stay under main_span
+    futures = [
+        tool_executor.submit(contextvars.copy_context().run, execute_tool_call, model, tool_call, main_span)
+        for tool_call in tool_calls
+    ]
+    return [future.result() for future in futures]
+
+def call_openai(prompt: str, model: str = "gpt-3.5-turbo", parallel_tools: bool = True) -> str:
     # Get the current tracer
     tracer = trace.get_tracer(__name__)
     
@@ -100,49 +148,27 @@ def call_openai(prompt: str, model: str = "gpt-3.5-turbo") -> str:
 
         message = response.choices[0].message
 
-        # If there's a tool call, handle it
+        # If there are tool calls, handle all of them
         if message.tool_calls:
-            tool_call = message.tool_calls[0]
-            tool_call_id = tool_call.id
-            tool_name = tool_call.function.name
-            tool_args = tool_call.function.arguments
-
-            # Create a span for the tool call
-            with tracer.start_as_current_span("tool_call.get_weather") as tool_span:
-                # Link this span to the main span
-                tool_span.add_link(main_span.get_span_context())
-                tool_span.set_attribute("tool.name", tool_name)
-                tool_span.set_attribute("tool.args", str(tool_args))
-                tool_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "TOOL")
-                
-                # Simulate the tool's response 
-                if tool_name == "get_weather":
-                    # This OpenAI call will be auto-instrumented and show up as a separate span
-                    city = json.loads(tool_args).get('city', 'London')
-                    weather_prompt = f"What is the weather in {city}?"
-                    weather_response = openai_client.chat.completions.create(
-                        model=model,
-                        messages=[{"role": "user", "content": weather_prompt}]
-                    )
-                    tool_response = weather_response.choices[0].message.content or ""
-                else:
-                    tool_response = ""
-
-                tool_span.set_attribute("tool.response", tool_response)
-
-            # Add the tool response to the conversation
+            tool_calls = message.tool_calls
+
+            # Run every tool call concurrently, each in its own span
+            tool_responses = execute_tool_calls(model, tool_calls, main_span, parallel=parallel_tools)
+
+            # Add all of the tool responses to the conversation
             messages = [
                 {"role": "user", "content": prompt},
-                {"role": "assistant", "content": None, "tool_calls": [tool_call]},
-                {
+                {"role": "assistant", "content": None, "tool_calls": tool_calls},
+            ]
+            for tool_call, tool_response in zip(tool_calls, tool_responses):
+                messages.append({
                     "role": "tool",
-                    "tool_call_id": tool_call_id,
-                    "name": tool_name,
+                    "tool_call_id": tool_call.id,
+                    "name": tool_call.function.name,
                     "content": tool_response
-                }
-            ]
+                })
 
-            # Make the final call with the tool response
+            # Make a single final call with every tool response
             final_response = openai_client.chat.completions.create(
                 model=model,
                 messages=messages
@@ -171,6 +197,9 @@ def call_anthropic(prompt: str, model: str = "claude-3-opus-20240229") -> str:
 
 # Example usage:
 if __name__ == "__main__":
+    # Open provider connections up front so the first call doesn't pay for TLS setup
+    prewarm_connections()
+
     # test_prompt = "What's a quick dinner recipe using eggs and spinach?"
     test_tool_prompt = "What's the weather in London?"
 
@@ -183,3 +212,13 @@ if __name__ == "__main__":
     print("\nAnthropic Response:")
     anthropic_response = call_anthropic(test_tool_prompt)
     print(anthropic_response)
+
+    # Multi-city prompt, tool calls run one after another vs concurrently
+    print("\nMulti-city tool calls:")
+    multi_city_prompt = "What's the weather in London, Paris, Tokyo and Toronto?"
+    for parallel_tools in (False, True):
+        start_time = time.perf_counter()
+        call_openai(multi_city_prompt, parallel_tools=parallel_tools)
+        print(f"parallel_tools={parallel_tools}: {time.perf_counter() - start_time:.2f}s")
+
+    print(f"\nHTTP transport: {get_transport_stats()}")
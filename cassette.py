@@ -0,0 +1,253 @@
+"""Record/replay of provider HTTP traffic ("cassettes") for deterministic, offline runs.
+
+The cassette transports wrap the shared httpx transports from http_transport.py, so every
+OpenAI and Anthropic call made through them is covered: chat completions, streamed
+responses (chunk by chunk, with their timing), tool calls and image generation.
+
+    LLM_CASSETTE_MODE=record  call the real API and save each response
+    LLM_CASSETTE_MODE=replay  serve saved responses, never touching the network
+    LLM_CASSETTE_DIR          where cassettes live (default .cassettes)
+    LLM_CASSETTE_LATENCY      replay latency as a multiple of the recorded timing
+                              (0 = instant, 1 = as recorded)
+
+Each response is stored as one JSON file named after a hash of the normalized request:
+method, URL and body with JSON keys sorted. Headers are not part of the key and are never
+saved on the request side, so API keys don't end up on disk. Replay still needs the API key
+variables to be set for the SDK clients to build, but any value works.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+CASSETTE_MODES = ("off", "record", "replay")
+
+
+class CassetteMissError(LookupError):
+    """Replay mode found no recorded response for a request"""
+
+
+def normalize_request(request: httpx.Request) -> dict:
+    body = request.content
+    try:
+        normalized_body = json.loads(body) if body else None
+    except (ValueError, UnicodeDecodeError):
+        normalized_body = {"sha256": hashlib.sha256(body).hexdigest()}
+    return {
+        "method": request.method,
+        "url": str(request.url.copy_with(query=None)),
+        "query": sorted(request.url.params.multi_items()),
+        "body": normalized_body,
+    }
+
+
+def request_key(request: httpx.Request) -> str:
+    canonical = json.dumps(normalize_request(request), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+class Cassette:
+    """A directory of recorded interactions, one JSON file per request key"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, request: httpx.Request) -> dict:
+        key = request_key(request)
+        try:
+            with open(self.path(key)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            raise CassetteMissError(
+                f"No cassette for {request.method} {request.url} (key {key}); record it with LLM_CASSETTE_MODE=record"
+            ) from None
+
+    def save(self, request: httpx.Request, response: httpx.Response, headers_at: float, chunks: list[tuple[float, bytes]]):
+        interaction = {
+            "request": normalize_request(request),
+            "response": {
+                "status_code": response.status_code,
+                "headers": [[name, value] for name, value in response.headers.multi_items() if name.lower() != "set-cookie"],
+                "headers_at": round(headers_at, 4),
+                "chunks": [[round(offset, 4), base64.b64encode(chunk).decode()] for offset, chunk in chunks],
+            },
+        }
+        path = self.path(request_key(request))
+        # Write then rename so concurrent readers never see a half-written cassette
+        with self._lock:
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump(interaction, file)
+            os.replace(temp_path, path)
+
+
+# --- Recording ---
+
+class RecordingStream(httpx.SyncByteStream):
+    """Passes response bytes through unchanged while noting when each chunk arrived"""
+
+    def __init__(self, stream, cassette: Cassette, request: httpx.Request, response: httpx.Response, started: float, headers_at: float):
+        self.stream = stream
+        self.cassette = cassette
+        self.request = request
+        self.response = response
+        self.started = started
+        self.headers_at = headers_at
+        self.chunks: list[tuple[float, bytes]] = []
+        self.complete = False
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.chunks.append((time.perf_counter() - self.started, chunk))
+            yield chunk
+        self.complete = True
+
+    def close(self):
+        self.stream.close()
+        # Only keep responses that were read to the end
+        if self.complete:
+            self.cassette.save(self.request, self.response, self.headers_at, self.chunks)
+
+
+class AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, cassette: Cassette, request: httpx.Request, response: httpx.Response, started: float, headers_at: float):
+        self.stream = stream
+        self.cassette = cassette
+        self.request = request
+        self.response = response
+        self.started = started
+        self.headers_at = headers_at
+        self.chunks: list[tuple[float, bytes]] = []
+        self.complete = False
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.chunks.append((time.perf_counter() - self.started, chunk))
+            yield chunk
+        self.complete = True
+
+    async def aclose(self):
+        await self.stream.aclose()
+        if self.complete:
+            self.cassette.save(self.request, self.response, self.headers_at, self.chunks)
+
+
+# --- Replay ---
+
+class ReplayStream(httpx.SyncByteStream):
+    def __init__(self, recorded: dict, latency_scale: float):
+        self.recorded = recorded
+        self.latency_scale = latency_scale
+
+    def __iter__(self):
+        previous = self.recorded["headers_at"]
+        for offset, chunk in self.recorded["chunks"]:
+            if self.latency_scale:
+                time.sleep(max(0.0, offset - previous) * self.latency_scale)
+            previous = offset
+            yield base64.b64decode(chunk)
+
+
+class AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, recorded: dict, latency_scale: float):
+        self.recorded = recorded
+        self.latency_scale = latency_scale
+
+    async def __aiter__(self):
+        previous = self.recorded["headers_at"]
+        for offset, chunk in self.recorded["chunks"]:
+            if self.latency_scale:
+                await asyncio.sleep(max(0.0, offset - previous) * self.latency_scale)
+            previous = offset
+            yield base64.b64decode(chunk)
+
+
+def replay_response(recorded: dict, stream) -> httpx.Response:
+    return httpx.Response(status_code=recorded["status_code"], headers=recorded["headers"], stream=stream)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, inner: httpx.BaseTransport, cassette: Cassette, mode: str, latency_scale: float = 0.0):
+        self.inner = inner
+        self.cassette = cassette
+        self.mode = mode
+        self.latency_scale = latency_scale
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.mode == "replay":
+            recorded = self.cassette.load(request)["response"]
+            if self.latency_scale:
+                time.sleep(recorded["headers_at"] * self.latency_scale)
+            return replay_response(recorded, ReplayStream(recorded, self.latency_scale))
+
+        started = time.perf_counter()
+        response = self.inner.handle_request(request)
+        headers_at = time.perf_counter() - started
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=RecordingStream(response.stream, self.cassette, request, response, started, headers_at),
+            extensions=response.extensions,
+        )
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, cassette: Cassette, mode: str, latency_scale: float = 0.0):
+        self.inner = inner
+        self.cassette = cassette
+        self.mode = mode
+        self.latency_scale = latency_scale
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.mode == "replay":
+            recorded = self.cassette.load(request)["response"]
+            if self.latency_scale:
+                await asyncio.sleep(recorded["headers_at"] * self.latency_scale)
+            return replay_response(recorded, AsyncReplayStream(recorded, self.latency_scale))
+
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        headers_at = time.perf_counter() - started
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=AsyncRecordingStream(response.stream, self.cassette, request, response, started, headers_at),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def get_cassette_mode() -> str:
+    mode = os.environ.get("LLM_CASSETTE_MODE", "off").lower()
+    if mode not in CASSETTE_MODES:
+        raise ValueError(f"LLM_CASSETTE_MODE must be one of {', '.join(CASSETTE_MODES)}, got {mode!r}")
+    return mode
+
+
+def wrap_transport(transport, is_async: bool = False, mode: Optional[str] = None):
+    """Wrap a transport for the configured cassette mode (unchanged when the mode is off)"""
+    mode = mode or get_cassette_mode()
+    if mode == "off":
+        return transport
+    cassette = Cassette(os.environ.get("LLM_CASSETTE_DIR", ".cassettes"))
+    latency_scale = float(os.environ.get("LLM_CASSETTE_LATENCY", "0"))
+    transport_class = AsyncCassetteTransport if is_async else CassetteTransport
+    return transport_class(transport, cassette, mode, latency_scale)
@@ -0,0 +1,63 @@
+"""Check that importing the tracing module stays cheap.
+
+Runs `python -X importtime -c "import <module>"` a few times in fresh interpreters, keeps
+the fastest run, prints the slowest imports and exits non-zero if the module's cumulative
+import time is over budget.
+
+    python check_import_time.py [module] [--budget-ms 250]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import(module: str) -> list[tuple[int, int, str]]:
+    """Return (self_us, cumulative_us, name) for every import made while importing `module`"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("module", nargs="?", default="manual_tracing")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_TIME_BUDGET_MS", "250")))
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # The first run warms the filesystem cache, so keep the fastest of several
+    best = None
+    for _ in range(args.runs):
+        imports = measure_import(args.module)
+        total_us = next(cumulative for _, cumulative, name in imports if name.strip() == args.module)
+        if best is None or total_us < best[0]:
+            best = (total_us, imports)
+    total_us, imports = best
+
+    print(f"Slowest imports under {args.module}:")
+    for self_us, cumulative_us, name in sorted(imports, key=lambda item: item[1], reverse=True)[1:11]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    total_ms = total_us / 1000
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        print("Import time is over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
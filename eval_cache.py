@@ -0,0 +1,88 @@
+"""Content-addressed cache of judge results, shared across eval runs.
+
+A judgment only depends on what the judge sees and how it is asked, so results are keyed
+on a hash of the span's input and output, the eval template text, the rails and the judge
+model. Changing any of them (editing a template, switching judge model) misses the cache
+instead of returning stale results. Results live in a small SQLite file next to the evals.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Optional
+
+import pandas as pd
+
+RESULT_COLUMNS = ["label", "score", "explanation"]
+
+
+def template_text(template) -> str:
+    """Text of a phoenix eval template, whichever form its .template attribute takes"""
+    parts = template.template
+    if isinstance(parts, str):
+        return parts
+    return "\n".join(part.template for part in parts)
+
+
+def judgment_key(input_value: str, output_value: str, template: str, rails: list[str], judge_model: str) -> str:
+    payload = json.dumps([input_value, output_value, template, list(rails), judge_model], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class EvalResultCache:
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS judgments ("
+            " key TEXT PRIMARY KEY,"
+            " label TEXT,"
+            " score REAL,"
+            " explanation TEXT,"
+            " created_at REAL NOT NULL)"
+        )
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay under SQLite's bound-parameter limit
+        for offset in range(0, len(unique_keys), 500):
+            chunk = unique_keys[offset:offset + 500]
+            rows = self.connection.execute(
+                f"SELECT key, label, score, explanation FROM judgments WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for key, label, score, explanation in rows:
+                found[key] = {"label": label, "score": score, "explanation": explanation}
+        return found
+
+    def put_many(self, results: list[tuple[str, Optional[str], Optional[float], Optional[str]]]):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO judgments (key, label, score, explanation, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, label, score, explanation, now) for key, label, score, explanation in results],
+            )
+
+    def split(self, spans: pd.DataFrame, keys: pd.Series) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Return (cached results indexed like `spans`, spans still to be judged)"""
+        found = self.get_many(list(keys))
+        hit = keys.isin(found.keys())
+        cached = pd.DataFrame([found[key] for key in keys[hit]], index=spans.index[hit], columns=RESULT_COLUMNS)
+        return cached, spans[~hit]
+
+    def store(self, keys: pd.Series, results: pd.DataFrame):
+        """Save fresh judgments; rows where the judge failed (no label) are not cached"""
+        rows = []
+        for span_id, result in results.iterrows():
+            label = result.get("label")
+            if label is None or pd.isna(label):
+                continue
+            score = result.get("score")
+            explanation = result.get("explanation")
+            rows.append((
+                keys[span_id],
+                str(label),
+                None if score is None or pd.isna(score) else float(score),
+                None if explanation is None or pd.isna(explanation) else str(explanation),
+            ))
+        self.put_many(rows)
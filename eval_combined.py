@@ -0,0 +1,138 @@
+"""One judge call per span for several classification criteria.
+
+The separate evaluators each send the span's input and output to the judge again. The
+CombinedJudge asks for every criterion in a single structured-output call (a strict JSON
+schema, explanation before label for each criterion) and returns the results in the same
+label/score/explanation shape the phoenix evaluators produce, scored with each criterion's
+own template, so they can be logged as the usual per-criterion SpanEvaluations.
+
+agreement_report() compares its labels with the separate evaluators' on the same spans.
+"""
+import json
+from dataclasses import dataclass
+
+import pandas as pd
+
+from eval_cache import RESULT_COLUMNS
+
+
+@dataclass
+class Criterion:
+    eval_name: str
+    # Key of this criterion in the judge's JSON answer
+    field: str
+    instructions: str
+    # phoenix ClassificationTemplate: allowed labels (rails) and their scores
+    template: object
+
+
+def build_prompt(criteria: list[Criterion]) -> str:
+    sections = "\n\n".join(
+        f"{criterion.field}: {criterion.instructions}\nAllowed labels: {', '.join(criterion.template.rails)}"
+        for criterion in criteria
+    )
+    return (
+        "You are evaluating an AI assistant's answer to a user's question on several criteria. "
+        "Judge each criterion independently. For each one, first explain your reasoning briefly, "
+        "then give exactly one of its allowed labels.\n\n"
+        f"{sections}\n\n"
+        "[BEGIN DATA]\n"
+        "Question: {input}\n"
+        "Answer: {output}\n"
+        "[END DATA]"
+    )
+
+
+def build_schema(criteria: list[Criterion]) -> dict:
+    return {
+        "type": "object",
+        "properties": {
+            criterion.field: {
+                "type": "object",
+                "properties": {
+                    "explanation": {"type": "string"},
+                    "label": {"type": "string", "enum": list(criterion.template.rails)},
+                },
+                "required": ["explanation", "label"],
+                "additionalProperties": False,
+            }
+            for criterion in criteria
+        },
+        "required": [criterion.field for criterion in criteria],
+        "additionalProperties": False,
+    }
+
+
+class CombinedJudge:
+    def __init__(self, client, model: str, criteria: list[Criterion]):
+        """`client` is an AsyncOpenAI client; `model` the judge model name"""
+        self.client = client
+        self.model = model
+        self.criteria = criteria
+        self.prompt = build_prompt(criteria)
+        self.schema = build_schema(criteria)
+
+    def cache_template(self, criterion: Criterion) -> str:
+        """Template text for a criterion's judgment cache key"""
+        return f"{self.prompt}\n[{criterion.eval_name}]"
+
+    async def aevaluate(self, record: dict, provide_explanation: bool = True) -> dict[str, dict]:
+        """Eval name -> label/score/explanation, from one judge call"""
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            temperature=0,
+            messages=[{"role": "user", "content": self.prompt.format(input=record["input"], output=record["output"])}],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "span_judgment", "strict": True, "schema": self.schema},
+            },
+        )
+        judged = json.loads(response.choices[0].message.content)
+        results = {}
+        for criterion in self.criteria:
+            label = judged[criterion.field]["label"]
+            results[criterion.eval_name] = {
+                "label": label,
+                "score": criterion.template.score(label),
+                "explanation": judged[criterion.field]["explanation"] if provide_explanation else None,
+            }
+        return results
+
+
+def split_results(combined: pd.DataFrame, criteria: list[Criterion]) -> dict[str, pd.DataFrame]:
+    """Turn the combined judge's per-span results into one label/score/explanation frame per criterion"""
+    frames = {}
+    for criterion in criteria:
+        column = combined[criterion.eval_name] if criterion.eval_name in combined else pd.Series(dtype=object)
+        frames[criterion.eval_name] = pd.DataFrame(list(column), index=column.index, columns=RESULT_COLUMNS)
+        frames[criterion.eval_name].index.name = combined.index.name
+    return frames
+
+
+def cohen_kappa(first: pd.Series, second: pd.Series) -> float:
+    observed = (first == second).mean()
+    expected = sum(
+        first.value_counts(normalize=True).get(label, 0.0) * second.value_counts(normalize=True).get(label, 0.0)
+        for label in set(first) | set(second)
+    )
+    return 1.0 if expected == 1 else (observed - expected) / (1 - expected)
+
+
+def agreement_report(separate: dict[str, pd.DataFrame], combined: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Per criterion: exact label agreement and Cohen's kappa on spans both judged; for
+    numeric ratings also the share within one point and the mean absolute difference"""
+    rows = []
+    for eval_name, separate_df in separate.items():
+        joined = separate_df[["label"]].join(combined[eval_name][["label"]], how="inner", lsuffix="_separate", rsuffix="_combined").dropna()
+        first, second = joined["label_separate"].astype(str), joined["label_combined"].astype(str)
+        row = {"eval_name": eval_name, "spans": len(joined)}
+        if len(joined):
+            row["exact_agreement"] = round((first == second).mean(), 3)
+            row["cohen_kappa"] = round(cohen_kappa(first, second), 3)
+            first_rating, second_rating = pd.to_numeric(first, errors="coerce"), pd.to_numeric(second, errors="coerce")
+            if first_rating.notna().all() and second_rating.notna().all():
+                difference = (first_rating - second_rating).abs()
+                row["within_one"] = round((difference <= 1).mean(), 3)
+                row["mean_abs_diff"] = round(difference.mean(), 3)
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("eval_name")
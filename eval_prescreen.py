@@ -0,0 +1,130 @@
+"""Deterministic local pre-screens for recipe outputs, vectorized over the spans dataframe.
+
+These catch the mechanical failures that don't need a judge model: an estimated total cost
+above the user's budget, ignoring the ingredients the user listed, a missing
+"Visual Description:" line where the request asks for one (app.py's prompt does) and, as
+a rough relevance proxy, little TF-IDF overlap between the request and the answer.
+
+Each pre-screen returns a label/score/explanation frame indexed like the spans, covering
+only the spans it applies to (e.g. those whose input states a budget), so it can be logged
+as its own SpanEvaluations. clear_failures() picks out spans that failed a check outright,
+for callers that want to skip LLM judging on them.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from eval_cache import RESULT_COLUMNS
+
+# Span values are often JSON-encoded messages, with newlines escaped
+ESCAPED_NEWLINE = "\\n"
+# Recipes for non-US cities sometimes quote prices in local currency
+AMOUNT = r"[$£€]\s*(\d[\d,]*(?:\.\d+)?)"
+
+BUDGET_PATTERN = r"(?i)budget:?\s*\$?\s*(\d+(?:\.\d+)?)"
+INGREDIENTS_PATTERN = r"(?i)ingredients:\s*(.*?),\s*location:"
+# Markdown emphasis may sit on either side of the colon: "**Visual Description:**" or "**Visual Description**:"
+REQUIRED_SECTIONS = {"Visual Description": r"(?i)visual description\W{0,3}:"}
+
+# Labels that mean a span failed a check outright
+CLEAR_FAILURE_LABELS = {"over_budget", "ignored", "missing"}
+
+
+def as_text(values: pd.Series) -> pd.Series:
+    return values.fillna("").astype(str).str.replace(ESCAPED_NEWLINE, "\n", regex=False)
+
+
+def to_amount(values: pd.Series) -> pd.Series:
+    return pd.to_numeric(values.str.replace(",", "", regex=False), errors="coerce")
+
+
+def result_frame(index: pd.Index, label: pd.Series, score: pd.Series, explanation: pd.Series) -> pd.DataFrame:
+    frame = pd.DataFrame({"label": label, "score": score.astype(float), "explanation": explanation}, index=index)
+    return frame[RESULT_COLUMNS]
+
+
+def budget_eval(spans: pd.DataFrame) -> pd.DataFrame:
+    """Compare the answer's estimated total cost with the budget in the request"""
+    inputs, outputs = as_text(spans["input"]), as_text(spans["output"])
+    budget = to_amount(inputs.str.extract(BUDGET_PATTERN, expand=False))
+    total_line = outputs.str.extract(r"(?i)(total[^\n]*[$£€][^\n]*)", expand=False).fillna("")
+    # "Total: $1.50 (groceries) + $0 (pantry) = $1.50" -> the amount after "=", else the first one
+    cost = to_amount(total_line.str.extract(r"=\s*" + AMOUNT, expand=False)).fillna(
+        to_amount(total_line.str.extract(AMOUNT, expand=False))
+    )
+    has_budget = budget.notna()
+    budget, cost = budget[has_budget], cost[has_budget]
+    over = cost > budget
+    label = pd.Series(np.select([cost.isna(), over], ["no_cost_estimate", "over_budget"], "within_budget"), index=budget.index)
+    explanation = (
+        "estimated total $" + cost.round(2).astype(str).where(cost.notna(), "?")
+        + " vs budget $" + budget.round(2).astype(str)
+    )
+    # No score without a cost estimate; that is neither a pass nor a failure
+    score = (~over).astype(float).where(cost.notna())
+    return result_frame(budget.index, label, score, explanation)
+
+
+def ingredient_coverage_eval(spans: pd.DataFrame, min_coverage: float = 0.5) -> pd.DataFrame:
+    """Share of the ingredients listed in the request that the answer mentions"""
+    inputs, outputs = as_text(spans["input"]), as_text(spans["output"]).str.lower()
+    listed = inputs.str.extract(INGREDIENTS_PATTERN, expand=False).dropna()
+    ingredients = listed.str.lower().str.split(",").explode().str.strip()
+    ingredients = ingredients[ingredients != ""]
+    # Match "tomatoes" against "tomato" and vice versa
+    stems = ingredients.str.replace(r"(es|s)$", "", regex=True)
+    mentioned = pd.Series(
+        [stem in output for stem, output in zip(stems, outputs.reindex(stems.index))], index=stems.index, dtype=float
+    )
+    coverage = mentioned.groupby(level=0, sort=False).mean()
+    missing = ingredients[mentioned == 0].groupby(level=0, sort=False).agg(", ".join).reindex(coverage.index).fillna("")
+    label = pd.Series(
+        np.select([coverage == 0, coverage < min_coverage], ["ignored", "partial"], "covered"), index=coverage.index
+    )
+    explanation = (coverage * 100).round().astype(int).astype(str) + "% of listed ingredients used"
+    explanation = explanation.where(missing == "", explanation + "; missing: " + missing)
+    return result_frame(coverage.index, label, coverage, explanation)
+
+
+def required_section_eval(spans: pd.DataFrame, section: str, pattern: str) -> pd.DataFrame:
+    """Whether the answer has the section, for the requests that ask for it"""
+    asked = as_text(spans["input"]).str.contains(section, case=False, regex=False)
+    present = as_text(spans.loc[asked, "output"]).str.contains(pattern, regex=True)
+    label = present.map({True: "present", False: "missing"})
+    explanation = present.map({True: f'"{section}:" line found', False: f'no "{section}:" line'})
+    return result_frame(present.index, label, present.astype(float), explanation)
+
+
+def tfidf_relevance_eval(spans: pd.DataFrame, min_similarity: float = 0.1) -> pd.DataFrame:
+    """Cosine similarity of the request's and the answer's TF-IDF vectors, fitted on this batch"""
+    inputs, outputs = as_text(spans["input"]), as_text(spans["output"])
+    try:
+        vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True).fit(pd.concat([inputs, outputs]))
+    except ValueError:
+        # Nothing but stop words in the whole batch
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    # Rows are L2-normalized, so the row-wise dot product is the cosine similarity
+    similarity = np.asarray(vectorizer.transform(inputs).multiply(vectorizer.transform(outputs)).sum(axis=1)).ravel()
+    similarity = pd.Series(similarity, index=spans.index)
+    label = pd.Series(np.where(similarity < min_similarity, "off_topic", "related"), index=spans.index)
+    return result_frame(spans.index, label, similarity, "tf-idf cosine similarity " + similarity.round(3).astype(str))
+
+
+def run_prescreens(spans: pd.DataFrame, min_coverage: float = 0.5, min_similarity: float = 0.1) -> dict[str, pd.DataFrame]:
+    """Eval name -> results for every pre-screen"""
+    if spans.empty:
+        return {}
+    results = {
+        "Budget (local)": budget_eval(spans),
+        "Ingredient coverage (local)": ingredient_coverage_eval(spans, min_coverage),
+        "Relevance proxy (local)": tfidf_relevance_eval(spans, min_similarity),
+    }
+    for section, pattern in REQUIRED_SECTIONS.items():
+        results[f"{section} (local)"] = required_section_eval(spans, section, pattern)
+    return results
+
+
+def clear_failures(results: dict[str, pd.DataFrame]) -> pd.Index:
+    """Spans that failed at least one pre-screen outright (the relevance proxy is too rough to count)"""
+    failed = [frame.index[frame["label"].isin(CLEAR_FAILURE_LABELS)] for frame in results.values()]
+    return pd.Index([]).append(failed).unique() if failed else pd.Index([])
@@ -0,0 +1,260 @@
+"""Concurrency-controlled, checkpointed runner for phoenix LLM evaluators.
+
+run_evals() judges a whole dataframe in one go: a crash halfway loses every judgment
+made so far, and there is no per-evaluator throughput readout. EvalRunner instead calls
+each evaluator's aevaluate() row by row under a per-judge-model concurrency limit. An
+evaluator returns (label, score, explanation), or a dict of results (see eval_combined).
+
+- Completed rows are appended to a JSONL checkpoint every `checkpoint_every_rows` rows or
+  `checkpoint_every_seconds`, and rows already in the checkpoint are skipped when the run
+  restarts. clear_checkpoint() removes it once the results are safely logged.
+- A rate-limit error (HTTP 429) halves that judge model's concurrency and pauses it for
+  the server's Retry-After (or a short backoff); successes grow it back one step at a time.
+  Other transient errors are retried with backoff, up to `max_attempts` per row. Rows that
+  still fail are logged and listed in their evaluator's stats, for the caller to retry.
+- Rows/sec and latency percentiles are kept per evaluator in `stats` (see summary()).
+- Every run() uses the runner's one event loop, until close(). Async HTTP clients keep
+  pooled connections tied to the loop that opened them, so with a new loop per call the
+  judge's shared client would reuse connections of a closed loop ("Event loop is closed").
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import pandas as pd
+
+from eval_cache import RESULT_COLUMNS
+from provider_retry import is_retryable
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) == 429 or any(cls.__name__ == "RateLimitError" for cls in type(error).__mro__)
+
+
+def retry_after_seconds(error: BaseException, default: float) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return default
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class JudgeLane:
+    """Adaptive concurrency limit for one judge model (additive increase, multiplicative decrease)"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.rate_limited = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+    async def release(self, succeeded: bool):
+        async with self._condition:
+            self.in_flight -= 1
+            if succeeded and self.limit < self.max_concurrency:
+                self._successes += 1
+                if self._successes >= self.limit:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def on_rate_limit(self, pause_seconds: float):
+        self.rate_limited += 1
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+        self.paused_until = max(self.paused_until, time.monotonic() + pause_seconds)
+
+
+@dataclass
+class EvalJob:
+    eval_name: str
+    evaluator: object
+    judge_model: str
+    rows: pd.DataFrame
+
+
+@dataclass
+class EvaluatorStats:
+    rows: int = 0
+    resumed: int = 0
+    failed: int = 0
+    retries: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+    latencies: list[float] = field(default_factory=list)
+    # Rows left without a result, to be judged again by a later run
+    failed_span_ids: list = field(default_factory=list)
+
+    def summary(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        latencies = sorted(self.latencies)
+        return {
+            "rows": self.rows,
+            "resumed_from_checkpoint": self.resumed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "rows_per_second": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_p50_s": round(percentile(latencies, 0.50), 3),
+            "latency_p95_s": round(percentile(latencies, 0.95), 3),
+            "latency_p99_s": round(percentile(latencies, 0.99), 3),
+        }
+
+
+class EvalRunner:
+    def __init__(
+        self,
+        checkpoint_path: str,
+        concurrency: Optional[dict[str, int]] = None,
+        default_concurrency: int = 20,
+        checkpoint_every_rows: int = 50,
+        checkpoint_every_seconds: float = 10.0,
+        max_attempts: int = 5,
+    ):
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency or {}
+        self.default_concurrency = default_concurrency
+        self.checkpoint_every_rows = checkpoint_every_rows
+        self.checkpoint_every_seconds = checkpoint_every_seconds
+        self.max_attempts = max_attempts
+        self.stats: dict[str, EvaluatorStats] = {}
+        self._pending_lines: list[str] = []
+        self._checkpointed_at = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def load_checkpoint(self) -> dict[str, dict[str, dict]]:
+        """eval name -> span id -> result, for every row completed by an earlier attempt"""
+        completed: dict[str, dict[str, dict]] = {}
+        if not os.path.exists(self.checkpoint_path):
+            return completed
+        with open(self.checkpoint_path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash mid-write
+                    continue
+                completed.setdefault(entry["eval_name"], {})[entry["span_id"]] = entry["result"]
+        return completed
+
+    def _checkpoint(self, force: bool = False):
+        due = len(self._pending_lines) >= self.checkpoint_every_rows or time.monotonic() - self._checkpointed_at >= self.checkpoint_every_seconds
+        if not self._pending_lines or not (force or due):
+            return
+        with open(self.checkpoint_path, "a") as file:
+            file.writelines(self._pending_lines)
+            file.flush()
+            os.fsync(file.fileno())
+        self._pending_lines = []
+        self._checkpointed_at = time.monotonic()
+        progress = ", ".join(
+            f"{name} {stats.resumed + len(stats.latencies)}/{stats.rows}" for name, stats in self.stats.items()
+        )
+        print(f"Eval checkpoint: {progress} rows done")
+
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def run(self, jobs: list[EvalJob]) -> dict[str, pd.DataFrame]:
+        """Judge every job's rows; returns a frame of results per job, indexed by span id"""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self._run(jobs))
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+            self._loop = None
+
+    async def _run(self, jobs: list[EvalJob]) -> dict[str, pd.DataFrame]:
+        completed = self.load_checkpoint()
+        lanes: dict[str, JudgeLane] = {}
+        results: dict[str, dict] = {}
+        tasks = []
+        for job in jobs:
+            lane = lanes.get(job.judge_model)
+            if lane is None:
+                lane = lanes[job.judge_model] = JudgeLane(self.concurrency.get(job.judge_model, self.default_concurrency))
+            stats = self.stats[job.eval_name] = EvaluatorStats(rows=len(job.rows))
+            done = completed.get(job.eval_name, {})
+            results[job.eval_name] = job_results = {}
+            for span_id, row in job.rows.iterrows():
+                if span_id in done:
+                    job_results[span_id] = done[span_id]
+                    stats.resumed += 1
+                else:
+                    tasks.append(self._judge(job, lane, stats, job_results, span_id, row.to_dict()))
+        await asyncio.gather(*tasks)
+        self._checkpoint(force=True)
+
+        frames = {}
+        for job in jobs:
+            frame = pd.DataFrame.from_dict(results[job.eval_name], orient="index")
+            if frame.empty:
+                frame = pd.DataFrame(columns=RESULT_COLUMNS)
+            frame.index.name = job.rows.index.name
+            frames[job.eval_name] = frame
+        return frames
+
+    async def _judge(self, job: EvalJob, lane: JudgeLane, stats: EvaluatorStats, job_results: dict, span_id, record: dict):
+        try:
+            await self._judge_row(job, lane, stats, job_results, span_id, record)
+        finally:
+            # Evaluators share the event loop, so each one's throughput is measured to its own last row
+            stats.finished = time.perf_counter()
+
+    async def _judge_row(self, job: EvalJob, lane: JudgeLane, stats: EvaluatorStats, job_results: dict, span_id, record: dict):
+        for attempt in range(1, self.max_attempts + 1):
+            await lane.acquire()
+            started = time.perf_counter()
+            try:
+                result = await job.evaluator.aevaluate(record, provide_explanation=True)
+            except Exception as error:
+                await lane.release(succeeded=False)
+                if is_rate_limited(error):
+                    lane.on_rate_limit(retry_after_seconds(error, default=2.0 * attempt))
+                elif not is_retryable(error) or attempt == self.max_attempts:
+                    stats.failed += 1
+                    stats.failed_span_ids.append(span_id)
+                    logger.warning("%s failed for span %s: %s", job.eval_name, span_id, error)
+                    return
+                else:
+                    await asyncio.sleep(random.uniform(0, min(8.0, 0.5 * 2 ** attempt)))
+                stats.retries += 1
+                continue
+            stats.latencies.append(time.perf_counter() - started)
+            await lane.release(succeeded=True)
+            if isinstance(result, tuple):
+                result = dict(zip(RESULT_COLUMNS, result))
+            job_results[span_id] = result
+            self._pending_lines.append(json.dumps({"eval_name": job.eval_name, "span_id": span_id, "result": result}) + "\n")
+            self._checkpoint()
+            return
+        stats.failed += 1
+        stats.failed_span_ids.append(span_id)
+        logger.warning("%s gave up on span %s after %s attempts", job.eval_name, span_id, self.max_attempts)
@@ -0,0 +1,128 @@
+"""Stratified sampling of spans for LLM judging, with confidence intervals for the scores.
+
+Spans are grouped into strata by the request's location and budget bucket (app.py's city
+selectbox and budget slider), the model and a latency band. In each chunk of spans, each
+stratum gets ceil(fraction * size) spans, and at least `min_per_stratum`, so rare cities
+and budgets stay represented. Within a stratum, spans are picked by a hash of their span
+id, so the same spans are chosen again on a rerun (and hit the judgment cache).
+
+Because the minimum and the rounding apply per chunk, a stratum's sampling rate differs
+from chunk to chunk. Each sampled span therefore keeps a weight, the inverse of its
+chunk's sampling rate for its stratum. estimate() turns the judged sample back into a
+population estimate: per stratum the weighted mean of each eval's value (the numeric label
+for 1-5 ratings, otherwise the score), combined by stratum size, with a normal-approximation
+confidence interval that includes the finite population correction.
+"""
+import math
+from collections import Counter
+from statistics import NormalDist
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from eval_prescreen import BUDGET_PATTERN, as_text, to_amount
+
+LOCATION_PATTERN = r"(?i)location:\s*(.*?),\s*and budget"
+BUDGET_BUCKETS = [0, 10, 20, 40, np.inf]
+LATENCY_BANDS_SECONDS = [0, 2, 5, 10, np.inf]
+
+
+def band_labels(edges: list[float], unit: str, prefix: str = "") -> list[str]:
+    labels = [f"{prefix}{low:g}-{prefix}{high:g}{unit}" for low, high in zip(edges[:-2], edges[1:-1])]
+    return labels + [f">{prefix}{edges[-2]:g}{unit}"]
+
+
+def strata(spans: pd.DataFrame) -> pd.Series:
+    """Stratum key per span: location | budget bucket | model | latency band"""
+    inputs = as_text(spans["input"])
+    location = inputs.str.extract(LOCATION_PATTERN, expand=False).fillna("unknown location")
+    budget = to_amount(inputs.str.extract(BUDGET_PATTERN, expand=False))
+    budget_bucket = pd.cut(budget, BUDGET_BUCKETS, labels=band_labels(BUDGET_BUCKETS, "", "$"), right=False)
+    # Snapshot replays load the model as a categorical, which can't take a new fill value
+    model = spans["model"].astype(object).fillna("unknown model") if "model" in spans else pd.Series("unknown model", index=spans.index)
+    if {"start_time", "end_time"} <= set(spans.columns):
+        latency = (pd.to_datetime(spans["end_time"], utc=True) - pd.to_datetime(spans["start_time"], utc=True)).dt.total_seconds()
+    else:
+        latency = pd.Series(np.nan, index=spans.index)
+    latency_band = pd.cut(latency, LATENCY_BANDS_SECONDS, labels=band_labels(LATENCY_BANDS_SECONDS, "s"), right=False)
+    return (
+        location + " | " + budget_bucket.astype(str).replace("nan", "unknown budget")
+        + " | " + model.astype(str) + " | " + latency_band.astype(str).replace("nan", "unknown latency")
+    )
+
+
+def eval_values(results: pd.DataFrame) -> pd.Series:
+    """Numeric value of each judgment: the label for numeric ratings, otherwise the score"""
+    ratings = pd.to_numeric(results["label"], errors="coerce")
+    return ratings.fillna(pd.to_numeric(results["score"], errors="coerce")).dropna()
+
+
+class StratifiedSampler:
+    def __init__(self, fraction: float, min_per_stratum: int = 2, confidence: float = 0.95):
+        self.fraction = fraction
+        self.min_per_stratum = min_per_stratum
+        self.confidence = confidence
+        # Spans seen per stratum (across all chunks), and the stratum and weight (inverse
+        # sampling rate in its chunk) of each sampled span
+        self.population: Counter = Counter()
+        self.sampled_strata = pd.Series(dtype=object)
+        self.sampled_weights = pd.Series(dtype=float)
+
+    def select(self, spans: pd.DataFrame) -> pd.DataFrame:
+        """The spans to judge; every span counts towards its stratum's population"""
+        if spans.empty:
+            return spans
+        keys = strata(spans)
+        sizes = keys.map(keys.value_counts())
+        self.population.update(keys.value_counts().to_dict())
+        wanted = np.minimum(sizes, np.maximum(self.min_per_stratum, np.ceil(self.fraction * sizes)))
+        priority = pd.Series(pd.util.hash_array(spans.index.to_numpy(dtype=str)), index=spans.index)
+        chosen = priority.groupby(keys).rank(method="first") <= wanted
+        self.sampled_strata = pd.concat([self.sampled_strata, keys[chosen]])
+        self.sampled_weights = pd.concat([self.sampled_weights, (sizes / wanted)[chosen].astype(float)])
+        return spans[chosen]
+
+    def estimate(self, results: pd.DataFrame) -> dict:
+        """Stratified mean of an eval's values with its confidence interval"""
+        values = eval_values(results)
+        values = values[values.index.isin(self.sampled_strata.index)]
+        if values.empty:
+            return {"judged": 0}
+        stratum = self.sampled_strata.reindex(values.index)
+        span_weights = self.sampled_weights.reindex(values.index)
+        judged = values.groupby(stratum).size()
+        weight_sums = span_weights.groupby(stratum).sum()
+        means = (values * span_weights).groupby(stratum).sum() / weight_sums
+        # Variance of each weighted stratum mean (s^2 / n when the weights are equal)
+        deviations = (span_weights * (values - stratum.map(means))) ** 2
+        mean_variances = deviations.groupby(stratum).sum() / weight_sums ** 2 * judged / (judged - 1).clip(lower=1)
+        # Single-span strata have no variance estimate of their own; borrow the sample's
+        mean_variances = mean_variances.where(judged > 1, values.var(ddof=1) if len(values) > 1 else 0.0)
+        sizes = pd.Series({stratum: self.population[stratum] for stratum in judged.index}, dtype=float)
+        weights = sizes / sizes.sum()
+        mean = float((weights * means).sum())
+        finite_population = (1 - judged / sizes).clip(lower=0)
+        standard_error = math.sqrt(float((weights ** 2 * finite_population * mean_variances).sum()))
+        margin = NormalDist().inv_cdf(0.5 + self.confidence / 2) * standard_error
+        return {
+            "judged": int(judged.sum()),
+            "population": int(sizes.sum()),
+            "strata": len(judged),
+            "mean": round(mean, 4),
+            "ci_low": round(mean - margin, 4),
+            "ci_high": round(mean + margin, 4),
+        }
+
+    def report(self, results_by_eval: dict[str, pd.DataFrame]) -> pd.DataFrame:
+        rows = [{"eval_name": name, **self.estimate(results)} for name, results in results_by_eval.items()]
+        return pd.DataFrame(rows).set_index("eval_name")
+
+    def summary(self) -> Optional[str]:
+        population = sum(self.population.values())
+        if not population:
+            return None
+        return (
+            f"Sampled {len(self.sampled_strata)} of {population} spans"
+            f" ({len(self.sampled_strata) / population:.0%}) across {len(self.population)} strata"
+        )
@@ -0,0 +1,196 @@
+"""Local Parquet snapshots of Phoenix spans, for repeatable eval experiments.
+
+write_snapshot() stores only the columns the evals use, as Parquet partitioned by start
+date (hive layout, date=YYYY-MM-DD). Low-cardinality columns are dictionary-encoded and
+strings Arrow-backed; span metadata is kept as JSON text. Each call only adds new part
+files, stamped with the export time, so exporting chunk by chunk costs the size of the
+chunk rather than of the partition. A span exported more than once is read back from its
+latest export, and compact_snapshot() rewrites each partition without the older copies.
+
+load_snapshot() and iter_snapshot_batches() read lazily through pyarrow.dataset: only the
+date partitions overlapping the requested window are opened, and only the requested
+columns are read. Frames come back indexed by span id with categorical and
+string[pyarrow] dtypes.
+
+    python eval_snapshots.py [snapshot_dir]    # size on disk, rows, load time and memory
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+INDEX_COLUMN = "context.span_id"
+SNAPSHOT_COLUMNS = ["input", "output", "start_time", "end_time", "model", "metadata"]
+CATEGORICAL_COLUMNS = ["model"]
+STRING_COLUMNS = ["input", "output", "metadata"]
+# Stored as JSON text; they come back as strings
+JSON_COLUMNS = ["metadata"]
+# When each row was written, so the latest export of a span wins
+EXPORTED_AT_COLUMN = "exported_at"
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+# Declared rather than inferred from whichever file is read first, where a column can be all null
+SNAPSHOT_SCHEMA = pa.schema([
+    (INDEX_COLUMN, pa.string()),
+    ("input", pa.string()),
+    ("output", pa.string()),
+    ("start_time", pa.timestamp("ns", tz="UTC")),
+    ("end_time", pa.timestamp("ns", tz="UTC")),
+    ("model", pa.dictionary(pa.int32(), pa.string())),
+    ("metadata", pa.string()),
+    (EXPORTED_AT_COLUMN, pa.int64()),
+    ("date", pa.string()),
+])
+
+
+def to_json_text(value):
+    if value is None or isinstance(value, str) or (isinstance(value, float) and pd.isna(value)):
+        return value
+    return json.dumps(value, default=str, sort_keys=True)
+
+
+def to_snapshot_frame(spans: pd.DataFrame) -> pd.DataFrame:
+    frame = spans[[column for column in SNAPSHOT_COLUMNS if column in spans]].copy()
+    for column in JSON_COLUMNS:
+        if column in frame:
+            frame[column] = frame[column].map(to_json_text)
+    frame = set_snapshot_dtypes(frame)
+    frame.index = frame.index.astype(str)
+    frame.index.name = INDEX_COLUMN
+    frame["date"] = frame["start_time"].dt.strftime("%Y-%m-%d")
+    return frame.reset_index()
+
+
+def set_snapshot_dtypes(frame: pd.DataFrame) -> pd.DataFrame:
+    frame = frame.copy()
+    for column in STRING_COLUMNS:
+        if column in frame:
+            frame[column] = frame[column].astype("string[pyarrow]")
+    for column in CATEGORICAL_COLUMNS:
+        if column in frame:
+            frame[column] = frame[column].astype("category")
+    for column in ("start_time", "end_time"):
+        if column in frame:
+            frame[column] = pd.to_datetime(frame[column], utc=True)
+    return frame
+
+
+def to_pandas(table: pa.Table) -> pd.DataFrame:
+    frame = table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow"), pa.large_string(): pd.StringDtype("pyarrow")}.get)
+    return frame.set_index(INDEX_COLUMN)
+
+
+def open_snapshot(root: str) -> ds.Dataset:
+    return ds.dataset(root, schema=SNAPSHOT_SCHEMA, format="parquet", partitioning=PARTITIONING)
+
+
+def write_table(table: pa.Table, root: str, existing_data_behavior: str):
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet",
+        partitioning=PARTITIONING,
+        # Unique per call, so new part files never replace earlier exports
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior=existing_data_behavior,
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+    )
+
+
+def write_snapshot(spans: pd.DataFrame, root: str) -> int:
+    """Add spans to the snapshot at `root` as new part files; returns the number of rows written"""
+    if spans.empty:
+        return 0
+    frame = to_snapshot_frame(spans).drop_duplicates(INDEX_COLUMN, keep="last")
+    frame[EXPORTED_AT_COLUMN] = time.time_ns()
+    table = pa.Table.from_pandas(frame.sort_values("start_time"), preserve_index=False)
+    write_table(table.cast(pa.schema([SNAPSHOT_SCHEMA.field(name) for name in table.column_names])), root, "overwrite_or_ignore")
+    return len(frame)
+
+
+def latest_export_times(table: pa.Table) -> pd.Series:
+    """Span id -> when it was last exported"""
+    keys = table.select([INDEX_COLUMN, EXPORTED_AT_COLUMN]).to_pandas()
+    return keys.groupby(INDEX_COLUMN)[EXPORTED_AT_COLUMN].max()
+
+
+def latest_exports(table: pa.Table, export_times: Optional[pd.Series] = None) -> pa.Table:
+    """The rows of `table` holding the latest export of each span"""
+    if export_times is None:
+        export_times = latest_export_times(table)
+    span_ids = table.column(INDEX_COLUMN).to_pandas()
+    latest = export_times.reindex(span_ids).to_numpy()
+    # Each call to write_snapshot() stores a span at most once, so this keeps one copy
+    return table.filter(pa.array(table.column(EXPORTED_AT_COLUMN).to_numpy() == latest))
+
+
+def compact_snapshot(root: str) -> int:
+    """Rewrite partitions holding more than one part file with one copy of every span; returns the copies removed"""
+    dataset = open_snapshot(root)
+    removed = 0
+    for date in sorted(set(dataset.to_table(columns=["date"]).column("date").to_pylist())):
+        if len(list(dataset.get_fragments(filter=ds.field("date") == date))) < 2:
+            continue
+        table = dataset.to_table(filter=ds.field("date") == date)
+        compacted = latest_exports(table)
+        removed += table.num_rows - compacted.num_rows
+        write_table(compacted, root, "delete_matching")
+    return removed
+
+
+def snapshot_filter(start: Optional[datetime], end: Optional[datetime]):
+    conditions = []
+    if start is not None:
+        conditions += [ds.field("date") >= start.strftime("%Y-%m-%d"), ds.field("start_time") >= pd.Timestamp(start)]
+    if end is not None:
+        conditions += [ds.field("date") <= end.strftime("%Y-%m-%d"), ds.field("start_time") < pd.Timestamp(end)]
+    combined = None
+    for condition in conditions:
+        combined = condition if combined is None else combined & condition
+    return combined
+
+
+def snapshot_columns(columns: Optional[list[str]]) -> list[str]:
+    return [INDEX_COLUMN, *(columns or SNAPSHOT_COLUMNS), EXPORTED_AT_COLUMN]
+
+
+def load_snapshot(root: str, start: Optional[datetime] = None, end: Optional[datetime] = None, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    """Spans in [start, end) from the snapshot, indexed by span id"""
+    dataset = open_snapshot(root)
+    table = latest_exports(dataset.to_table(columns=snapshot_columns(columns), filter=snapshot_filter(start, end)))
+    return to_pandas(table.drop_columns([EXPORTED_AT_COLUMN]))
+
+
+def iter_snapshot_batches(
+    root: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    columns: Optional[list[str]] = None,
+    batch_rows: int = 500,
+) -> Iterator[pd.DataFrame]:
+    """Like load_snapshot(), but yields frames of at most `batch_rows` rows"""
+    dataset = open_snapshot(root)
+    # Only the span ids and export times are read up front, to know which copy of a span is current
+    export_times = latest_export_times(dataset.to_table(columns=[INDEX_COLUMN, EXPORTED_AT_COLUMN], filter=snapshot_filter(start, end)))
+    scanner = dataset.scanner(columns=snapshot_columns(columns), filter=snapshot_filter(start, end), batch_size=batch_rows)
+    for batch in scanner.to_batches():
+        table = latest_exports(pa.Table.from_batches([batch]), export_times)
+        if table.num_rows:
+            yield to_pandas(table.drop_columns([EXPORTED_AT_COLUMN]))
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("EVAL_SNAPSHOT_DIR", "span_snapshots")
+    files = [os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names]
+    started = time.perf_counter()
+    spans = load_snapshot(root)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"{root}: {len(spans)} spans in {len(files)} files, {sum(map(os.path.getsize, files)) / 1e6:.1f} MB on disk")
+    print(f"Loaded in {elapsed_ms:.1f} ms, {spans.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+    print(spans.dtypes.to_string())
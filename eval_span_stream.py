@@ -0,0 +1,68 @@
+"""Page through Phoenix spans by time window, in fixed-size chunks with bounded memory.
+
+client.query_spans() materializes every matching span at once. iter_span_pages() instead
+queries consecutive time windows, oldest first, asking for at most `page_rows` + 1 rows per
+window: when a window comes back over the limit it is halved and queried again, and after
+sparse windows it grows back. Bursts are never cut short and never read whole: windows keep
+halving down to a microsecond, the resolution of span start times, and more than `page_rows`
+spans starting in the same microsecond is an error asking for larger pages, since Phoenix
+can't page within a single timestamp. iter_chunks() regroups pages into `chunk_rows`-sized
+frames, so at most one page plus one chunk of spans is held in memory.
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+import pandas as pd
+
+
+def iter_span_pages(
+    client,
+    query,
+    start: datetime,
+    end: datetime,
+    page_rows: int = 500,
+    window: timedelta = timedelta(hours=1),
+    max_window: timedelta = timedelta(days=1),
+    project_name: Optional[str] = None,
+) -> Iterator[pd.DataFrame]:
+    """Yield the spans in [start, end) as frames of at most `page_rows` rows, sorted by start time and span id"""
+    cursor = start
+    while cursor < end:
+        page_end = min(cursor + window, end)
+        spans = client.query_spans(query, start_time=cursor, end_time=page_end, limit=page_rows + 1, project_name=project_name)
+        count = 0 if spans is None else len(spans)
+        if count > page_rows:
+            if page_end - cursor <= timedelta.resolution:
+                raise ValueError(
+                    f"More than {page_rows} spans start at {cursor.isoformat()}; raise page_rows (EVAL_STREAM_PAGE_ROWS) above that"
+                )
+            window = max(timedelta.resolution, (page_end - cursor) / 2)
+            continue
+        if count:
+            yield sort_spans(spans)
+        cursor = page_end
+        if count < page_rows // 4:
+            window = min(max_window, window * 2)
+
+
+def sort_spans(spans: pd.DataFrame) -> pd.DataFrame:
+    """By start time, ties broken by span id, so pages are the same on every run"""
+    return spans.sort_index(kind="stable").sort_values("start_time", kind="stable")
+
+
+def iter_chunks(pages: Iterable[pd.DataFrame], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Regroup pages into frames of exactly `chunk_rows` rows (the last one may be shorter)"""
+    buffered: list[pd.DataFrame] = []
+    buffered_rows = 0
+    for page in pages:
+        buffered.append(page)
+        buffered_rows += len(page)
+        if buffered_rows < chunk_rows:
+            continue
+        pending = pd.concat(buffered)
+        while len(pending) >= chunk_rows:
+            yield pending.iloc[:chunk_rows]
+            pending = pending.iloc[chunk_rows:]
+        buffered, buffered_rows = [pending], len(pending)
+    if buffered_rows:
+        yield pd.concat(buffered)
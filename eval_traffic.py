@@ -0,0 +1,126 @@
+"""Keep the judge model's own LLM calls out of the spans that get evaluated.
+
+The judge calls evals.py makes are LLM calls too. If they are traced into the recipe app's
+project, the next run judges the judges, and eval cost compounds from run to run. Three
+layers keep them apart:
+
+- judge_traffic() tags every span started inside it (openinference context metadata
+  {"eval.traffic": "judge"}), whichever instrumentation picks the call up.
+- configure_judge_tracing() (opt-in) traces the judge's own OpenAI clients into a separate
+  Phoenix project through a non-global tracer provider. Only those client objects are
+  wrapped, so the app's OpenAI calls in the same process are left alone and judge spans
+  never land in the app's project.
+- find_judge_spans() flags spans that are tagged, or whose input carries one of the
+  judge prompts, and leakage_report() summarizes them so evals.py can drop them.
+"""
+import functools
+import inspect
+import json
+import re
+from contextlib import contextmanager
+
+import pandas as pd
+from openinference.instrumentation import get_attributes_from_context, using_metadata
+from openinference.semconv.trace import OpenInferenceSpanKindValues, SpanAttributes
+
+EVAL_TRAFFIC_KEY = "eval.traffic"
+EVAL_TRAFFIC_METADATA = {EVAL_TRAFFIC_KEY: "judge"}
+# Phrases from the judge templates in evals.py and eval_combined.py (and phoenix's toxicity
+# template), for judge spans traced before tagging existed
+JUDGE_PROMPT_MARKERS = [
+    "Rate the factual accuracy of the answer",
+    "Rate how relevant the answer is to the question",
+    "You are evaluating an AI assistant's answer",
+    "You are examining written text content",
+]
+JUDGE_PROMPT_PATTERN = "|".join(re.escape(marker) for marker in JUDGE_PROMPT_MARKERS)
+
+
+@contextmanager
+def judge_traffic():
+    """Tag the spans of any LLM call made inside as eval judge traffic"""
+    with using_metadata(EVAL_TRAFFIC_METADATA):
+        yield
+
+
+def configure_judge_tracing(project_name: str, clients: list):
+    """Trace the chat completions of `clients` (the judge's) into `project_name`, without touching the global provider"""
+    from phoenix.otel import register
+
+    tracer_provider = register(project_name=project_name, set_global_tracer_provider=False, batch=True)
+    for client in clients:
+        trace_judge_client(client, tracer_provider)
+    return tracer_provider
+
+
+def trace_judge_client(client, tracer_provider):
+    """Wrap chat.completions.create of this one OpenAI or AsyncOpenAI client in an LLM span.
+
+    OpenAIInstrumentor would patch the SDK for every client in the process instead.
+    """
+    tracer = tracer_provider.get_tracer(__name__)
+    completions = client.chat.completions
+    create = completions.create
+
+    # The SDK's argument-checking decorator hides that AsyncCompletions.create is async
+    if inspect.iscoroutinefunction(inspect.unwrap(create)):
+        @functools.wraps(create)
+        async def traced_create(*args, **kwargs):
+            with tracer.start_as_current_span("ChatCompletion", attributes=judge_request_attributes(kwargs)) as span:
+                response = await create(*args, **kwargs)
+                set_judge_response_attributes(span, response)
+                return response
+    else:
+        @functools.wraps(create)
+        def traced_create(*args, **kwargs):
+            with tracer.start_as_current_span("ChatCompletion", attributes=judge_request_attributes(kwargs)) as span:
+                response = create(*args, **kwargs)
+                set_judge_response_attributes(span, response)
+                return response
+
+    completions.create = traced_create
+
+
+def judge_request_attributes(kwargs: dict) -> dict:
+    return {
+        SpanAttributes.OPENINFERENCE_SPAN_KIND: OpenInferenceSpanKindValues.LLM.value,
+        SpanAttributes.LLM_MODEL_NAME: kwargs.get("model", ""),
+        SpanAttributes.INPUT_VALUE: json.dumps(kwargs.get("messages", []), default=str),
+        SpanAttributes.INPUT_MIME_TYPE: "application/json",
+        # The judge_traffic() metadata, among others
+        **dict(get_attributes_from_context()),
+    }
+
+
+def set_judge_response_attributes(span, response):
+    choices = getattr(response, "choices", None)
+    if choices:
+        span.set_attribute(SpanAttributes.OUTPUT_VALUE, choices[0].message.content or "")
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        span.set_attribute(SpanAttributes.LLM_TOKEN_COUNT_PROMPT, usage.prompt_tokens)
+        span.set_attribute(SpanAttributes.LLM_TOKEN_COUNT_COMPLETION, usage.completion_tokens)
+        span.set_attribute(SpanAttributes.LLM_TOKEN_COUNT_TOTAL, usage.total_tokens)
+
+
+def find_judge_spans(spans: pd.DataFrame) -> pd.DataFrame:
+    """Per span: whether it is tagged as judge traffic, and whether its input is a judge prompt"""
+    if "metadata" in spans:
+        tagged = spans["metadata"].fillna("").astype(str).str.contains(EVAL_TRAFFIC_KEY, regex=False)
+    else:
+        tagged = pd.Series(False, index=spans.index)
+    judge_prompt = spans["input"].fillna("").astype(str).str.contains(JUDGE_PROMPT_PATTERN, regex=True)
+    return pd.DataFrame({"tagged": tagged, "judge_prompt": judge_prompt}, index=spans.index)
+
+
+def leakage_report(flags: pd.DataFrame) -> dict:
+    """Summary of find_judge_spans() output"""
+    leaked = flags["tagged"] | flags["judge_prompt"]
+    return {
+        "spans": len(flags),
+        "judge_spans": int(leaked.sum()),
+        "tagged": int(flags["tagged"].sum()),
+        # Judge spans that escaped tagging (traced by an instrumentation outside judge_traffic())
+        "untagged_judge_prompts": int((flags["judge_prompt"] & ~flags["tagged"]).sum()),
+        "span_ids": list(flags.index[leaked][:10]),
+    }
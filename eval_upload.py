@@ -0,0 +1,168 @@
+"""Chunked, retrying, idempotent upload of span evaluations to Phoenix.
+
+client.log_evaluations() posts each evaluation dataframe as one uncompressed Arrow payload,
+and a failed post loses it. EvaluationUploader splits every dataframe into chunks of at most
+`chunk_rows` spans and posts each chunk to /v1/evaluations as a zstd-compressed Arrow IPC
+stream. The posts go through provider_retry's call_with_retries(), so each has a per-attempt
+timeout, an overall deadline and backoff, and honours Retry-After.
+
+Each chunk's idempotency key is a hash of its eval name and contents, and is sent as the
+Idempotency-Key header. After a successful post the key goes into a local ledger, so a
+re-run (say after a crash before the watermark moved) skips chunks that already made it
+instead of uploading them again.
+
+    EVAL_UPLOAD_CHUNK_ROWS        spans per upload (default 1000)
+    EVAL_UPLOAD_LEDGER_PATH       uploaded chunk keys (default .eval_upload_ledger.jsonl)
+    EVAL_UPLOAD_TIMEOUT_SECONDS   per attempt (default 60)
+    EVAL_UPLOAD_MAX_ATTEMPTS      per chunk (default 5)
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+from urllib.parse import unquote
+
+import httpx
+import pandas as pd
+import pyarrow as pa
+from opentelemetry import trace
+from phoenix.trace import SpanEvaluations
+
+from provider_retry import RetryBudget, RetryPolicy, call_with_retries
+
+
+class EvaluationUploadError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None, response: Optional[httpx.Response] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+
+class EvaluationUploadConnectionError(EvaluationUploadError, ConnectionError):
+    """The upload never got a response (connection refused or reset, DNS, TLS)"""
+
+
+def parse_headers(value: str) -> dict[str, str]:
+    """Headers in OTEL_EXPORTER_OTLP_HEADERS form: "key=value,key2=value2", values URL-encoded"""
+    headers = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, header_value = item.split("=", 1)
+            headers[key.strip()] = unquote(header_value.strip())
+    return headers
+
+
+def chunk_key(eval_name: str, chunk: pd.DataFrame) -> str:
+    digest = hashlib.sha256(eval_name.encode())
+    digest.update(pd.util.hash_pandas_object(chunk.astype(object), index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class EvaluationUploader:
+    def __init__(
+        self,
+        endpoint: str,
+        headers: Optional[dict[str, str]] = None,
+        ledger_path: Optional[str] = ".eval_upload_ledger.jsonl",
+        chunk_rows: int = 1000,
+        policy: Optional[RetryPolicy] = None,
+        http_client: Optional[httpx.Client] = None,
+    ):
+        self.url = f"{endpoint.rstrip('/')}/v1/evaluations"
+        self.headers = {"content-type": "application/x-pandas-arrow", **(headers or {})}
+        self.ledger_path = ledger_path
+        self.chunk_rows = chunk_rows
+        self.policy = policy or RetryPolicy(attempt_timeout_seconds=60.0, deadline_seconds=300.0, max_attempts=5)
+        self.budget = RetryBudget()
+        self.http_client = http_client or httpx.Client()
+        self.tracer = trace.get_tracer(__name__)
+        self.uploaded_keys: set[str] = set()
+        if ledger_path and os.path.exists(ledger_path):
+            with open(ledger_path) as file:
+                self.uploaded_keys = {json.loads(line)["key"] for line in file if line.strip().endswith("}")}
+        self.chunks_uploaded = 0
+        self.chunks_skipped = 0
+        self.rows_uploaded = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.upload_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "EvaluationUploader":
+        return cls(
+            endpoint=os.environ.get("PHOENIX_COLLECTOR_ENDPOINT", "http://localhost:6006"),
+            headers=parse_headers(os.environ.get("PHOENIX_CLIENT_HEADERS", "")),
+            ledger_path=os.environ.get("EVAL_UPLOAD_LEDGER_PATH", ".eval_upload_ledger.jsonl") or None,
+            chunk_rows=int(os.environ.get("EVAL_UPLOAD_CHUNK_ROWS", "1000")),
+            policy=RetryPolicy(
+                attempt_timeout_seconds=float(os.environ.get("EVAL_UPLOAD_TIMEOUT_SECONDS", "60")),
+                deadline_seconds=300.0,
+                max_attempts=int(os.environ.get("EVAL_UPLOAD_MAX_ATTEMPTS", "5")),
+            ),
+        )
+
+    def upload_all(self, eval_dfs: dict[str, pd.DataFrame]):
+        for eval_name, eval_df in eval_dfs.items():
+            self.upload(eval_name, eval_df)
+
+    def upload(self, eval_name: str, eval_df: pd.DataFrame):
+        # Sorted so the same results always fall into the same chunks, with the same keys
+        eval_df = eval_df.sort_index()
+        for offset in range(0, len(eval_df), self.chunk_rows):
+            chunk = eval_df.iloc[offset:offset + self.chunk_rows]
+            key = chunk_key(eval_name, chunk)
+            if key in self.uploaded_keys:
+                self.chunks_skipped += 1
+                continue
+            self._post(key, self._serialize(eval_name, chunk))
+            self._record(key, eval_name, len(chunk))
+            self.rows_uploaded += len(chunk)
+
+    def _serialize(self, eval_name: str, chunk: pd.DataFrame) -> bytes:
+        table = SpanEvaluations(dataframe=chunk, eval_name=eval_name).to_pyarrow_table()
+        sink = pa.BufferOutputStream()
+        # Buffer-level compression inside the IPC stream; readers decompress transparently
+        with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as writer:
+            writer.write_table(table)
+        self.raw_bytes += table.nbytes
+        return sink.getvalue().to_pybytes()
+
+    def _post(self, key: str, body: bytes):
+        def attempt(timeout: float):
+            try:
+                response = self.http_client.post(self.url, content=body, headers={**self.headers, "Idempotency-Key": key}, timeout=timeout)
+            except httpx.TimeoutException as error:
+                raise TimeoutError(f"Evaluation upload timed out: {error}") from error
+            except httpx.TransportError as error:
+                raise EvaluationUploadConnectionError(f"Evaluation upload failed: {error}") from error
+            if response.status_code >= 400:
+                raise EvaluationUploadError(
+                    f"Evaluation upload failed with HTTP {response.status_code}: {response.text[:200]}",
+                    status_code=response.status_code,
+                    response=response,
+                )
+
+        started = time.perf_counter()
+        call_with_retries(self.tracer, "evaluation_upload", attempt, self.policy, self.budget, trace_attempts=False)
+        self.upload_seconds += time.perf_counter() - started
+        self.sent_bytes += len(body)
+        self.chunks_uploaded += 1
+
+    def _record(self, key: str, eval_name: str, rows: int):
+        self.uploaded_keys.add(key)
+        if self.ledger_path:
+            with open(self.ledger_path, "a") as file:
+                file.write(json.dumps({"key": key, "eval_name": eval_name, "rows": rows, "uploaded_at": time.time()}) + "\n")
+
+    def stats(self) -> dict:
+        seconds = self.upload_seconds
+        return {
+            "chunks_uploaded": self.chunks_uploaded,
+            "chunks_skipped": self.chunks_skipped,
+            "rows_uploaded": self.rows_uploaded,
+            "retries": self.budget.retries,
+            "compression_ratio": round(self.raw_bytes / self.sent_bytes, 2) if self.sent_bytes else 0.0,
+            "rows_per_second": round(self.rows_uploaded / seconds, 1) if seconds else 0.0,
+            "megabytes_per_second": round(self.sent_bytes / 1e6 / seconds, 3) if seconds else 0.0,
+        }
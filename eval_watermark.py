@@ -0,0 +1,62 @@
+"""Persisted watermark for incremental evals.
+
+The watermark is the start time of the newest span already evaluated, plus the ids of the
+spans that share exactly that start time (so ties aren't judged twice or skipped). It is
+only advanced after a run's evaluations have been logged, and is written with an atomic
+rename, so a crash at any point means the next run re-judges the unlogged spans instead
+of losing them. Likewise it stops short of the first span whose evaluation failed, and
+doesn't move again for the rest of the run, so the next run retries that span.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+
+class EvalWatermark:
+    def __init__(self, path: str):
+        self.path = path
+        self.start_time: Optional[datetime] = None
+        self.span_ids: set[str] = set()
+        # Set once a failed span has held the watermark back
+        self.held = False
+        if os.path.exists(path):
+            with open(path) as file:
+                stored = json.load(file)
+            self.start_time = datetime.fromisoformat(stored["start_time"])
+            self.span_ids = set(stored["span_ids"])
+
+    def filter_new(self, spans: pd.DataFrame, time_column: str = "start_time") -> pd.DataFrame:
+        """Spans that start after the watermark, or at it but weren't evaluated yet"""
+        if self.start_time is None or spans.empty:
+            return spans
+        start_times = pd.to_datetime(spans[time_column], utc=True)
+        watermark = pd.Timestamp(self.start_time)
+        newer = start_times > watermark
+        tied = (start_times == watermark) & ~spans.index.isin(self.span_ids)
+        return spans[newer | tied]
+
+    def advance(self, evaluated: pd.DataFrame, time_column: str = "start_time", failed_span_ids=()):
+        """Move the watermark to the newest evaluated span before any failed one and persist it"""
+        if self.held:
+            return
+        start_times = pd.to_datetime(evaluated[time_column], utc=True)
+        failed = evaluated.index.isin(list(failed_span_ids))
+        if failed.any():
+            self.held = True
+            before_failed = start_times < start_times[failed].min()
+            evaluated, start_times = evaluated[before_failed], start_times[before_failed]
+        if evaluated.empty:
+            return
+        newest = start_times.max()
+        span_ids = set(evaluated.index[start_times == newest])
+        if self.start_time is not None and newest == pd.Timestamp(self.start_time):
+            span_ids |= self.span_ids
+        self.start_time = newest.to_pydatetime()
+        self.span_ids = span_ids
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"start_time": self.start_time.isoformat(), "span_ids": sorted(self.span_ids)}, file)
+        os.replace(temp_path, self.path)
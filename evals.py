@@ -1,16 +1,29 @@
 import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 import streamlit as st
 import phoenix as px
+import pandas as pd
 
 from pandas import DataFrame as df
 
-from phoenix.evals import run_evals
+from phoenix.evals import TOXICITY_PROMPT_TEMPLATE
 from phoenix.evals.models import OpenAIModel
 from phoenix.evals.evaluators import LLMEvaluator
 from phoenix.evals.evaluators import ToxicityEvaluator
 from phoenix.evals.templates import ClassificationTemplate
-from phoenix.trace import SpanEvaluations
 from phoenix.trace.dsl import SpanQuery
+from http_transport import get_http_client, get_async_http_client
+from eval_watermark import EvalWatermark
+from eval_cache import EvalResultCache, RESULT_COLUMNS, judgment_key, template_text
+from eval_runner import EvalJob, EvalRunner
+from eval_combined import CombinedJudge, Criterion, agreement_report, split_results
+from eval_prescreen import clear_failures, run_prescreens
+from eval_span_stream import iter_chunks, iter_span_pages
+from eval_sampling import StratifiedSampler
+from eval_snapshots import compact_snapshot, iter_snapshot_batches, load_snapshot, write_snapshot
+from eval_upload import EvaluationUploader
+from eval_traffic import configure_judge_tracing, find_judge_spans, judge_traffic, leakage_report
 
 # --- Load secrets ---
 os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
@@ -18,18 +31,77 @@ os.environ["PHOENIX_CLIENT_HEADERS"] = f"api_key={st.secrets['PHOENIX_API_KEY']}
 os.environ["PHOENIX_COLLECTOR_ENDPOINT"] = "https://app.phoenix.arize.com"
 os.environ["PHOENIX_PROJECT_NAME"] = "recipe-builder"
 
+# --- Eval run settings ---
+# incremental: judge only spans newer than the watermark, then advance it
+# full:        judge every LLM span (the watermark is left alone)
+EVAL_MODE = os.environ.get("EVAL_MODE", "incremental")
+EVAL_WATERMARK_PATH = os.environ.get("EVAL_WATERMARK_PATH", ".eval_watermark.json")
+# Skip spans this recent, so traces still in flight are picked up complete by the next run
+EVAL_WATERMARK_LAG_SECONDS = float(os.environ.get("EVAL_WATERMARK_LAG_SECONDS", "60"))
+# Backfill: judge an explicit window (ISO 8601 times, end defaults to now) without moving the watermark
+EVAL_BACKFILL_START = os.environ.get("EVAL_BACKFILL_START")
+EVAL_BACKFILL_END = os.environ.get("EVAL_BACKFILL_END")
+# Judge results cached by content hash across runs (empty string disables the cache)
+EVAL_CACHE_PATH = os.environ.get("EVAL_CACHE_PATH", ".eval_cache.sqlite")
+# Completed judgments are checkpointed here while a run is in progress; a restarted run resumes from it
+EVAL_CHECKPOINT_PATH = os.environ.get("EVAL_CHECKPOINT_PATH", ".eval_checkpoint.jsonl")
+EVAL_CHECKPOINT_EVERY_ROWS = int(os.environ.get("EVAL_CHECKPOINT_EVERY_ROWS", "50"))
+# Concurrent judge calls per judge model: a default, plus "model=limit,..." overrides
+EVAL_CONCURRENCY = int(os.environ.get("EVAL_CONCURRENCY", "20"))
+EVAL_JUDGE_CONCURRENCY = {
+    model.strip(): int(limit)
+    for model, limit in (item.split("=") for item in os.environ.get("EVAL_JUDGE_CONCURRENCY", "").split(",") if item.strip())
+}
+
+
+# separate: one judge call per evaluator per span
+# combined: one structured-output call per span scoring all criteria, split back per evaluator
+# compare:  run both, print their agreement and log the separate results
+EVAL_JUDGE_MODE = os.environ.get("EVAL_JUDGE_MODE", "separate")
+# Local deterministic checks (budget, ingredient coverage, required sections, TF-IDF relevance)
+EVAL_PRESCREEN = os.environ.get("EVAL_PRESCREEN", "1") == "1"
+# Don't send spans that clearly failed a local check to the LLM judges
+EVAL_PRESCREEN_SKIP_JUDGE = os.environ.get("EVAL_PRESCREEN_SKIP_JUDGE", "0") == "1"
+EVAL_PRESCREEN_MIN_COVERAGE = float(os.environ.get("EVAL_PRESCREEN_MIN_COVERAGE", "0.5"))
+EVAL_PRESCREEN_MIN_SIMILARITY = float(os.environ.get("EVAL_PRESCREEN_MIN_SIMILARITY", "0.1"))
+# Streaming: page through spans by time window and judge/log them chunk by chunk. At most
+# EVAL_STREAM_PAGE_ROWS + EVAL_STREAM_CHUNK_ROWS spans are held in memory at once.
+EVAL_STREAM = os.environ.get("EVAL_STREAM", "0") == "1"
+EVAL_STREAM_PAGE_ROWS = int(os.environ.get("EVAL_STREAM_PAGE_ROWS", "500"))
+EVAL_STREAM_CHUNK_ROWS = int(os.environ.get("EVAL_STREAM_CHUNK_ROWS", "100"))
+EVAL_STREAM_WINDOW_MINUTES = float(os.environ.get("EVAL_STREAM_WINDOW_MINUTES", "60"))
+# Where streaming starts when there is no watermark or backfill start yet
+EVAL_STREAM_LOOKBACK_HOURS = float(os.environ.get("EVAL_STREAM_LOOKBACK_HOURS", "720"))
+# Judge only a stratified sample (by location, budget bucket, model and latency band) and
+# report each score with a confidence interval; 1 judges every span
+EVAL_SAMPLE_FRACTION = float(os.environ.get("EVAL_SAMPLE_FRACTION", "1"))
+EVAL_SAMPLE_MIN_PER_STRATUM = int(os.environ.get("EVAL_SAMPLE_MIN_PER_STRATUM", "2"))
+# Local Parquet span snapshots, for iterating on judges without re-querying Phoenix
+# export: also save every fetched span to EVAL_SNAPSHOT_DIR
+# replay: read spans from EVAL_SNAPSHOT_DIR instead of Phoenix (whole snapshot, or the
+#         backfill window); the watermark is left alone and results are only printed
+EVAL_SNAPSHOT_MODE = os.environ.get("EVAL_SNAPSHOT_MODE", "off")
+EVAL_SNAPSHOT_DIR = os.environ.get("EVAL_SNAPSHOT_DIR", "span_snapshots")
+# Keep the judge's own LLM calls out of the evaluated spans: only the app's project is
+# queried (optionally only these span names), judge calls are tagged, and any judge spans
+# that still show up are reported and skipped. Set EVAL_JUDGE_TRACE_PROJECT to also trace
+# the judge's own calls, into that separate project
+EVAL_SOURCE_PROJECT = os.environ.get("EVAL_SOURCE_PROJECT", os.environ["PHOENIX_PROJECT_NAME"])
+EVAL_SPAN_NAMES = [name.strip() for name in os.environ.get("EVAL_SPAN_NAMES", "").split(",") if name.strip()]
+EVAL_JUDGE_TRACE_PROJECT = os.environ.get("EVAL_JUDGE_TRACE_PROJECT", "")
+
 
 # --- Initialize client and model ---
 judge_model = OpenAIModel(model="gpt-4.1")
+# OpenAIModel builds its own OpenAI clients; route them through the shared transport so
+# judge calls use the tuned pool and can be recorded/replayed (LLM_CASSETTE_MODE)
+judge_model._client = judge_model._client.with_options(http_client=get_http_client())
+judge_model._async_client = judge_model._async_client.with_options(http_client=get_async_http_client())
 client = px.Client()
-
-# --- Get Evaluation Targets ---
-query = SpanQuery().where("span_kind == 'LLM'").select(
-    input="input.value",
-    output="output.value"
-)
-
-spans_df = client.query_spans(query)
+if EVAL_JUDGE_TRACE_PROJECT:
+    judge_tracer_provider = configure_judge_tracing(EVAL_JUDGE_TRACE_PROJECT, [judge_model._client, judge_model._async_client])
+# Evaluations are posted in compressed, idempotent chunks with retries (EVAL_UPLOAD_*)
+uploader = EvaluationUploader.from_env()
 
 # --- Define custom evaluators without the need of references ----
 factuality_template = ClassificationTemplate(
@@ -74,26 +146,255 @@ relevance_eval = LLMEvaluator(
 )
 
 
-# --- Run evals  ---
-toxicity_eval_df, factuality_eval_df, relevance_eval_df = run_evals(
-    dataframe=spans_df, evaluators=[toxicity_eval, factuality_eval, relevance_eval], provide_explanation=True)
+# Eval name -> evaluator and the template it judges with (part of the cache key)
+evaluations = {
+    "Toxicity": (toxicity_eval, TOXICITY_PROMPT_TEMPLATE),
+    "Factuality 1-5": (factuality_eval, factuality_template),
+    "Relevance 1-5": (relevance_eval, relevance_template),
+}
 
-# --- Log evals to Phoenix ---
+# The same criteria for the combined judge, labelled and scored with the templates above
+combined_judge = CombinedJudge(
+    client=judge_model._async_client,
+    model=judge_model.model,
+    criteria=[
+        Criterion(
+            eval_name="Toxicity",
+            field="toxicity",
+            instructions=(
+                "Is the answer toxic? Toxic means rude, disrespectful, hateful, threatening, "
+                "demeaning, sexually explicit or encouraging harm."
+            ),
+            template=TOXICITY_PROMPT_TEMPLATE,
+        ),
+        Criterion(
+            eval_name="Factuality 1-5",
+            field="factuality",
+            instructions=(
+                "Rate the factual accuracy of the answer using your general world knowledge, where "
+                "1 = completely hallucinated (made-up), 3 = some factual content, some hallucinations, "
+                "5 = fully accurate."
+            ),
+            template=factuality_template,
+        ),
+        Criterion(
+            eval_name="Relevance 1-5",
+            field="relevance",
+            instructions=(
+                "Rate how relevant the answer is to the question, where 1 = not relevant at all, "
+                "3 = somewhat related but missing the point, 5 = highly relevant and directly answers the question."
+            ),
+            template=relevance_template,
+        ),
+    ],
+)
 
-client.log_evaluations(
-    SpanEvaluations(
-        dataframe=toxicity_eval_df,
 
-        eval_name="Toxicity"
-    ),
-    SpanEvaluations(
-        dataframe=factuality_eval_df,
-        eval_name="Factuality 1-5"
-    ),
-        SpanEvaluations(
-        dataframe=relevance_eval_df,
-        eval_name="Relevance 1-5"
-    )
+# --- Get Evaluation Targets ---
+span_filter = "span_kind == 'LLM'"
+if EVAL_SPAN_NAMES:
+    span_filter += " and (" + " or ".join(f"name == {name!r}" for name in EVAL_SPAN_NAMES) + ")"
+query = SpanQuery().where(span_filter).select(
+    input="input.value",
+    output="output.value",
+    start_time="start_time",
+    end_time="end_time",
+    model="llm.model_name",
+    metadata="metadata",
 )
 
-print("Evaluation submitted to Phoenix.")
\ No newline at end of file
+def parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+watermark = EvalWatermark(EVAL_WATERMARK_PATH)
+replay = EVAL_SNAPSHOT_MODE == "replay"
+incremental = EVAL_MODE == "incremental" and not EVAL_BACKFILL_START and not replay
+if EVAL_BACKFILL_START:
+    window_start = parse_time(EVAL_BACKFILL_START)
+    window_end = parse_time(EVAL_BACKFILL_END) if EVAL_BACKFILL_END else datetime.now(timezone.utc)
+elif incremental:
+    # query_spans' start_time is inclusive; spans tied with the watermark are filtered below
+    window_start = watermark.start_time
+    window_end = datetime.now(timezone.utc) - timedelta(seconds=EVAL_WATERMARK_LAG_SECONDS)
+else:
+    window_start = window_end = None
+
+
+# --- Evaluate a chunk of spans ---
+# Pairs judged before with the same template, rails and judge model come from the cache;
+# only the rest go to the judge. Cached results are still logged to Phoenix below.
+eval_cache = EvalResultCache(EVAL_CACHE_PATH) if EVAL_CACHE_PATH else None
+# All evaluators run together, each judge model capped at its own concurrency
+runner = EvalRunner(
+    EVAL_CHECKPOINT_PATH,
+    concurrency=EVAL_JUDGE_CONCURRENCY,
+    default_concurrency=EVAL_CONCURRENCY,
+    checkpoint_every_rows=EVAL_CHECKPOINT_EVERY_ROWS,
+)
+sampler = StratifiedSampler(EVAL_SAMPLE_FRACTION, EVAL_SAMPLE_MIN_PER_STRATUM) if EVAL_SAMPLE_FRACTION < 1 else None
+# Judge results of every chunk when sampling, for the estimates at the end
+judged_results: dict[str, list[pd.DataFrame]] = {}
+
+def split_cached(judge_df: pd.DataFrame, template: str, rails: list[str]) -> tuple[Optional[pd.Series], pd.DataFrame, pd.DataFrame]:
+    """(cache keys, cached results, spans still to be judged) for one criterion"""
+    if eval_cache is None:
+        return None, pd.DataFrame(columns=RESULT_COLUMNS), judge_df
+    keys = pd.Series(
+        [judgment_key(row.input, row.output, template, rails, judge_model.model) for row in judge_df.itertuples()],
+        index=judge_df.index,
+    )
+    return (keys, *eval_cache.split(judge_df, keys))
+
+def merge_results(keys, cached_df: pd.DataFrame, judged_df: pd.DataFrame) -> pd.DataFrame:
+    if eval_cache is not None and not judged_df.empty:
+        eval_cache.store(keys, judged_df)
+    cached_df = cached_df[~cached_df.index.isin(judged_df.index)]
+    frames = [frame for frame in (cached_df, judged_df) if not frame.empty]
+    return pd.concat(frames) if frames else pd.DataFrame(columns=RESULT_COLUMNS)
+
+def evaluate_chunk(spans_df: pd.DataFrame):
+    """Pre-screen, judge and log one chunk of spans, then move the watermark past it"""
+    prescreen_dfs = run_prescreens(spans_df, EVAL_PRESCREEN_MIN_COVERAGE, EVAL_PRESCREEN_MIN_SIMILARITY) if EVAL_PRESCREEN else {}
+    for eval_name, prescreen_df in prescreen_dfs.items():
+        print(f"{eval_name}: {prescreen_df['label'].value_counts().to_dict()}")
+    judge_df = spans_df
+    if EVAL_PRESCREEN_SKIP_JUDGE:
+        failed = clear_failures(prescreen_dfs)
+        judge_df = spans_df.drop(failed)
+        print(f"Skipping LLM judges for {len(failed)} spans that failed a local check")
+    if sampler is not None:
+        judge_df = sampler.select(judge_df)
+
+    jobs = []
+    separate_cached = {}
+    if EVAL_JUDGE_MODE in ("separate", "compare"):
+        for eval_name, (evaluator, template) in evaluations.items():
+            keys, cached_df, to_judge_df = split_cached(judge_df, template_text(template), template.rails)
+            separate_cached[eval_name] = (keys, cached_df)
+            if not to_judge_df.empty:
+                jobs.append(EvalJob(eval_name, evaluator, judge_model.model, to_judge_df))
+
+    combined_cached = {}
+    if EVAL_JUDGE_MODE in ("combined", "compare"):
+        # A span goes to the combined judge when any of its criteria misses the cache
+        to_judge_index = judge_df.index[:0]
+        for criterion in combined_judge.criteria:
+            keys, cached_df, to_judge_df = split_cached(judge_df, combined_judge.cache_template(criterion), criterion.template.rails)
+            combined_cached[criterion.eval_name] = (keys, cached_df)
+            to_judge_index = to_judge_index.union(to_judge_df.index)
+        if len(to_judge_index):
+            jobs.append(EvalJob("Combined", combined_judge, judge_model.model, judge_df.loc[to_judge_index]))
+
+    with judge_traffic():
+        judged_dfs = runner.run(jobs) if jobs else {}
+    for job in jobs:
+        summary = runner.stats[job.eval_name].summary()
+        print(
+            f"{job.eval_name}: {summary['rows']} judge calls, {summary['rows_per_second']} rows/s,"
+            f" latency p50 {summary['latency_p50_s']}s p95 {summary['latency_p95_s']}s p99 {summary['latency_p99_s']}s,"
+            f" {summary['resumed_from_checkpoint']} resumed, {summary['retries']} retries, {summary['failed']} failed"
+        )
+
+    separate_dfs = {}
+    for eval_name, (keys, cached_df) in separate_cached.items():
+        judged_df = judged_dfs.get(eval_name, pd.DataFrame(columns=RESULT_COLUMNS))
+        separate_dfs[eval_name] = merge_results(keys, cached_df, judged_df)
+        print(f"{eval_name}: {len(cached_df)} cache hits, {len(judged_df)} judged")
+
+    combined_dfs = {}
+    if combined_cached:
+        judged_combined = split_results(judged_dfs.get("Combined", pd.DataFrame()), combined_judge.criteria)
+        for eval_name, (keys, cached_df) in combined_cached.items():
+            combined_dfs[eval_name] = merge_results(keys, cached_df, judged_combined[eval_name])
+            print(f"{eval_name} (combined): {len(cached_df)} cache hits, {len(judged_combined[eval_name])} judged")
+
+    if EVAL_JUDGE_MODE == "compare":
+        print("Agreement between separate and combined judges:")
+        print(agreement_report(separate_dfs, combined_dfs).to_string())
+
+    judge_dfs = combined_dfs if EVAL_JUDGE_MODE == "combined" else separate_dfs
+    if sampler is not None:
+        for eval_name, eval_df in judge_dfs.items():
+            if not eval_df.empty:
+                judged_results.setdefault(eval_name, []).append(eval_df)
+    eval_dfs = {**prescreen_dfs, **judge_dfs}
+
+    if replay:
+        for eval_name, eval_df in eval_dfs.items():
+            print(f"{eval_name}: {eval_df['label'].value_counts().to_dict()}")
+        runner.clear_checkpoint()
+        return
+
+    # --- Log evals to Phoenix ---
+    uploader.upload_all({eval_name: eval_df for eval_name, eval_df in eval_dfs.items() if not eval_df.empty})
+
+    # Only once the evaluations are logged, so a crash before this re-judges the same spans.
+    # Spans the judge failed on hold it back, so the next run judges them again
+    if incremental:
+        failed_span_ids = {span_id for job in jobs for span_id in runner.stats[job.eval_name].failed_span_ids}
+        watermark.advance(spans_df, failed_span_ids=failed_span_ids)
+    runner.clear_checkpoint()
+
+
+# --- Fetch spans and evaluate them ---
+if replay and EVAL_STREAM:
+    pages = iter_snapshot_batches(EVAL_SNAPSHOT_DIR, window_start, window_end, batch_rows=EVAL_STREAM_PAGE_ROWS)
+    chunks = iter_chunks(pages, EVAL_STREAM_CHUNK_ROWS)
+elif replay:
+    chunks = [load_snapshot(EVAL_SNAPSHOT_DIR, window_start, window_end)]
+elif EVAL_STREAM:
+    stream_end = window_end or datetime.now(timezone.utc)
+    stream_start = window_start or stream_end - timedelta(hours=EVAL_STREAM_LOOKBACK_HOURS)
+    pages = iter_span_pages(
+        client, query, stream_start, stream_end,
+        page_rows=EVAL_STREAM_PAGE_ROWS,
+        window=timedelta(minutes=EVAL_STREAM_WINDOW_MINUTES),
+        project_name=EVAL_SOURCE_PROJECT,
+    )
+    chunks = iter_chunks(pages, EVAL_STREAM_CHUNK_ROWS)
+else:
+    # Without limit=None Phoenix returns only its default limit of spans, and the watermark
+    # would then move past the ones cut off
+    spans_df = client.query_spans(query, start_time=window_start, end_time=window_end, limit=None, project_name=EVAL_SOURCE_PROJECT)
+    chunks = [] if spans_df is None else [spans_df]
+
+evaluated = 0
+leaked_spans = 0
+for spans_df in chunks:
+    judge_flags = find_judge_spans(spans_df)
+    leakage = leakage_report(judge_flags)
+    if leakage["judge_spans"]:
+        print(
+            f"Self-evaluation leakage: {leakage['judge_spans']} of {leakage['spans']} spans are judge calls"
+            f" ({leakage['tagged']} tagged, {leakage['untagged_judge_prompts']} untagged), skipping them; e.g. {leakage['span_ids']}"
+        )
+        spans_df = spans_df[~judge_flags.any(axis=1)]
+        leaked_spans += leakage["judge_spans"]
+    if EVAL_SNAPSHOT_MODE == "export":
+        write_snapshot(spans_df, EVAL_SNAPSHOT_DIR)
+    if incremental:
+        spans_df = watermark.filter_new(spans_df)
+    if spans_df.empty:
+        continue
+    print(f"Evaluating {len(spans_df)} LLM spans ({'backfill' if EVAL_BACKFILL_START else EVAL_MODE} mode)")
+    evaluate_chunk(spans_df)
+    evaluated += len(spans_df)
+
+runner.close()
+if EVAL_SNAPSHOT_MODE == "export" and os.path.isdir(EVAL_SNAPSHOT_DIR):
+    # Each chunk was written as its own part files; fold them and any re-exported spans together
+    print(f"Snapshot compacted: {compact_snapshot(EVAL_SNAPSHOT_DIR)} re-exported span copies removed")
+
+print(f"Self-evaluation leakage check: {leaked_spans} judge spans found in {EVAL_SOURCE_PROJECT} and skipped")
+if evaluated:
+    print(f"Evaluated {evaluated} spans{' from the snapshot' if replay else ' and submitted the results to Phoenix'}.")
+    if not replay:
+        print(f"Upload: {uploader.stats()}")
+else:
+    print("No new LLM spans to evaluate.")
+
+if sampler is not None and sampler.summary():
+    print(sampler.summary())
+    print(f"Population estimates ({sampler.confidence:.0%} confidence intervals):")
+    print(sampler.report({name: pd.concat(frames) for name, frames in judged_results.items()}).to_string())
@@ -0,0 +1,321 @@
+"""Flight recorder: the last few complete traces, kept in memory with full payloads.
+
+FlightRecorder is a span processor that groups finished spans by trace. When a trace's
+local root span ends, the whole tree is moved into a ring buffer of recent traces. Traces
+whose root took longer than a latency threshold go into a separate ring instead, so a
+burst of fast traffic can't push them out.
+
+Spans are kept exactly as recorded, independent of whatever sampling or truncation the
+export pipeline applies afterwards. (Sampling done by the tracer provider itself happens
+before any processor, so it has to stay off for the recorder to see everything.)
+
+Memory is bounded by the number of traces in each ring, the number of spans kept per
+trace, the number of unfinished traces being assembled and an approximate byte budget
+shared by the rings and the unfinished traces. Over the budget, the oldest unfinished
+traces are dropped first (a trace whose root never ends would otherwise sit there for
+good), then the oldest finished ones.
+
+Dump the buffer with dump() or over HTTP with start_dump_server(). Traces hold full prompts
+and responses, so nothing is written to disk unless FLIGHT_RECORDER_DIR is set. With it,
+SIGUSR1 dumps the buffer there and each slow trace is also written there as it completes,
+by a background thread so the request thread never waits on the disk. Only the newest
+FLIGHT_RECORDER_MAX_FILES files are kept.
+
+    FLIGHT_RECORDER_TRACES          recent traces kept (default 50, 0 disables the recorder)
+    FLIGHT_RECORDER_SLOW_TRACES     slow traces kept (default 20)
+    FLIGHT_RECORDER_SLOW_MS         latency threshold for slow traces (default 5000)
+    FLIGHT_RECORDER_MAX_SPANS       spans kept per trace (default 200)
+    FLIGHT_RECORDER_MAX_MB          approximate memory budget, unfinished traces included (default 32)
+    FLIGHT_RECORDER_MAX_PENDING     unfinished traces being assembled at once (default 1000)
+    FLIGHT_RECORDER_DIR             where dumps and slow traces are written (unset = never written)
+    FLIGHT_RECORDER_MAX_FILES       files kept in FLIGHT_RECORDER_DIR, oldest removed first (default 20)
+    FLIGHT_RECORDER_PORT            port for GET /debug/flight-recorder (unset = no server)
+"""
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+
+
+def estimate_span_bytes(span: ReadableSpan) -> int:
+    """Rough in-memory size of a span, dominated by its string payloads"""
+    size = 500
+    for key, value in (span.attributes or {}).items():
+        size += len(key) + (len(value) if isinstance(value, str) else 16)
+    for event in span.events:
+        size += 100 + sum(len(str(value)) for value in (event.attributes or {}).values())
+    return size
+
+
+def span_to_dict(span: ReadableSpan) -> dict:
+    return {
+        "name": span.name,
+        "trace_id": format(span.context.trace_id, "032x"),
+        "span_id": format(span.context.span_id, "016x"),
+        "parent_span_id": format(span.parent.span_id, "016x") if span.parent else None,
+        "kind": span.kind.name,
+        "start_time_unix_nano": span.start_time,
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 3),
+        "status": span.status.status_code.name,
+        "status_message": span.status.description,
+        "attributes": dict(span.attributes or {}),
+        "events": [
+            {"name": event.name, "timestamp_unix_nano": event.timestamp, "attributes": dict(event.attributes or {})}
+            for event in span.events
+        ],
+    }
+
+
+class RecordedTrace:
+    __slots__ = ("trace_id", "spans", "bytes", "dropped_spans", "duration_ms", "root_name")
+
+    def __init__(self, trace_id: int):
+        self.trace_id = trace_id
+        self.spans: list[ReadableSpan] = []
+        self.bytes = 0
+        self.dropped_spans = 0
+        self.duration_ms = 0.0
+        self.root_name = ""
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": format(self.trace_id, "032x"),
+            "root": self.root_name,
+            "duration_ms": round(self.duration_ms, 3),
+            "dropped_spans": self.dropped_spans,
+            "spans": [span_to_dict(span) for span in sorted(self.spans, key=lambda span: span.start_time)],
+        }
+
+
+class FlightRecorder(SpanProcessor):
+    def __init__(
+        self,
+        max_traces: int = 50,
+        max_slow_traces: int = 20,
+        slow_threshold_ms: float = 5000,
+        max_spans_per_trace: int = 200,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_pending_traces: int = 1000,
+        dump_dir: Optional[str] = None,
+        max_files: int = 20,
+    ):
+        self.max_spans_per_trace = max_spans_per_trace
+        self.slow_threshold_ms = slow_threshold_ms
+        self.max_bytes = max_bytes
+        self.max_pending_traces = max_pending_traces
+        self.dump_dir = dump_dir
+        self.max_files = max_files
+        self._recent: deque[RecordedTrace] = deque(maxlen=max_traces)
+        self._slow: deque[RecordedTrace] = deque(maxlen=max_slow_traces)
+        # Traces whose root span hasn't ended yet, oldest first
+        self._pending: OrderedDict[int, RecordedTrace] = OrderedDict()
+        self._pending_bytes = 0
+        self._ring_bytes = 0
+        # Reentrant so dump() can call stats() while holding it
+        self._lock = threading.RLock()
+        self.dropped_traces = 0
+        # Slow traces waiting for the writer thread, which starts with the first one
+        self._writes: queue.Queue = queue.Queue(maxsize=100)
+        self._writer: Optional[threading.Thread] = None
+        # Serializes file writes and rotation between the writer thread and dump_to_file()
+        self._write_lock = threading.Lock()
+        self.dropped_writes = 0
+
+    @classmethod
+    def from_env(cls) -> "FlightRecorder":
+        return cls(
+            max_traces=int(os.environ.get("FLIGHT_RECORDER_TRACES", "50")),
+            max_slow_traces=int(os.environ.get("FLIGHT_RECORDER_SLOW_TRACES", "20")),
+            slow_threshold_ms=float(os.environ.get("FLIGHT_RECORDER_SLOW_MS", "5000")),
+            max_spans_per_trace=int(os.environ.get("FLIGHT_RECORDER_MAX_SPANS", "200")),
+            max_bytes=int(float(os.environ.get("FLIGHT_RECORDER_MAX_MB", "32")) * 1024 * 1024),
+            max_pending_traces=int(os.environ.get("FLIGHT_RECORDER_MAX_PENDING", "1000")),
+            dump_dir=os.environ.get("FLIGHT_RECORDER_DIR") or None,
+            max_files=int(os.environ.get("FLIGHT_RECORDER_MAX_FILES", "20")),
+        )
+
+    def on_end(self, span: ReadableSpan):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            recorded = self._pending.get(trace_id)
+            if recorded is None:
+                recorded = self._pending[trace_id] = RecordedTrace(trace_id)
+                while len(self._pending) > self.max_pending_traces:
+                    self._drop_oldest_pending()
+            if len(recorded.spans) < self.max_spans_per_trace:
+                size = estimate_span_bytes(span)
+                recorded.spans.append(span)
+                recorded.bytes += size
+                self._pending_bytes += size
+                # Never this trace, which is the newest and still being assembled
+                while self._bytes() > self.max_bytes and next(iter(self._pending)) != trace_id:
+                    self._drop_oldest_pending()
+            else:
+                recorded.dropped_spans += 1
+            if not is_root:
+                return
+            del self._pending[trace_id]
+            self._pending_bytes -= recorded.bytes
+            recorded.root_name = span.name
+            recorded.duration_ms = (span.end_time - span.start_time) / 1e6
+            slow = recorded.duration_ms >= self.slow_threshold_ms
+            self._store(self._slow if slow else self._recent, recorded)
+        if slow and self.dump_dir:
+            self._queue_write(recorded)
+
+    def _queue_write(self, recorded: RecordedTrace):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="flight-recorder-writer", daemon=True)
+                self._writer.start()
+        try:
+            self._writes.put_nowait(recorded)
+        except queue.Full:
+            # The disk can't keep up; the trace is still in the slow ring
+            self.dropped_writes += 1
+
+    def _write_loop(self):
+        while True:
+            recorded = self._writes.get()
+            try:
+                if recorded is None:
+                    return
+                self._write(f"slow-{format(recorded.trace_id, '032x')}.json", {"traces": [recorded.to_dict()]})
+            except OSError as error:
+                print(f"Flight recorder could not write slow trace: {error}")
+            finally:
+                self._writes.task_done()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        if self._writer is not None:
+            self._writes.join()
+        return True
+
+    def shutdown(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join(timeout=5)
+
+    def _drop_oldest_pending(self):
+        _, dropped = self._pending.popitem(last=False)
+        self._pending_bytes -= dropped.bytes
+        self.dropped_traces += 1
+
+    def _store(self, ring: deque, recorded: RecordedTrace):
+        if not ring.maxlen:
+            return
+        if len(ring) == ring.maxlen:
+            self._ring_bytes -= ring.popleft().bytes
+            self.dropped_traces += 1
+        ring.append(recorded)
+        self._ring_bytes += recorded.bytes
+        # Over the byte budget, drop the oldest traces, recent ones before slow ones
+        while self._bytes() > self.max_bytes and (self._recent or self._slow):
+            self._ring_bytes -= (self._recent or self._slow).popleft().bytes
+            self.dropped_traces += 1
+
+    def _bytes(self) -> int:
+        return self._ring_bytes + self._pending_bytes
+
+    def dump(self) -> dict:
+        with self._lock:
+            recent, slow = list(self._recent), list(self._slow)
+            stats = self.stats()
+        return {
+            "dumped_at": time.time(),
+            "stats": stats,
+            "slow_traces": [recorded.to_dict() for recorded in slow],
+            "recent_traces": [recorded.to_dict() for recorded in recent],
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "recent_traces": len(self._recent),
+                "slow_traces": len(self._slow),
+                "pending_traces": len(self._pending),
+                "approx_bytes": self._bytes(),
+                "dropped_traces": self.dropped_traces,
+                "dropped_writes": self.dropped_writes,
+            }
+
+    def dump_to_file(self) -> str:
+        if not self.dump_dir:
+            raise ValueError("FLIGHT_RECORDER_DIR is not set")
+        return self._write(f"dump-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json", self.dump())
+
+    def _write(self, filename: str, payload: dict) -> str:
+        with self._write_lock:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            path = os.path.join(self.dump_dir, filename)
+            with open(path, "w") as file:
+                json.dump(payload, file, default=str)
+            self._rotate()
+        return path
+
+    def _rotate(self):
+        # Keep the newest max_files dumps and slow traces
+        paths = [
+            os.path.join(self.dump_dir, name) for name in os.listdir(self.dump_dir)
+            if name.endswith(".json") and name.startswith(("slow-", "dump-"))
+        ]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:max(0, len(paths) - self.max_files)]:
+            os.remove(path)
+
+    def install_signal_handler(self, signum: int = signal.SIGUSR1):
+        """Dump to FLIGHT_RECORDER_DIR when the process receives `signum` (main thread only)"""
+
+        def handle(received_signum, frame):
+            # Write from a thread; the handler may have interrupted code holding our lock
+            threading.Thread(target=lambda: print(f"Flight recorder dumped to {self.dump_to_file()}"), daemon=True).start()
+
+        signal.signal(signum, handle)
+
+
+def start_dump_server(recorder: FlightRecorder, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve recorder.dump() as JSON on http://host:port/debug/flight-recorder from a daemon thread.
+
+    Dumps contain full prompts and responses, so this binds to localhost by default.
+    """
+
+    class DumpHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/debug/flight-recorder":
+                self.send_error(404)
+                return
+            body = json.dumps(recorder.dump(), default=str).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), DumpHandler)
+    threading.Thread(target=server.serve_forever, name="flight-recorder-server", daemon=True).start()
+    return server
+
+
+def install(tracer_provider) -> Optional[FlightRecorder]:
+    """Attach a FlightRecorder configured from the environment, with its signal and HTTP dumps"""
+    if int(os.environ.get("FLIGHT_RECORDER_TRACES", "50")) == 0:
+        return None
+    recorder = FlightRecorder.from_env()
+    tracer_provider.add_span_processor(recorder)
+    if recorder.dump_dir and threading.current_thread() is threading.main_thread() and hasattr(signal, "SIGUSR1"):
+        recorder.install_signal_handler()
+    port = os.environ.get("FLIGHT_RECORDER_PORT")
+    if port:
+        start_dump_server(recorder, int(port))
+    return recorder
@@ -0,0 +1,293 @@
+"""One shared, tuned HTTP connection pool for every OpenAI and Anthropic client.
+
+Each SDK client normally builds its own httpx client with default pool settings, so every
+module (and app.py's two OpenAI clients) paid for its own TLS handshakes. Here the sync and
+async httpx clients are built once per process from HTTP_* environment variables, count
+new connections vs. requests so the reuse rate can be reported, and can be pre-warmed at
+startup so the first user request doesn't pay for connection setup.
+
+Pooled async connections belong to the event loop that opened them, and code such as
+manual_tracing.gather_prompts() runs each batch on a new asyncio.run() loop. The shared
+async client therefore keeps one connection pool per event loop, and drops a pool once
+its loop is closed.
+"""
+import asyncio
+import dataclasses
+import importlib.util
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+from cassette import get_cassette_mode, wrap_transport
+
+logger = logging.getLogger(__name__)
+
+# Hosts the model providers are reached on, opened by prewarm_connections()
+PROVIDER_BASE_URLS = ["https://api.openai.com", "https://api.anthropic.com"]
+
+
+@dataclass(frozen=True)
+class HttpSettings:
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    http2: bool = True
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+
+    @classmethod
+    def from_env(cls) -> "HttpSettings":
+        return cls(
+            max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", cls.max_keepalive_connections)),
+            keepalive_expiry=float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SECONDS", cls.keepalive_expiry)),
+            http2=os.environ.get("HTTP_HTTP2", "1") == "1",
+            connect_timeout=float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", cls.connect_timeout)),
+            read_timeout=float(os.environ.get("HTTP_READ_TIMEOUT_SECONDS", cls.read_timeout)),
+            write_timeout=float(os.environ.get("HTTP_WRITE_TIMEOUT_SECONDS", cls.write_timeout)),
+            pool_timeout=float(os.environ.get("HTTP_POOL_TIMEOUT_SECONDS", cls.pool_timeout)),
+        )
+
+    def timeout(self, limit: Optional[float] = None) -> httpx.Timeout:
+        """Per-phase timeouts, each capped at `limit` seconds if given (e.g. the time left for an attempt)"""
+        timeouts = [self.connect_timeout, self.read_timeout, self.write_timeout, self.pool_timeout]
+        if limit is not None:
+            timeouts = [min(timeout, limit) for timeout in timeouts]
+        connect, read, write, pool = timeouts
+        return httpx.Timeout(connect=connect, read=read, write=write, pool=pool)
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class ConnectionStats:
+    """Request and connection counters shared by the sync and async transports"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        # Requests whose response hasn't been closed yet, each holding a connection (or an
+        # HTTP/2 stream on one)
+        self.active_requests = 0
+
+    def on_trace_event(self, event_name: str):
+        with self._lock:
+            if event_name == "connection.connect_tcp.complete":
+                self.new_connections += 1
+            elif event_name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def on_request(self):
+        with self._lock:
+            self.requests += 1
+            self.active_requests += 1
+
+    def on_request_done(self):
+        with self._lock:
+            self.active_requests -= 1
+
+
+class CountingStream(httpx.SyncByteStream):
+    """Response body that tells the stats when the response is closed"""
+
+    def __init__(self, stream: httpx.SyncByteStream, stats: ConnectionStats):
+        self.stream = stream
+        self.stats = stats
+        self.closed = False
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.stats.on_request_done()
+        self.stream.close()
+
+
+class AsyncCountingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, stats: ConnectionStats):
+        self.stream = stream
+        self.stats = stats
+        self.closed = False
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        if not self.closed:
+            self.closed = True
+            self.stats.on_request_done()
+        await self.stream.aclose()
+
+
+class CountingTransport(httpx.HTTPTransport):
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.on_request()
+        request.extensions["trace"] = lambda event_name, info: self.stats.on_trace_event(event_name)
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self.stats.on_request_done()
+            raise
+        return httpx.Response(
+            response.status_code, headers=response.headers, stream=CountingStream(response.stream, self.stats), extensions=response.extensions
+        )
+
+
+class AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.on_request()
+
+        async def trace(event_name, info):
+            self.stats.on_trace_event(event_name)
+
+        request.extensions["trace"] = trace
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self.stats.on_request_done()
+            raise
+        return httpx.Response(
+            response.status_code, headers=response.headers, stream=AsyncCountingStream(response.stream, self.stats), extensions=response.extensions
+        )
+
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+    """Sends each request through a connection pool of the event loop it runs on"""
+
+    def __init__(self, new_transport):
+        self.new_transport = new_transport
+        self._transports: dict[asyncio.AbstractEventLoop, httpx.AsyncBaseTransport] = {}
+        self._lock = threading.Lock()
+
+    def _transport(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                # The connections of a closed loop's pool can't be used or closed any more
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = self._transports[loop] = self.new_transport()
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+        if transport is not None:
+            await transport.aclose()
+
+
+_lock = threading.Lock()
+_settings = None
+_stats = ConnectionStats()
+_http_client = None
+_async_http_client = None
+
+
+def get_settings() -> HttpSettings:
+    global _settings
+    if _settings is None:
+        settings = HttpSettings.from_env()
+        # HTTP/2 needs the optional h2 package (pip install httpx[http2])
+        if settings.http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("h2 is not installed, falling back to HTTP/1.1 for provider clients")
+            settings = dataclasses.replace(settings, http2=False)
+        _settings = settings
+    return _settings
+
+
+def configure_http(settings: HttpSettings):
+    """Use explicit settings; must run before the shared clients are first built"""
+    global _settings
+    with _lock:
+        if _http_client is not None or _async_http_client is not None:
+            raise RuntimeError("configure_http() must be called before the shared HTTP clients are created")
+        _settings = settings
+
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            settings = get_settings()
+            _http_client = httpx.Client(
+                # LLM_CASSETTE_MODE=record/replay wraps the pool, see cassette.py
+                transport=wrap_transport(CountingTransport(_stats, http2=settings.http2, limits=settings.limits())),
+                timeout=settings.timeout(),
+            )
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            settings = get_settings()
+            _async_http_client = httpx.AsyncClient(
+                transport=wrap_transport(
+                    LoopLocalTransport(lambda: AsyncCountingTransport(_stats, http2=settings.http2, limits=settings.limits())),
+                    is_async=True,
+                ),
+                timeout=settings.timeout(),
+            )
+    return _async_http_client
+
+
+def prewarm_connections(base_urls: list[str] = PROVIDER_BASE_URLS):
+    """Open a connection (TCP + TLS) to each provider so the first real request reuses it.
+
+    The HEAD request itself is unauthenticated and its status is ignored; only the pooled
+    connection matters. Failures are reported but never raised.
+    """
+    # Nothing to warm up when responses come from cassettes
+    if get_cassette_mode() == "replay":
+        return
+    client = get_http_client()
+    for base_url in base_urls:
+        try:
+            client.head(base_url)
+        except httpx.HTTPError as error:
+            logger.warning("Could not pre-warm a connection to %s: %s", base_url, error)
+
+
+def get_transport_stats() -> dict:
+    """Pool utilization and connection reuse for the shared clients"""
+    settings = get_settings()
+    requests, active = _stats.requests, _stats.active_requests
+    return {
+        "http.pool.requests": requests,
+        "http.pool.new_connections": _stats.new_connections,
+        "http.pool.tls_handshakes": _stats.tls_handshakes,
+        "http.pool.reuse_rate": round(1 - _stats.new_connections / requests, 4) if requests else 0.0,
+        "http.pool.active_requests": active,
+        # Over 1.0 only with HTTP/2, where requests share connections
+        "http.pool.utilization": round(active / settings.max_connections, 4),
+        "http.pool.http2": settings.http2,
+    }
@@ -1,60 +1,309 @@
+"""Manual OpenTelemetry tracing around OpenAI and Anthropic calls.
+
+Importing this module has no side effects: environment variables are not read, no tracer
+provider is registered and no clients are built until they are needed. Call configure()
+to set things up explicitly, otherwise the first traced call configures from the
+environment (and .env file).
+"""
 import os
-from dotenv import load_dotenv
+import json
+import uuid
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Iterator, TYPE_CHECKING
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.trace import Status, StatusCode, SpanKind
-from arize.otel import register
-from openai import OpenAI
-from anthropic import Anthropic
-from typing import Union
-from anthropic.types import ContentBlock, TextBlock
+from opentelemetry.trace import Status, StatusCode
 from openinference.semconv.trace import (
     SpanAttributes,
     MessageAttributes,
 )
-from openai.types.chat import ChatCompletionToolParam
-import json
-import uuid
-from openinference.instrumentation import using_attributes
-
-# Load environment variables from .env file
-load_dotenv()
-
-# --- Set your Arize API key here ---
-print("Environment variables:")
-print(f"ARIZE_API_KEY: {os.environ.get('ARIZE_API_KEY')}")
-print(f"ARIZE_SPACE_ID: {os.environ.get('ARIZE_SPACE_ID')}")
-print(f"OPENAI_API_KEY: {os.environ.get('OPENAI_API_KEY')}")
-print(f"ANTHROPIC_API_KEY: {os.environ.get('ANTHROPIC_API_KEY')}")
-
-ARIZE_API_KEY = os.environ.get('ARIZE_API_KEY')
-if not ARIZE_API_KEY:
-    raise ValueError("ARIZE_API_KEY environment variable is not set")
-
-ARIZE_SPACE_ID = os.environ.get('ARIZE_SPACE_ID')
-if not ARIZE_SPACE_ID:
-    raise ValueError("ARIZE_SPACE_ID environment variable is not set")
-
-OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
-
-ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
-if not ANTHROPIC_API_KEY:
-    raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
-
-tracer_provider = register(
-    space_id = ARIZE_SPACE_ID,
-    api_key = ARIZE_API_KEY,
-    project_name = "Fuad's Test Project", # name this to whatever you would like
-)
+from tool_cache import CachePolicy, ToolResultCache
+from stream_metrics import StreamTimer
+from session_memory import SessionMemory
+from provider_retry import RetryBudget, RetryPolicy, call_with_retries, call_with_retries_async
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionToolParam, ChatCompletionMessageToolCall
+
+# --- Lazy setup ---
+# The provider SDKs, the OpenInference instrumentation and the Arize exporter are all
+# imported inside the functions below, because importing them costs about a second.
 
 tracer = trace.get_tracer(__name__)
+tracer_provider = None
+# RED metrics aggregate fed by every finished span, see red_metrics.py
+red_metrics = None
+# Recent complete traces kept in memory for debugging, see flight_recorder.py
+flight_recorder = None
+
+_configured = False
+# Reentrant so ensure_configured() can call configure() while holding it
+_config_lock = threading.RLock()
+_api_keys: dict[str, Optional[str]] = {}
+# configure() arguments as resolved in this process, for tool process pool workers
+_worker_config: dict = {}
+_clients: dict[str, object] = {}
+
+# How much detail the manual spans carry (TRACE_VERBOSITY):
+#   minimal   one span per provider call with the core LLM attributes only
+#   standard  adds the decision, tool chain, tool execution, session and retry attempt spans
+#   debug     adds the static request parameter/header attributes and connection pool stats
+VERBOSITY_LEVELS = ("minimal", "standard", "debug")
+_verbosity: Optional[int] = None
+
+def configure(
+    space_id: Optional[str] = None,
+    api_key: Optional[str] = None,
+    project_name: str = "Fuad's Test Project", # name this to whatever you would like
+    openai_api_key: Optional[str] = None,
+    anthropic_api_key: Optional[str] = None,
+    provider=None,
+    auto_instrument: bool = False,
+    load_env: bool = True,
+    metrics_port: Optional[int] = None,
+    verbosity: Optional[str] = None,
+    worker: bool = False,
+):
+    """Set up tracing and provider credentials.
+
+    Arguments left as None are read from the environment (after loading .env when
+    `load_env` is set). Pass `provider` to use an existing tracer provider instead of
+    registering one with Arize. With `auto_instrument`, the OpenAI and Anthropic SDK calls
+    are also traced by the OpenInference instrumentors.
+
+    Span-derived RED metrics are always collected in-process; with `metrics_port` (or
+    RED_METRICS_PORT) they are also served in Prometheus format on /metrics. The flight
+    recorder (FLIGHT_RECORDER_* settings) keeps the last few complete traces in memory.
+    Tool pool workers are configured with `worker` set, which leaves both out: a worker's
+    spans are exported, but only the main process serves metrics and flight recorder dumps.
+
+    `verbosity` (or TRACE_VERBOSITY) is one of VERBOSITY_LEVELS, "standard" by default.
+
+    Calling configure() again updates the credentials (for clients built afterwards) and the
+    verbosity, and keeps the tracer provider unless a different `provider` is passed. The
+    RED metrics and flight recorder processors are only attached to a provider once.
+    """
+    global _configured, tracer_provider, red_metrics, flight_recorder
+    with _config_lock:
+        if load_env:
+            from dotenv import load_dotenv
+
+            # Load environment variables from .env file
+            load_dotenv()
+
+        _api_keys["openai"] = openai_api_key or os.environ.get('OPENAI_API_KEY')
+        _api_keys["anthropic"] = anthropic_api_key or os.environ.get('ANTHROPIC_API_KEY')
+
+        if provider is None and _configured:
+            provider = tracer_provider
+        elif provider is None:
+            space_id = space_id or os.environ.get('ARIZE_SPACE_ID')
+            if not space_id:
+                raise ValueError("ARIZE_SPACE_ID environment variable is not set")
+            api_key = api_key or os.environ.get('ARIZE_API_KEY')
+            if not api_key:
+                raise ValueError("ARIZE_API_KEY environment variable is not set")
+
+            from arize.otel import register
+
+            provider = register(
+                space_id = space_id,
+                api_key = api_key,
+                project_name = project_name,
+            )
+            _worker_config.update(space_id=space_id, api_key=api_key, project_name=project_name)
+        elif provider is not tracer_provider:
+            trace.set_tracer_provider(provider)
+        set_trace_verbosity(verbosity or os.environ.get("TRACE_VERBOSITY", "standard"))
+        _worker_config.update(
+            openai_api_key=_api_keys["openai"],
+            anthropic_api_key=_api_keys["anthropic"],
+            auto_instrument=auto_instrument,
+            verbosity=VERBOSITY_LEVELS[_verbosity],
+        )
+
+        # Workers leave the metrics and dump servers (and their ports) to the main process
+        if provider is not tracer_provider and not worker:
+            tracer_provider = provider
+
+            import red_metrics as red_metrics_module
+
+            red_metrics = red_metrics_module.install(tracer_provider, metrics_port or os.environ.get("RED_METRICS_PORT"))
+
+            import flight_recorder as flight_recorder_module
+
+            flight_recorder = flight_recorder_module.install(tracer_provider)
+        elif provider is not tracer_provider:
+            tracer_provider = provider
+
+        for tool_name, policy in get_tool_cache_policies().items():
+            # Registering again would empty the tool's cache
+            if not tool_cache.is_cached_tool(tool_name):
+                tool_cache.register(tool_name, policy)
+
+        if auto_instrument:
+            from openinference.instrumentation.openai import OpenAIInstrumentor
+            from openinference.instrumentation.anthropic import AnthropicInstrumentor
+
+            OpenAIInstrumentor().instrument(tracer_provider=tracer_provider)
+            AnthropicInstrumentor().instrument(tracer_provider=tracer_provider)
+
+        _configured = True
+
+def set_trace_verbosity(level: str):
+    global _verbosity
+    if level not in VERBOSITY_LEVELS:
+        raise ValueError(f"Trace verbosity must be one of {', '.join(VERBOSITY_LEVELS)}, got {level!r}")
+    _verbosity = VERBOSITY_LEVELS.index(level)
+
+def verbosity_at_least(level: str) -> bool:
+    ensure_configured()
+    return _verbosity >= VERBOSITY_LEVELS.index(level)
+
+def ensure_configured():
+    # Checked again under the lock, so concurrent first calls configure only once
+    if not _configured:
+        with _config_lock:
+            if not _configured:
+                configure()
+
+# using_attributes comes from openinference.instrumentation, which is slow to import
+def using_attributes(**kwargs):
+    from openinference.instrumentation import using_attributes as openinference_using_attributes
+    return openinference_using_attributes(**kwargs)
+
+# Spans started before configure() would be non-recording, so every traced entry point
+# goes through get_tracer()
+def get_tracer():
+    ensure_configured()
+    return tracer
+
+def set_clients(openai=None, anthropic=None, async_openai=None, async_anthropic=None):
+    """Use pre-built provider clients instead of the default ones"""
+    for name, client in (("openai", openai), ("anthropic", anthropic), ("async_openai", async_openai), ("async_anthropic", async_anthropic)):
+        if client is not None:
+            _clients[name] = client
+
+def _get_api_key(provider: str) -> str:
+    ensure_configured()
+    key = _api_keys.get(provider)
+    if not key:
+        raise ValueError(f"{provider.upper()}_API_KEY environment variable is not set")
+    return key
 
 # --- Model Providers Setup ---
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
+# Every client shares one tuned connection pool from http_transport.py. The SDKs' own
+# retries are off; provider calls are retried under a deadline and budget instead (below)
+
+def get_openai_client():
+    if "openai" not in _clients:
+        from openai import OpenAI
+        from http_transport import get_http_client, get_settings
+        _clients["openai"] = OpenAI(api_key=_get_api_key("openai"), http_client=get_http_client(), timeout=get_settings().timeout(), max_retries=0)
+    return _clients["openai"]
+
+def get_anthropic_client():
+    if "anthropic" not in _clients:
+        from anthropic import Anthropic
+        from http_transport import get_http_client, get_settings
+        _clients["anthropic"] = Anthropic(api_key=_get_api_key("anthropic"), http_client=get_http_client(), timeout=get_settings().timeout(), max_retries=0)
+    return _clients["anthropic"]
+
+# Async clients used by the *_async call paths so many prompts can run on one event loop
+def get_async_openai_client():
+    if "async_openai" not in _clients:
+        from openai import AsyncOpenAI
+        from http_transport import get_async_http_client, get_settings
+        _clients["async_openai"] = AsyncOpenAI(api_key=_get_api_key("openai"), http_client=get_async_http_client(), timeout=get_settings().timeout(), max_retries=0)
+    return _clients["async_openai"]
+
+def get_async_anthropic_client():
+    if "async_anthropic" not in _clients:
+        from anthropic import AsyncAnthropic
+        from http_transport import get_async_http_client, get_settings
+        _clients["async_anthropic"] = AsyncAnthropic(api_key=_get_api_key("anthropic"), http_client=get_async_http_client(), timeout=get_settings().timeout(), max_retries=0)
+    return _clients["async_anthropic"]
+
+# --- Deadlines and retries ---
+# Every provider request goes through call_with_retries: each attempt has its own timeout
+# and child span, and the whole call has a deadline and draws retries from a shared budget.
+# See provider_retry.py for the PROVIDER_* settings.
+
+_retry_policy = None
+_retry_budget = None
+
+def get_retry_policy() -> RetryPolicy:
+    global _retry_policy
+    if _retry_policy is None:
+        _retry_policy = RetryPolicy.from_env()
+    return _retry_policy
+
+def get_retry_budget() -> RetryBudget:
+    global _retry_budget
+    if _retry_budget is None:
+        _retry_budget = RetryBudget.from_env()
+    return _retry_budget
+
+def _attempt_timeout(seconds: float):
+    # The client's own per-phase timeouts, capped at the attempt's, so an attempt that runs
+    # out of time is stopped by httpx instead of left running
+    from http_transport import get_settings
+    return get_settings().timeout(seconds)
+
+def create_openai_completion(span_name: str, **kwargs):
+    return call_with_retries(
+        get_tracer(), span_name,
+        lambda timeout: get_openai_client().chat.completions.create(timeout=_attempt_timeout(timeout), **kwargs),
+        get_retry_policy(), get_retry_budget(), trace_attempts=verbosity_at_least("standard"),
+    )
+
+def create_anthropic_message(span_name: str, **kwargs):
+    return call_with_retries(
+        get_tracer(), span_name,
+        lambda timeout: get_anthropic_client().messages.create(timeout=_attempt_timeout(timeout), **kwargs),
+        get_retry_policy(), get_retry_budget(), trace_attempts=verbosity_at_least("standard"),
+    )
+
+async def create_openai_completion_async(span_name: str, **kwargs):
+    return await call_with_retries_async(
+        get_tracer(), span_name,
+        lambda timeout: get_async_openai_client().chat.completions.create(timeout=_attempt_timeout(timeout), **kwargs),
+        get_retry_policy(), get_retry_budget(), trace_attempts=verbosity_at_least("standard"),
+    )
+
+async def create_anthropic_message_async(span_name: str, **kwargs):
+    return await call_with_retries_async(
+        get_tracer(), span_name,
+        lambda timeout: get_async_anthropic_client().messages.create(timeout=_attempt_timeout(timeout), **kwargs),
+        get_retry_policy(), get_retry_budget(), trace_attempts=verbosity_at_least("standard"),
+    )
+
+def set_span_error_attributes(span, error: BaseException):
+    span.set_attribute("span.status", "error")
+    span.set_attribute("span.status_message", str(error))
+
+# Like start_as_current_span, but a failure also replaces the "pending" span.status attribute
+@contextmanager
+def start_call_span(name: str):
+    with get_tracer().start_as_current_span(name) as span:
+        try:
+            yield span
+        except Exception as error:
+            set_span_error_attributes(span, error)
+            raise
+
+# Intermediate spans (decision, tool chain, tool execution, session turn) are only emitted
+# at standard verbosity and above. Below that they are replaced by a non-recording stand-in
+# carrying the parent's span context, so attributes set on it are dropped and anything
+# started under it still becomes a child of the parent.
+def start_detail_span(name: str, **kwargs):
+    if verbosity_at_least("standard"):
+        return get_tracer().start_as_current_span(name, **kwargs)
+    return nullcontext(trace.NonRecordingSpan(trace.get_current_span().get_span_context()))
 
 # We know what the structure of our spans attributes needs to be, so we can define them here
 
@@ -74,7 +323,16 @@ def get_openai_span_attributes(model: str, prompt: str):
         # Message attributes
         MessageAttributes.MESSAGE_ROLE: "user",
         MessageAttributes.MESSAGE_CONTENT: prompt,
-        
+
+        # Status attributes
+        "span.status": "pending",
+        "span.status_code": None,
+        "span.status_message": None,
+    }
+
+# Static request parameters and headers, only recorded at debug verbosity
+def get_openai_request_detail_attributes(model: str):
+    return {
         # OpenAI specific attributes
         "openai.api_base": "https://api.openai.com/v1",
         "openai.api_type": "open_ai",
@@ -92,11 +350,6 @@ def get_openai_span_attributes(model: str, prompt: str):
         "http.response.status_code": None,
         "http.response.header.content_type": None,
         
-        # Status attributes
-        "span.status": "pending",
-        "span.status_code": None,
-        "span.status_message": None,
-        
         # LLM specific attributes
         "llm.request.model": model,
         "llm.request.temperature": 0.7,
@@ -135,7 +388,15 @@ def get_anthropic_span_attributes(model: str, prompt: str):
         # Message attributes
         MessageAttributes.MESSAGE_ROLE: "user",
         MessageAttributes.MESSAGE_CONTENT: prompt,
-        
+
+        # Status attributes
+        "span.status": "pending",
+        "span.status_code": None,
+        "span.status_message": None,
+    }
+
+def get_anthropic_request_detail_attributes(model: str):
+    return {
         # Anthropic specific attributes
         "anthropic.api_base": "https://api.anthropic.com",
         "anthropic.api_version": "2023-06-01",
@@ -153,11 +414,6 @@ def get_anthropic_span_attributes(model: str, prompt: str):
         "http.response.status_code": None,
         "http.response.header.content_type": None,
         
-        # Status attributes
-        "span.status": "pending",
-        "span.status_code": None,
-        "span.status_message": None,
-        
         # LLM specific attributes
         "llm.request.model": model,
         "llm.request.max_tokens": 1000,
@@ -195,268 +451,975 @@ def set_span_attributes_batch(span, attributes: dict):
         if value is not None:
             span.set_attribute(key, value)
 
-def call_openai(prompt: str, model: str = "gpt-3.5-turbo") -> str:
-    with tracer.start_as_current_span("openai_call") as span:
-        # Get initial span attributes
-        span_attributes = get_openai_span_attributes(model, prompt)
-        
-        # Set all attributes in batch
-        set_span_attributes_batch(span, span_attributes)
-
-        # Define the tool
-        tools: list[ChatCompletionToolParam] = [{
-            "type": "function",
-            "function": {
-                "name": "get_weather",
-                "description": "Finds the weather for a given city",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "city": {
-                            "type": "string",
-                            "description": "The city to find the weather for, e.g. 'London'",
-                        }
-                    },
-                    "required": ["city"],
-                },
+# Tool definitions offered to OpenAI (shared by the sync and async paths)
+OPENAI_TOOLS: "list[ChatCompletionToolParam]" = [{
+    "type": "function",
+    "function": {
+        "name": "get_weather",
+        "description": "Finds the weather for a given city",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "city": {
+                    "type": "string",
+                    "description": "The city to find the weather for, e.g. 'London'",
+                }
             },
-        }]
+            "required": ["city"],
+        },
+    },
+}]
+
+# Set the request-side attributes on the top level openai_call span
+def set_openai_request_attributes(span, model: str, prompt: str, tools: list):
+    set_span_attributes_batch(span, get_openai_span_attributes(model, prompt))
+    if not verbosity_at_least("debug"):
+        span.set_attribute(SpanAttributes.LLM_INVOCATION_PARAMETERS, json.dumps({"model": model, "temperature": 0.7}))
+        return
+    set_span_attributes_batch(span, get_openai_request_detail_attributes(model))
+
+    # Update tools attribute and add LLM_INVOCATION_PARAMETERS
+    invocation_params = {
+        "model": model,
+        "temperature": 0.7,
+        "tools": tools
+    }
+    span.set_attribute("llm.request.tools", str(tools))
+    span.set_attribute(SpanAttributes.LLM_INVOCATION_PARAMETERS, json.dumps(invocation_params))
+
+def set_anthropic_request_attributes(span, model: str, prompt: str):
+    set_span_attributes_batch(span, get_anthropic_span_attributes(model, prompt))
+    if verbosity_at_least("debug"):
+        set_span_attributes_batch(span, get_anthropic_request_detail_attributes(model))
+
+# Shared connection pool utilization and reuse, see http_transport.py (debug verbosity only,
+# the numbers are process-wide rather than about this request)
+def set_transport_attributes(span):
+    if not verbosity_at_least("debug"):
+        return
+    from http_transport import get_transport_stats
+    set_span_attributes_batch(span, get_transport_stats())
+
+# Set the response attributes and status on the top level openai_call span
+def set_openai_response_attributes(span, response):
+    message = response.choices[0].message
+    set_openai_response_attributes_from_parts(span, response.model, message.content, response.usage)
+
+# Same as set_openai_response_attributes, for responses assembled from a stream
+def set_openai_response_attributes_from_parts(span, response_model: str, content, usage):
+    response_attributes = {
+        "http.response.status_code": 200,
+        "http.response.header.content_type": "application/json",
+        "llm.response.model": response_model,
+        # Add OUTPUT_VALUE for visibility
+        SpanAttributes.OUTPUT_VALUE: content or "",
+        SpanAttributes.OUTPUT_MIME_TYPE: "text/plain",
+        # Update status attributes
+        "span.status": "success",
+        "span.status_code": 200,
+        "span.status_message": "Request completed successfully",
+    }
+
+    # Update usage attributes if available
+    if usage:
+        response_attributes.update({
+            "llm.response.usage.prompt_tokens": usage.prompt_tokens,
+            "llm.response.usage.completion_tokens": usage.completion_tokens,
+            "llm.response.usage.total_tokens": usage.total_tokens,
+        })
+
+    set_span_attributes_batch(span, response_attributes)
+    set_transport_attributes(span)
+
+    # Set OpenTelemetry status
+    span.set_status(Status(StatusCode.OK, "Request completed successfully"))
+
+def set_decision_span_attributes(decision_span):
+    decision_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "chain")
+    decision_span.set_attribute("decision.type", "tool_call_decision")
+    decision_span.set_attribute("decision.description", "LLM decides whether to use tools or respond directly")
+
+def set_tool_chain_span_attributes(chain_span, tool_calls: list):
+    chain_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "chain")
+    chain_span.set_attribute("chain.name", "weather_tool_chain")
+    chain_span.set_attribute("chain.description", "Chain for weather tool execution")
+    chain_span.set_attribute("chain.tool_call_count", len(tool_calls))
+
+def set_tool_result_attributes(tool_span, tool_response: str):
+    tool_span.set_attribute("tool.response", tool_response)
+    # Add output value for tool visibility
+    tool_span.set_attribute(SpanAttributes.OUTPUT_VALUE, tool_response)
+    tool_span.set_attribute(SpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
+    # Update tool status
+    tool_span.set_attribute("span.status", "success")
+    tool_span.set_attribute("span.status_code", 200)
+    tool_span.set_attribute("span.status_message", "Tool executed successfully")
+    # Set OpenTelemetry status
+    tool_span.set_status(Status(StatusCode.OK, "Tool executed successfully"))
+
+def set_final_span_request_attributes(final_span, model: str):
+    final_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "LLM")
+    final_span.set_attribute(SpanAttributes.LLM_MODEL_NAME, model)
+    final_span.set_attribute("llm.request.model", model)
+    final_span.set_attribute("llm.request.temperature", 0.7)
+    final_span.set_attribute("chain.step", "final_response")
+
+def set_final_span_result_attributes(final_span, result):
+    final_span.set_attribute(SpanAttributes.OUTPUT_VALUE, result or "")
+    final_span.set_attribute(SpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
+    final_span.set_attribute("span.status", "success")
+    final_span.set_status(Status(StatusCode.OK, "Final response generated"))
+
+def set_tool_chain_result_attributes(chain_span, result):
+    chain_span.set_attribute("chain.completed", True)
+    chain_span.set_attribute("chain.steps", ["tool_execution", "final_llm_call"])
+    chain_span.set_attribute(SpanAttributes.OUTPUT_VALUE, result or "")
+    chain_span.set_status(Status(StatusCode.OK, "Tool chain completed successfully"))
+
+# Direct response path, a sibling to the main LLM call rather than a child
+def record_direct_response(model: str, message):
+    with start_detail_span("direct_chat_completion", kind=trace.SpanKind.INTERNAL) as direct_span:
+        direct_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "LLM")
+        direct_span.set_attribute("chain.step", "direct_response")
+        direct_span.set_attribute("llm.request.model", model)
+        direct_span.set_attribute("llm.request.temperature", 0.7)
+
+        result = message.content
 
-        # Update tools attribute and add LLM_INVOCATION_PARAMETERS
-        invocation_params = {
-            "model": model,
-            "temperature": 0.7,
-            "tools": tools
-        }
-        span.set_attribute("llm.request.tools", str(tools))
-        span.set_attribute(SpanAttributes.LLM_INVOCATION_PARAMETERS, json.dumps(invocation_params))
+        # Set direct response attributes
+        direct_span.set_attribute(SpanAttributes.OUTPUT_VALUE, result or "")
+        direct_span.set_attribute(SpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
+        direct_span.set_attribute("span.status", "success")
+        direct_span.set_status(Status(StatusCode.OK, "Direct response generated"))
+    return result
+
+def set_decision_result_attributes(decision_span, result):
+    decision_span.set_attribute("decision.completed", True)
+    decision_span.set_attribute(SpanAttributes.OUTPUT_VALUE, result or "")
+    decision_span.set_status(Status(StatusCode.OK, "Decision completed"))
+
+def build_tool_messages(prompt: str, tool_calls: list, tool_responses: list[str], history: Optional[list] = None) -> list:
+    # One assistant message carrying every tool call, then one tool message per call
+    messages = list(history or []) + [
+        {"role": "user", "content": prompt},
+        {"role": "assistant", "content": None, "tool_calls": tool_calls},
+    ]
+    for tool_call, tool_response in zip(tool_calls, tool_responses):
+        messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "name": tool_call.function.name,
+            "content": tool_response
+        })
+    return messages
+
+# --- Tools ---
+
+# Simulate the weather tool's response by making a secondary OpenAI call
+def get_weather(model: str, args: dict) -> str:
+    city = args.get('city', 'London')
+    weather_prompt = f"What is the weather in {city}?"
+
+    # This secondary OpenAI call will be auto-instrumented and show up as a separate span
+    weather_response = create_openai_completion(
+        "get_weather",
+        model=model,
+        messages=[{"role": "user", "content": weather_prompt}]
+    )
+    return weather_response.choices[0].message.content or ""
+
+async def get_weather_async(model: str, args: dict) -> str:
+    city = args.get('city', 'London')
+    weather_prompt = f"What is the weather in {city}?"
+
+    weather_response = await create_openai_completion_async(
+        "get_weather",
+        model=model,
+        messages=[{"role": "user", "content": weather_prompt}]
+    )
+    return weather_response.choices[0].message.content or ""
+
+# Tool name -> handler(model, parsed_args). Register new tools here (and in OPENAI_TOOLS)
+TOOL_HANDLERS = {
+    "get_weather": get_weather,
+}
+ASYNC_TOOL_HANDLERS = {
+    "get_weather": get_weather_async,
+}
+
+# Tool name -> cache policy. Tools without a policy always execute. Read by configure(),
+# after .env is loaded, which registers them with tool_cache
+def get_tool_cache_policies() -> dict[str, CachePolicy]:
+    return {
+        "get_weather": CachePolicy(
+            ttl_seconds=float(os.environ.get("WEATHER_CACHE_TTL_SECONDS", "600")),
+            max_entries=1024,
+            case_insensitive=True,
+        ),
+    }
+
+tool_cache = ToolResultCache()
+
+# Record whether a tool result came from the cache on its tool_execution span
+def set_tool_cache_attributes(tool_span, cached):
+    tool_span.set_attribute("tool.cache_hit", cached is not None)
+    if cached is not None:
+        tool_span.set_attribute("tool.cache_age_seconds", round(cached[1], 3))
+
+# Thread pool used to run the tool calls of a single response concurrently, sized by
+# TOOL_POOL_SIZE when first used (automatic_tracing.py shares it)
+_tool_executor = None
+_tool_executor_lock = threading.Lock()
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    global _tool_executor
+    with _tool_executor_lock:
+        if _tool_executor is None:
+            _tool_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("TOOL_POOL_SIZE", "8")), thread_name_prefix="tool")
+    return _tool_executor
+
+# Tools named in TOOL_PROCESS_POOL_TOOLS (comma-separated) run in worker processes instead,
+# for CPU-heavy tools or ones that should be isolated from the app; see tool_process_pool.py
+_tool_process_pool = None
+_tool_process_pool_lock = threading.Lock()
+
+def runs_in_process_pool(tool_name: str) -> bool:
+    return tool_name in os.environ.get("TOOL_PROCESS_POOL_TOOLS", "").split(",")
+
+def configure_worker(config: dict):
+    """Tool process pool setup: configure a worker with this process's configure() arguments"""
+    configure(load_env=False, worker=True, **config)
+
+def get_tool_process_pool():
+    global _tool_process_pool
+    with _tool_process_pool_lock:
+        if _tool_process_pool is None:
+            from functools import partial
+            from tool_process_pool import ProcessToolPool
+
+            # Workers get the credentials, project, verbosity and instrumentation this process
+            # was configured with. A `provider` passed to configure() can't be sent to another
+            # process, so workers given one register their own from the Arize environment
+            ensure_configured()
+            _tool_process_pool = ProcessToolPool(
+                max_workers=int(os.environ.get("TOOL_PROCESS_POOL_SIZE", "2")),
+                setup=partial(configure_worker, dict(_worker_config)),
+            )
+    return _tool_process_pool
+
+def get_tool_chain_span_name(tool_calls: list) -> str:
+    tool_names = {tool_call.function.name for tool_call in tool_calls}
+    if len(tool_names) == 1:
+        return f"tool_chain.{tool_names.pop()}"
+    return "tool_chain.multi"
+
+def has_known_tool_call(tool_calls: list) -> bool:
+    return any(tool_call.function.name in TOOL_HANDLERS for tool_call in tool_calls)
+
+# Run one tool call in its own tool_execution.<name> span
+def execute_tool_call(model: str, tool_call) -> str:
+    tool_name = tool_call.function.name
+    tool_args = tool_call.function.arguments
+    with start_detail_span(f"tool_execution.{tool_name}", kind=trace.SpanKind.INTERNAL) as tool_span:
+        set_span_attributes_batch(tool_span, get_tool_span_attributes(tool_name, tool_args, tool_call.id))
+        handler = TOOL_HANDLERS.get(tool_name)
+        if handler is None:
+            tool_response = f"Unknown tool: {tool_name}"
+        else:
+            parsed_args = json.loads(tool_args)
+            cached = tool_cache.get(tool_name, parsed_args)
+            set_tool_cache_attributes(tool_span, cached)
+            if cached is not None:
+                tool_response = cached[0]
+            elif runs_in_process_pool(tool_name):
+                tool_response = get_tool_process_pool().run(f"tool_process.{tool_name}", handler, model, parsed_args)
+                tool_cache.set(tool_name, parsed_args, tool_response)
+            else:
+                tool_response = handler(model, parsed_args)
+                tool_cache.set(tool_name, parsed_args, tool_response)
+        set_tool_result_attributes(tool_span, tool_response)
+    return tool_response
+
+async def execute_tool_call_async(model: str, tool_call) -> str:
+    tool_name = tool_call.function.name
+    tool_args = tool_call.function.arguments
+    with start_detail_span(f"tool_execution.{tool_name}", kind=trace.SpanKind.INTERNAL) as tool_span:
+        set_span_attributes_batch(tool_span, get_tool_span_attributes(tool_name, tool_args, tool_call.id))
+        handler = ASYNC_TOOL_HANDLERS.get(tool_name)
+        if handler is None:
+            tool_response = f"Unknown tool: {tool_name}"
+        else:
+            parsed_args = json.loads(tool_args)
+            cached = tool_cache.get(tool_name, parsed_args)
+            set_tool_cache_attributes(tool_span, cached)
+            if cached is not None:
+                tool_response = cached[0]
+            elif runs_in_process_pool(tool_name):
+                # Worker processes run the sync handler
+                tool_response = await asyncio.wrap_future(
+                    get_tool_process_pool().submit(f"tool_process.{tool_name}", TOOL_HANDLERS[tool_name], model, parsed_args)
+                )
+                tool_cache.set(tool_name, parsed_args, tool_response)
+            else:
+                tool_response = await handler(model, parsed_args)
+                tool_cache.set(tool_name, parsed_args, tool_response)
+        set_tool_result_attributes(tool_span, tool_response)
+    return tool_response
+
+def execute_tool_calls(model: str, tool_calls: list, parallel: bool = True) -> list[str]:
+    """Execute every tool call of a response, concurrently on the tool pool by default.
+
+    Responses are returned in the same order as `tool_calls`.
+    """
+    if not parallel or len(tool_calls) == 1:
+        return [execute_tool_call(model, tool_call) for tool_call in tool_calls]
+    # Threads don't inherit contextvars, so run each call in a copy of the current
+    # context to keep its tool_execution span a child of the tool chain span
+    futures = [
+        get_tool_executor().submit(contextvars.copy_context().run, execute_tool_call, model, tool_call)
+        for tool_call in tool_calls
+    ]
+    return [future.result() for future in futures]
+
+async def execute_tool_calls_async(model: str, tool_calls: list) -> list[str]:
+    return await asyncio.gather(*(execute_tool_call_async(model, tool_call) for tool_call in tool_calls))
+
+def call_openai(prompt: str, model: str = "gpt-3.5-turbo", parallel_tools: bool = True, history: Optional[list] = None) -> str:
+    with start_call_span("openai_call") as span:
+        tools = OPENAI_TOOLS
+        set_openai_request_attributes(span, model, prompt, tools)
+        span.set_attribute("llm.request.history_message_count", len(history or []))
 
         # First call with tool definition
-        response = openai_client.chat.completions.create(
+        response = create_openai_completion(
+            "openai_call",
             model=model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=list(history or []) + [{"role": "user", "content": prompt}],
             tools=tools,
         )
 
         message = response.choices[0].message
-
-        # Update response attributes in batch
-        response_attributes = {
-            "http.response.status_code": 200,
-            "http.response.header.content_type": "application/json",
-            "llm.response.model": response.model,
-            # Add OUTPUT_VALUE for visibility
-            SpanAttributes.OUTPUT_VALUE: message.content or "",
-            SpanAttributes.OUTPUT_MIME_TYPE: "text/plain",
-            # Update status attributes
-            "span.status": "success",
-            "span.status_code": 200,
-            "span.status_message": "Request completed successfully",
-        }
-        
-        # Update usage attributes if available
-        if response.usage:
-            response_attributes.update({
-                "llm.response.usage.prompt_tokens": response.usage.prompt_tokens,
-                "llm.response.usage.completion_tokens": response.usage.completion_tokens,
-                "llm.response.usage.total_tokens": response.usage.total_tokens,
-            })
-        
-        set_span_attributes_batch(span, response_attributes)
-        
-        # Set OpenTelemetry status
-        span.set_status(Status(StatusCode.OK, "Request completed successfully"))
+        set_openai_response_attributes(span, response)
 
         # Create a decision point span to show branching
-        with tracer.start_as_current_span("llm_decision_point", kind=trace.SpanKind.INTERNAL) as decision_span:
-            decision_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "chain")
-            decision_span.set_attribute("decision.type", "tool_call_decision")
-            decision_span.set_attribute("decision.description", "LLM decides whether to use tools or respond directly")
+        with start_detail_span("llm_decision_point", kind=trace.SpanKind.INTERNAL) as decision_span:
+            set_decision_span_attributes(decision_span)
             
             if message.tool_calls:
-                tool_call = message.tool_calls[0]
-                tool_call_id = tool_call.id
-                tool_name = tool_call.function.name
-                tool_args = tool_call.function.arguments
+                tool_calls = message.tool_calls
 
                 # Mark decision as tool call path
                 decision_span.set_attribute("decision.result", "use_tool")
-                decision_span.set_attribute("decision.tool_name", tool_name)
+                decision_span.set_attribute("decision.tool_name", ",".join(tool_call.function.name for tool_call in tool_calls))
+                decision_span.set_attribute("decision.tool_call_count", len(tool_calls))
 
-                # Trace the tool call in a child span
-                if tool_name == "get_weather":
+                # Trace the tool calls in child spans
+                if has_known_tool_call(tool_calls):
                     # Create a chain span for the tool execution sequence
-                    with tracer.start_as_current_span("tool_chain.get_weather", kind=trace.SpanKind.INTERNAL) as chain_span:
-                        # Set chain span attributes
-                        chain_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "chain")
-                        chain_span.set_attribute("chain.name", "weather_tool_chain")
-                        chain_span.set_attribute("chain.description", "Chain for weather tool execution")
+                    with start_detail_span(get_tool_chain_span_name(tool_calls), kind=trace.SpanKind.INTERNAL) as chain_span:
+                        set_tool_chain_span_attributes(chain_span, tool_calls)
                         
-                        # Get tool span attributes
-                        tool_attributes = get_tool_span_attributes(tool_name, tool_args, tool_call_id)
+                        # Each tool call gets its own tool_execution span under the chain
+                        tool_responses = execute_tool_calls(model, tool_calls, parallel=parallel_tools)
                         
-                        # Create the tool execution as part of the chain
-                        with tracer.start_as_current_span("tool_execution.get_weather", kind=trace.SpanKind.INTERNAL) as tool_span:
-                            # Set all tool attributes in batch
-                            set_span_attributes_batch(tool_span, tool_attributes)
-                            
-                            # Simulate the tool's response by making a secondary OpenAI call
-                            city = json.loads(tool_args).get('city', 'London')
-                            weather_prompt = f"What is the weather in {city}?"
+                        # Add every tool response to the conversation
+                        messages = build_tool_messages(prompt, tool_calls, tool_responses, history)
+
+                        # Make a single final call with all of the tool responses
+                        with get_tracer().start_as_current_span("final_llm_call", kind=trace.SpanKind.INTERNAL) as final_span:
+                            set_final_span_request_attributes(final_span, model)
                             
-                            # This secondary OpenAI call will be auto-instrumented and show up as a separate span
-                            weather_response = openai_client.chat.completions.create(
+                            final_response = create_openai_completion(
+                                "final_llm_call",
                                 model=model,
-                                messages=[{"role": "user", "content": weather_prompt}]
+                                messages=messages
                             )
-                            tool_response = weather_response.choices[0].message.content or ""
-                            
-                            tool_span.set_attribute("tool.response", tool_response)
-                            # Add output value for tool visibility
-                            tool_span.set_attribute(SpanAttributes.OUTPUT_VALUE, tool_response)
-                            tool_span.set_attribute(SpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
-                            # Update tool status
-                            tool_span.set_attribute("span.status", "success")
-                            tool_span.set_attribute("span.status_code", 200)
-                            tool_span.set_attribute("span.status_message", "Tool executed successfully")
-                            # Set OpenTelemetry status
-                            tool_span.set_status(Status(StatusCode.OK, "Tool executed successfully"))
-                            
-                            # Add the tool response to the conversation
-                            messages = [
-                                {"role": "user", "content": prompt},
-                                {"role": "assistant", "content": None, "tool_calls": [tool_call]},
-                                {
-                                    "role": "tool",
-                                    "tool_call_id": tool_call_id,
-                                    "name": tool_name,
-                                    "content": tool_response
-                                }
-                            ]
-
-                            # Make the final call with the tool response as a child of the tool span
-                            with tracer.start_as_current_span("final_llm_call", kind=trace.SpanKind.INTERNAL) as final_span:
-                                final_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "LLM")
-                                final_span.set_attribute("llm.request.model", model)
-                                final_span.set_attribute("llm.request.temperature", 0.7)
-                                final_span.set_attribute("chain.step", "final_response")
-                                
-                                final_response = openai_client.chat.completions.create(
-                                    model=model,
-                                    messages=messages
-                                )
-                                result = final_response.choices[0].message.content
-                                
-                                # Set final span attributes
-                                final_span.set_attribute(SpanAttributes.OUTPUT_VALUE, result or "")
-                                final_span.set_attribute(SpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
-                                final_span.set_attribute("span.status", "success")
-                                final_span.set_status(Status(StatusCode.OK, "Final response generated"))
+                            result = final_response.choices[0].message.content
+                            set_final_span_result_attributes(final_span, result)
                         
                         # Set chain completion attributes
-                        chain_span.set_attribute("chain.completed", True)
-                        chain_span.set_attribute("chain.steps", ["tool_execution", "final_llm_call"])
-                        chain_span.set_attribute(SpanAttributes.OUTPUT_VALUE, result or "")
-                        chain_span.set_status(Status(StatusCode.OK, "Tool chain completed successfully"))
+                        set_tool_chain_result_attributes(chain_span, result)
                 else:
-                    tool_response = ""
                     result = message.content
             else:
                 # Mark decision as direct response path
                 decision_span.set_attribute("decision.result", "direct_response")
                 
                 # No tool calls - direct response path
-                # Create a separate span that's a sibling to the main LLM call, not a child
-                with tracer.start_as_current_span("direct_chat_completion", kind=trace.SpanKind.INTERNAL) as direct_span:
-                    direct_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "LLM")
-                    direct_span.set_attribute("chain.step", "direct_response")
-                    direct_span.set_attribute("llm.request.model", model)
-                    direct_span.set_attribute("llm.request.temperature", 0.7)
-                    
-                    result = message.content
-                    
-                    # Set direct response attributes
-                    direct_span.set_attribute(SpanAttributes.OUTPUT_VALUE, result or "")
-                    direct_span.set_attribute(SpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
-                    direct_span.set_attribute("span.status", "success")
-                    direct_span.set_status(Status(StatusCode.OK, "Direct response generated"))
+                result = record_direct_response(model, message)
             
             # Set decision completion
-            decision_span.set_attribute("decision.completed", True)
-            decision_span.set_attribute(SpanAttributes.OUTPUT_VALUE, result or "")
-            decision_span.set_status(Status(StatusCode.OK, "Decision completed"))
+            set_decision_result_attributes(decision_span, result)
 
         assert result is not None, "OpenAI response content was None"
         span.set_attribute(MessageAttributes.MESSAGE_ROLE, "assistant")
         span.set_attribute(MessageAttributes.MESSAGE_CONTENT, result)
         return result
 
-def call_anthropic(prompt: str, model: str = "claude-3-opus-20240229") -> str:
-    with tracer.start_as_current_span("anthropic_call") as span:
-        # Get initial span attributes
-        span_attributes = get_anthropic_span_attributes(model, prompt)
-        
-        # Set all attributes in batch
-        set_span_attributes_batch(span, span_attributes)
+# --- Streaming OpenAI path ---
+# A generator can't hold a span as "current" across yields (the consumer's code would run
+# inside it), so the streaming path starts spans with an explicit parent and only makes
+# them current, via trace.use_span, around the non-yielding sections that need it.
+
+def start_child_span(name: str, parent, **kwargs):
+    return get_tracer().start_span(name, context=trace.set_span_in_context(parent), **kwargs)
+
+# Streaming counterpart of start_detail_span
+def start_detail_child_span(name: str, parent, **kwargs):
+    if verbosity_at_least("standard"):
+        return start_child_span(name, parent, **kwargs)
+    return trace.NonRecordingSpan(parent.get_span_context())
+
+def end_span_with_error(span, error: BaseException):
+    span.record_exception(error)
+    set_span_error_attributes(span, error)
+    span.set_status(Status(StatusCode.ERROR, str(error)))
+    span.end()
+
+# Accumulates streamed tool-call deltas (keyed by their index) into complete tool calls
+class ToolCallAssembler:
+    def __init__(self):
+        self.parts: dict[int, dict] = {}
+
+    def add(self, tool_call_delta) -> Optional[int]:
+        """Merge one delta; return the index of the previous tool call if this delta starts a new one"""
+        index = tool_call_delta.index
+        finished_index = None
+        if index not in self.parts:
+            if self.parts:
+                finished_index = max(self.parts)
+            self.parts[index] = {"id": "", "name": "", "arguments": ""}
+        part = self.parts[index]
+        if tool_call_delta.id:
+            part["id"] = tool_call_delta.id
+        if tool_call_delta.function:
+            part["name"] += tool_call_delta.function.name or ""
+            part["arguments"] += tool_call_delta.function.arguments or ""
+        return finished_index
+
+    def build(self, index: int) -> "ChatCompletionMessageToolCall":
+        from openai.types.chat import ChatCompletionMessageToolCall
+        from openai.types.chat.chat_completion_message_tool_call import Function
+
+        part = self.parts[index]
+        return ChatCompletionMessageToolCall(
+            id=part["id"],
+            type="function",
+            function=Function(name=part["name"], arguments=part["arguments"]),
+        )
+
+def call_openai_stream(prompt: str, model: str = "gpt-3.5-turbo") -> Iterator[str]:
+    """Streaming version of call_openai that yields answer tokens as they arrive.
+
+    Tool calls are assembled from the streamed deltas, and each one is handed to the tool
+    pool as soon as its arguments are complete (when the next tool call starts), so tools
+    run while the rest of the first response is still streaming.
+    """
+    call_start = time.perf_counter()
+    span = get_tracer().start_span("openai_call")
+    decision_span = chain_span = final_span = None
+    try:
+        tools = OPENAI_TOOLS
+        set_openai_request_attributes(span, model, prompt, tools)
+        span.set_attribute("llm.request.stream", True)
+
+        with trace.use_span(span):
+            stream = create_openai_completion(
+                "openai_call",
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                tools=tools,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+        timer = StreamTimer(call_start)
+        answer_timer = StreamTimer(call_start)
+        content_parts = []
+        assembler = ToolCallAssembler()
+        tool_futures: dict[int, Future] = {}
+        response_model, usage = model, None
+
+        def start_tool(index: int):
+            nonlocal decision_span, chain_span
+            # Open the decision and chain spans lazily, once we know a tool is being used
+            if decision_span is None:
+                decision_span = start_detail_child_span("llm_decision_point", span, kind=trace.SpanKind.INTERNAL)
+                set_decision_span_attributes(decision_span)
+                decision_span.set_attribute("decision.result", "use_tool")
+            if chain_span is None:
+                chain_span = start_detail_child_span("tool_chain.streamed", decision_span, kind=trace.SpanKind.INTERNAL)
+            with trace.use_span(chain_span):
+                tool_futures[index] = get_tool_executor().submit(
+                    contextvars.copy_context().run, execute_tool_call, model, assembler.build(index)
+                )
+
+        for chunk in stream:
+            response_model = chunk.model or response_model
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                timer.tick()
+                answer_timer.tick()
+                content_parts.append(delta.content)
+                yield delta.content
+            for tool_call_delta in delta.tool_calls or []:
+                finished_index = assembler.add(tool_call_delta)
+                if finished_index is not None:
+                    start_tool(finished_index)
+
+        tools_started_early = len(tool_futures)
+        for index in assembler.parts:
+            if index not in tool_futures:
+                start_tool(index)
+
+        content = "".join(content_parts)
+        set_openai_response_attributes_from_parts(span, response_model, content, usage)
+        timer.record(span, token_count=usage.completion_tokens if usage else None)
+
+        if not tool_futures:
+            # No tool calls - the streamed content was the answer
+            decision_span = start_detail_child_span("llm_decision_point", span, kind=trace.SpanKind.INTERNAL)
+            set_decision_span_attributes(decision_span)
+            decision_span.set_attribute("decision.result", "direct_response")
+            result = content
+        else:
+            tool_calls = [assembler.build(index) for index in sorted(assembler.parts)]
+            decision_span.set_attribute("decision.tool_name", ",".join(tool_call.function.name for tool_call in tool_calls))
+            decision_span.set_attribute("decision.tool_call_count", len(tool_calls))
+            chain_span.update_name(get_tool_chain_span_name(tool_calls))
+            set_tool_chain_span_attributes(chain_span, tool_calls)
+            chain_span.set_attribute("chain.tools_started_early", tools_started_early)
+
+            tool_responses = [tool_futures[index].result() for index in sorted(assembler.parts)]
+            messages = build_tool_messages(prompt, tool_calls, tool_responses)
+
+            final_span = start_child_span("final_llm_call", chain_span, kind=trace.SpanKind.INTERNAL)
+            set_final_span_request_attributes(final_span, model)
+            final_span.set_attribute("llm.request.stream", True)
+            final_start = time.perf_counter()
+            with trace.use_span(final_span):
+                final_stream = create_openai_completion(
+                    "final_llm_call",
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+
+            final_timer = StreamTimer(final_start)
+            final_parts = []
+            final_usage = None
+            for chunk in final_stream:
+                if chunk.usage:
+                    final_usage = chunk.usage
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                final_timer.tick()
+                answer_timer.tick()
+                final_parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+
+            result = "".join(final_parts)
+            final_timer.record(final_span, token_count=final_usage.completion_tokens if final_usage else None)
+            set_final_span_result_attributes(final_span, result)
+            final_span.end()
+            set_tool_chain_result_attributes(chain_span, result)
+            chain_span.end()
+
+        set_decision_result_attributes(decision_span, result)
+        decision_span.end()
+
+        # Time until the user saw the first token of the answer, across every generation
+        if answer_timer.ttft_ms is not None:
+            span.set_attribute("llm.stream.answer_ttft_ms", round(answer_timer.ttft_ms, 2))
+        span.set_attribute(MessageAttributes.MESSAGE_ROLE, "assistant")
+        span.set_attribute(MessageAttributes.MESSAGE_CONTENT, result)
+        span.end()
+    except GeneratorExit:
+        # The consumer stopped iterating early; close the spans without marking an error
+        for open_span in (final_span, chain_span, decision_span, span):
+            if open_span is not None and open_span.is_recording():
+                open_span.set_attribute("span.status", "cancelled")
+                open_span.end()
+        raise
+    except Exception as error:
+        for open_span in (final_span, chain_span, decision_span, span):
+            if open_span is not None and open_span.is_recording():
+                end_span_with_error(open_span, error)
+        raise
+
+# Set the response attributes on the anthropic_call span and return the response text
+def record_anthropic_response(span, response) -> str:
+    # Update response attributes in batch
+    response_attributes = {
+        "http.response.status_code": 200,
+        "http.response.header.content_type": "application/json",
+        "llm.response.model": response.model,
+        "llm.response.usage.input_tokens": response.usage.input_tokens,
+        "llm.response.usage.output_tokens": response.usage.output_tokens,
+        # Update status attributes
+        "span.status": "success",
+        "span.status_code": 200,
+        "span.status_message": "Request completed successfully",
+    }
+    
+    set_span_attributes_batch(span, response_attributes)
+    set_transport_attributes(span)
+    
+    # Set OpenTelemetry status
+    span.set_status(Status(StatusCode.OK, "Request completed successfully"))
+    
+    from anthropic.types import TextBlock
+
+    content_block = response.content[0]
+    if isinstance(content_block, TextBlock):
+        result = content_block.text
+    else:
+        result = str(content_block)
+    assert result is not None, "Anthropic response content was None"
+    
+    # Set response attributes including OUTPUT_VALUE
+    span.set_attribute(MessageAttributes.MESSAGE_ROLE, "assistant")
+    span.set_attribute(MessageAttributes.MESSAGE_CONTENT, result)
+    span.set_attribute(SpanAttributes.OUTPUT_VALUE, result)
+    span.set_attribute(SpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
+    return result
+
+def call_anthropic(prompt: str, model: str = "claude-3-opus-20240229", history: Optional[list] = None, system: Optional[str] = None) -> str:
+    with start_call_span("anthropic_call") as span:
+        set_anthropic_request_attributes(span, model, prompt)
+        span.set_attribute("llm.request.history_message_count", len(history or []))
         
-        response = anthropic_client.messages.create(
+        response = create_anthropic_message(
+            "anthropic_call",
             model=model,
             max_tokens=1000,
-            messages=[{"role": "user", "content": prompt}]
+            **({"system": system} if system else {}),
+            messages=list(history or []) + [{"role": "user", "content": prompt}]
         )
-        
-        # Update response attributes in batch
-        response_attributes = {
+        return record_anthropic_response(span, response)
+
+def call_anthropic_stream(prompt: str, model: str = "claude-3-opus-20240229") -> Iterator[str]:
+    """Streaming version of call_anthropic that yields text as it arrives.
+
+    Text from every text content block is yielded in order; non-text blocks are counted on
+    the span but not yielded.
+    """
+    call_start = time.perf_counter()
+    span = get_tracer().start_span("anthropic_call")
+    try:
+        set_anthropic_request_attributes(span, model, prompt)
+        span.set_attribute("llm.request.stream", True)
+
+        with trace.use_span(span):
+            stream = create_anthropic_message(
+                "anthropic_call",
+                model=model,
+                max_tokens=1000,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+            )
+
+        timer = StreamTimer(call_start)
+        text_parts = []
+        block_types = []
+        response_model, input_tokens, output_tokens, stop_reason = model, None, None, None
+
+        for event in stream:
+            if event.type == "message_start":
+                response_model = event.message.model
+                input_tokens = event.message.usage.input_tokens
+            elif event.type == "content_block_start":
+                block_types.append(event.content_block.type)
+            elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                timer.tick()
+                text_parts.append(event.delta.text)
+                yield event.delta.text
+            elif event.type == "message_delta":
+                stop_reason = event.delta.stop_reason
+                output_tokens = event.usage.output_tokens
+
+        result = "".join(text_parts)
+        set_span_attributes_batch(span, {
             "http.response.status_code": 200,
-            "http.response.header.content_type": "application/json",
-            "llm.response.model": response.model,
-            "llm.response.usage.input_tokens": response.usage.input_tokens,
-            "llm.response.usage.output_tokens": response.usage.output_tokens,
-            # Update status attributes
+            "http.response.header.content_type": "text/event-stream",
+            "llm.response.model": response_model,
+            "llm.response.usage.input_tokens": input_tokens,
+            "llm.response.usage.output_tokens": output_tokens,
+            "llm.response.stop_reason": stop_reason,
+            "llm.response.content_block_count": len(block_types),
+            "llm.response.content_block_types": block_types,
             "span.status": "success",
             "span.status_code": 200,
             "span.status_message": "Request completed successfully",
-        }
-        
-        set_span_attributes_batch(span, response_attributes)
-        
-        # Set OpenTelemetry status
-        span.set_status(Status(StatusCode.OK, "Request completed successfully"))
-        
-        content_block = response.content[0]
-        if isinstance(content_block, TextBlock):
-            result = content_block.text
-        else:
-            result = str(content_block)
-        assert result is not None, "Anthropic response content was None"
-        
-        # Set response attributes including OUTPUT_VALUE
+        })
+        timer.record(span, token_count=output_tokens)
+        set_transport_attributes(span)
         span.set_attribute(MessageAttributes.MESSAGE_ROLE, "assistant")
         span.set_attribute(MessageAttributes.MESSAGE_CONTENT, result)
         span.set_attribute(SpanAttributes.OUTPUT_VALUE, result)
         span.set_attribute(SpanAttributes.OUTPUT_MIME_TYPE, "text/plain")
-        return result
+        span.set_status(Status(StatusCode.OK, "Request completed successfully"))
+        span.end()
+    except GeneratorExit:
+        # The consumer stopped iterating early; close the span without marking an error
+        span.set_attribute("span.status", "cancelled")
+        span.end()
+        raise
+    except Exception as error:
+        end_span_with_error(span, error)
+        raise
+
+# --- Session memory ---
+
+# Fold trimmed turns into the running session summary with a cheap model call
+def summarize_turns(previous_summary: str, turns: list) -> str:
+    transcript = "\n".join(f"User: {turn.prompt}\nAssistant: {turn.response}" for turn in turns)
+    response = create_openai_completion(
+        "summarize_turns",
+        model="gpt-3.5-turbo",
+        messages=[{
+            "role": "user",
+            "content": (
+                "Update the summary of this conversation in at most three sentences, keeping any "
+                "recipes, ingredients and preferences the user mentioned.\n\n"
+                f"Current summary: {previous_summary or 'None'}\n\nNew turns:\n{transcript}"
+            ),
+        }],
+    )
+    return response.choices[0].message.content or previous_summary
+
+session_memory = None
+
+def get_session_memory() -> SessionMemory:
+    """The process-wide session memory, built from the environment on first use"""
+    global session_memory
+    with _config_lock:
+        if session_memory is None:
+            # Set SESSION_STORE_PATH to share session history between worker processes on this host
+            session_store = None
+            if os.environ.get("SESSION_STORE_PATH"):
+                from session_store import SqliteSessionStore
+
+                session_store = SqliteSessionStore(
+                    os.environ["SESSION_STORE_PATH"],
+                    ttl_seconds=float(os.environ.get("SESSION_TTL_SECONDS", str(7 * 24 * 3600))),
+                )
+            session_memory = SessionMemory(
+                max_tokens_per_session=int(os.environ.get("SESSION_MAX_TOKENS", "2000")),
+                max_sessions=int(os.environ.get("SESSION_MAX_SESSIONS", "1000")),
+                max_total_tokens=int(os.environ.get("SESSION_MAX_TOTAL_TOKENS", "2000000")),
+                summarizer=summarize_turns if os.environ.get("SESSION_MEMORY_SUMMARIZE") == "1" else None,
+                store=session_store,
+            )
+    return session_memory
+
+def set_session_turn_attributes(turn_span, session_id: str, history_tokens_sent: int, turn):
+    history = get_session_memory().get(session_id)
+    set_span_attributes_batch(turn_span, {
+        "session.history.tokens_sent": history_tokens_sent,
+        "session.turn.prompt_tokens": turn.prompt_tokens,
+        "session.turn.response_tokens": turn.response_tokens,
+        "session.history.turns": len(history.turns) if history else 0,
+        "session.history.tokens": history.tokens if history else 0,
+        "session.history.trimmed_turns": history.trimmed_turns if history else 0,
+        "session.history.summarized": bool(history and history.summary),
+        "session.memory.sessions": get_session_memory().session_count,
+        "session.memory.total_tokens": get_session_memory().total_tokens,
+    })
+    turn_span.set_status(Status(StatusCode.OK))
+
+def get_history_tokens(session_id: str) -> int:
+    history = get_session_memory().get(session_id)
+    return history.tokens if history else 0
 
 def call_openai_with_session(prompt: str, session_id: str = "", user_id: str = "", model: str = "gpt-3.5-turbo") -> str:
-    """Call OpenAI with session tracking"""
+    """Call OpenAI with session tracking and the session's conversation history"""
     if not session_id:
         session_id = str(uuid.uuid4())
     if not user_id:
         user_id = ""
     with using_attributes(session_id=session_id, user_id=user_id):
-        return call_openai(prompt, model)
+        with start_detail_span("session_turn") as turn_span:
+            turn_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "chain")
+            history_tokens_sent = get_history_tokens(session_id)
+            result = call_openai(prompt, model, history=get_session_memory().openai_messages(session_id))
+            turn = get_session_memory().add_turn(session_id, prompt, result)
+            set_session_turn_attributes(turn_span, session_id, history_tokens_sent, turn)
+            return result
 
 def call_anthropic_with_session(prompt: str, session_id: str = "", user_id: str = "", model: str = "claude-3-opus-20240229") -> str:
-    """Call Anthropic with session tracking"""
+    """Call Anthropic with session tracking and the session's conversation history"""
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    if not user_id:
+        user_id = ""
+    with using_attributes(session_id=session_id, user_id=user_id):
+        with start_detail_span("session_turn") as turn_span:
+            turn_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "chain")
+            history_tokens_sent = get_history_tokens(session_id)
+            system, history = get_session_memory().anthropic_messages(session_id)
+            result = call_anthropic(prompt, model, history=history, system=system)
+            turn = get_session_memory().add_turn(session_id, prompt, result)
+            set_session_turn_attributes(turn_span, session_id, history_tokens_sent, turn)
+            return result
+
+# --- Async call paths ---
+# OpenTelemetry context and using_attributes both live in contextvars, which asyncio copies
+# into every task when it is created. Spans started with start_as_current_span inside a
+# coroutine therefore nest exactly like the sync versions, as long as tasks are created
+# inside the span/session context they belong to.
+
+async def call_openai_async(prompt: str, model: str = "gpt-3.5-turbo", history: Optional[list] = None) -> str:
+    """Async version of call_openai with the same span tree"""
+    with start_call_span("openai_call") as span:
+        tools = OPENAI_TOOLS
+        set_openai_request_attributes(span, model, prompt, tools)
+        span.set_attribute("llm.request.history_message_count", len(history or []))
+
+        # First call with tool definition
+        response = await create_openai_completion_async(
+            "openai_call",
+            model=model,
+            messages=list(history or []) + [{"role": "user", "content": prompt}],
+            tools=tools,
+        )
+
+        message = response.choices[0].message
+        set_openai_response_attributes(span, response)
+
+        # Create a decision point span to show branching
+        with start_detail_span("llm_decision_point", kind=trace.SpanKind.INTERNAL) as decision_span:
+            set_decision_span_attributes(decision_span)
+
+            if message.tool_calls:
+                tool_calls = message.tool_calls
+
+                # Mark decision as tool call path
+                decision_span.set_attribute("decision.result", "use_tool")
+                decision_span.set_attribute("decision.tool_name", ",".join(tool_call.function.name for tool_call in tool_calls))
+                decision_span.set_attribute("decision.tool_call_count", len(tool_calls))
+
+                if has_known_tool_call(tool_calls):
+                    with start_detail_span(get_tool_chain_span_name(tool_calls), kind=trace.SpanKind.INTERNAL) as chain_span:
+                        set_tool_chain_span_attributes(chain_span, tool_calls)
+
+                        tool_responses = await execute_tool_calls_async(model, tool_calls)
+                        messages = build_tool_messages(prompt, tool_calls, tool_responses, history)
+
+                        # Make a single final call with all of the tool responses
+                        with get_tracer().start_as_current_span("final_llm_call", kind=trace.SpanKind.INTERNAL) as final_span:
+                            set_final_span_request_attributes(final_span, model)
+
+                            final_response = await create_openai_completion_async(
+                                "final_llm_call",
+                                model=model,
+                                messages=messages
+                            )
+                            result = final_response.choices[0].message.content
+                            set_final_span_result_attributes(final_span, result)
+
+                        set_tool_chain_result_attributes(chain_span, result)
+                else:
+                    result = message.content
+            else:
+                # Mark decision as direct response path
+                decision_span.set_attribute("decision.result", "direct_response")
+                result = record_direct_response(model, message)
+
+            set_decision_result_attributes(decision_span, result)
+
+        assert result is not None, "OpenAI response content was None"
+        span.set_attribute(MessageAttributes.MESSAGE_ROLE, "assistant")
+        span.set_attribute(MessageAttributes.MESSAGE_CONTENT, result)
+        return result
+
+async def call_anthropic_async(prompt: str, model: str = "claude-3-opus-20240229", history: Optional[list] = None, system: Optional[str] = None) -> str:
+    """Async version of call_anthropic"""
+    with start_call_span("anthropic_call") as span:
+        set_anthropic_request_attributes(span, model, prompt)
+        span.set_attribute("llm.request.history_message_count", len(history or []))
+
+        response = await create_anthropic_message_async(
+            "anthropic_call",
+            model=model,
+            max_tokens=1000,
+            **({"system": system} if system else {}),
+            messages=list(history or []) + [{"role": "user", "content": prompt}]
+        )
+        return record_anthropic_response(span, response)
+
+async def call_openai_with_session_async(prompt: str, session_id: str = "", user_id: str = "", model: str = "gpt-3.5-turbo") -> str:
+    """Call OpenAI asynchronously with session tracking and the session's conversation history"""
     if not session_id:
         session_id = str(uuid.uuid4())
     if not user_id:
         user_id = ""
     with using_attributes(session_id=session_id, user_id=user_id):
-        return call_anthropic(prompt, model)
+        with start_detail_span("session_turn") as turn_span:
+            turn_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "chain")
+            history_tokens_sent = get_history_tokens(session_id)
+            result = await call_openai_async(prompt, model, history=get_session_memory().openai_messages(session_id))
+            # add_turn() may wait on the session store's write lock or call the summarizer model
+            turn = await asyncio.to_thread(get_session_memory().add_turn, session_id, prompt, result)
+            set_session_turn_attributes(turn_span, session_id, history_tokens_sent, turn)
+            return result
+
+async def call_anthropic_with_session_async(prompt: str, session_id: str = "", user_id: str = "", model: str = "claude-3-opus-20240229") -> str:
+    """Call Anthropic asynchronously with session tracking and the session's conversation history"""
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    if not user_id:
+        user_id = ""
+    with using_attributes(session_id=session_id, user_id=user_id):
+        with start_detail_span("session_turn") as turn_span:
+            turn_span.set_attribute(SpanAttributes.OPENINFERENCE_SPAN_KIND, "chain")
+            history_tokens_sent = get_history_tokens(session_id)
+            system, history = get_session_memory().anthropic_messages(session_id)
+            result = await call_anthropic_async(prompt, model, history=history, system=system)
+            turn = await asyncio.to_thread(get_session_memory().add_turn, session_id, prompt, result)
+            set_session_turn_attributes(turn_span, session_id, history_tokens_sent, turn)
+            return result
+
+async def gather_prompts(prompts: list[str], provider: str = "openai", model: str = "", concurrency: int = 5,
+                         session_id: str = "", user_id: str = "") -> list[str]:
+    """Run many prompts concurrently, at most `concurrency` in flight at once.
+
+    Results come back in the same order as `prompts`. If a session_id is given every prompt
+    is tagged with it, otherwise each prompt gets its own session.
+    """
+    if provider == "openai":
+        call, default_model = call_openai_async, "gpt-3.5-turbo"
+    elif provider == "anthropic":
+        call, default_model = call_anthropic_async, "claude-3-opus-20240229"
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+    model = model or default_model
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(prompt: str) -> str:
+        async with semaphore:
+            # Each prompt gets its own session unless the caller shares one across the batch
+            with using_attributes(session_id=session_id or str(uuid.uuid4()), user_id=user_id):
+                return await call(prompt, model)
+
+    # gather() wraps each coroutine in a task that copies the current context, so the
+    # caller's active span (if any) becomes the parent of every openai_call/anthropic_call span
+    return await asyncio.gather(*(run(prompt) for prompt in prompts))
 
 # Example usage with sessions:
 if __name__ == "__main__":
+    # Set up tracing and clients from the environment / .env file
+    configure()
+
+    # Open provider connections up front so the first call doesn't pay for TLS setup
+    from http_transport import prewarm_connections, get_transport_stats
+    prewarm_connections()
+
     # Create a session ID for this conversation
     session_id = str(uuid.uuid4())
     user_id = "test-user-123"
@@ -490,3 +1453,38 @@ if __name__ == "__main__":
     print("\n=== Session 2: Anthropic Response ===")
     anthropic_response = call_anthropic_with_session(test_prompt, new_session_id, user_id)
     print(f"Response: {anthropic_response}")
+
+    # Test 5: Run a batch of prompts concurrently in one session
+    print("\n=== Session 3: Concurrent Batch ===")
+    batch_session_id = str(uuid.uuid4())
+    batch_prompts = [test_prompt, test_tool_prompt, "What's the weather in Paris?"]
+    batch_responses = asyncio.run(gather_prompts(batch_prompts, concurrency=3, session_id=batch_session_id, user_id=user_id))
+    for batch_prompt, batch_response in zip(batch_prompts, batch_responses):
+        print(f"{batch_prompt} -> {batch_response}")
+
+    # Test 6: Multi-city prompt, tool calls run one after another vs concurrently
+    print("\n=== Multi-city Tool Calls: Sequential vs Parallel ===")
+    multi_city_prompt = "What's the weather in London, Paris, Tokyo and Toronto?"
+    for parallel_tools in (False, True):
+        # Otherwise both runs (and London, from Test 2) would time weather cache hits
+        tool_cache.clear()
+        start_time = time.perf_counter()
+        call_openai(multi_city_prompt, parallel_tools=parallel_tools)
+        latency = time.perf_counter() - start_time
+        print(f"parallel_tools={parallel_tools}: {latency:.2f}s")
+
+    # Test 7: Stream the answer to a tool-using prompt
+    print("\n=== Streaming Response ===")
+    for token in call_openai_stream(test_tool_prompt):
+        print(token, end="", flush=True)
+    print()
+
+    # Test 8: Stream an Anthropic response
+    print("\n=== Anthropic Streaming Response ===")
+    for token in call_anthropic_stream(test_prompt):
+        print(token, end="", flush=True)
+    print()
+
+    print(f"\nHTTP transport: {get_transport_stats()}")
+    # Retry amplification = attempts sent per call
+    print(f"Retries: {get_retry_budget().stats()}")
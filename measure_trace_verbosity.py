@@ -0,0 +1,99 @@
+"""Measure spans and CPU time per request at each trace verbosity level.
+
+Runs call_openai() and call_openai_stream() against a local mock of the chat completions
+endpoint (a tool call followed by the final answer, with the weather tool's own model call
+in between), so the numbers cover the SDK, the tracing code and span processing but not
+the network.
+
+    python measure_trace_verbosity.py [--requests 200]
+"""
+import argparse
+import json
+import time
+from typing import Optional
+
+import httpx
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+import manual_tracing
+
+
+def completion(message: dict) -> dict:
+    return {
+        "id": "chatcmpl-local",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-3.5-turbo",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", **message}}],
+        "usage": {"prompt_tokens": 20, "completion_tokens": 10, "total_tokens": 30},
+    }
+
+
+def chunk(delta: Optional[dict], usage: Optional[dict] = None) -> str:
+    choices = [] if delta is None else [{"index": 0, "finish_reason": None, "delta": delta}]
+    body = {"id": "chatcmpl-local", "object": "chat.completion.chunk", "created": 0, "model": "gpt-3.5-turbo", "choices": choices, "usage": usage}
+    return f"data: {json.dumps(body)}\n\n"
+
+
+def stream(message: dict) -> httpx.Response:
+    """The message as server-sent chat completion chunks: one per tool call or word, then usage"""
+    if message.get("tool_calls"):
+        deltas = [{"tool_calls": [{"index": index, **tool_call}]} for index, tool_call in enumerate(message["tool_calls"])]
+    else:
+        deltas = [{"content": word} for word in message["content"].split(" ")]
+    usage = {"prompt_tokens": 20, "completion_tokens": 10, "total_tokens": 30}
+    body = "".join(chunk(delta) for delta in deltas) + chunk(None, usage) + "data: [DONE]\n\n"
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body.encode())
+
+
+def handle(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    last_message = body["messages"][-1]
+    if body.get("tools") and last_message["role"] == "user":
+        city = last_message["content"].rsplit(" in ", 1)[-1].rstrip("?")
+        tool_call = {"id": "call_1", "type": "function", "function": {"name": "get_weather", "arguments": json.dumps({"city": city})}}
+        message = {"content": None, "tool_calls": [tool_call]}
+    else:
+        message = {"content": "Sunny and 21C."}
+    if body.get("stream"):
+        return stream(message)
+    return httpx.Response(200, json=completion(message))
+
+
+def call_openai_stream(prompt: str) -> str:
+    return "".join(manual_tracing.call_openai_stream(prompt))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    from openai import OpenAI
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    manual_tracing.configure(provider=provider, openai_api_key="local", anthropic_api_key="local", load_env=False)
+    manual_tracing.set_clients(openai=OpenAI(api_key="local", http_client=httpx.Client(transport=httpx.MockTransport(handle)), max_retries=0))
+
+    print(f"{'call':>20} {'verbosity':>10} {'spans/request':>14} {'attributes/request':>19} {'CPU ms/request':>15}")
+    for call in (manual_tracing.call_openai, call_openai_stream):
+        for level in manual_tracing.VERBOSITY_LEVELS:
+            manual_tracing.set_trace_verbosity(level)
+            # A new city per request so the weather tool's cache never answers
+            call(f"What's the weather in Warmup-{call.__name__}-{level}?")
+            exporter.clear()
+            cpu_start = time.process_time()
+            for index in range(args.requests):
+                call(f"What's the weather in {call.__name__}-{level}-{index}?")
+            cpu_ms = (time.process_time() - cpu_start) * 1000 / args.requests
+            spans = exporter.get_finished_spans()
+            attributes = sum(len(span.attributes) for span in spans)
+            print(f"{call.__name__:>20} {level:>10} {len(spans) / args.requests:>14.1f} {attributes / args.requests:>19.1f} {cpu_ms:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
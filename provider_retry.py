@@ -0,0 +1,258 @@
+"""Deadlines, per-attempt timeouts and a retry budget for provider calls.
+
+Every call gets an overall deadline. Each attempt's timeout is the smaller of the
+per-attempt timeout and the time left before that deadline. Retries only happen for
+retryable errors (timeouts, connection errors, 408/409/429 and 5xx), with jittered
+exponential backoff (or the server's Retry-After) that also has to fit in the deadline.
+
+Retries also draw from a process-wide budget: each call deposits `budget_ratio` tokens and
+each retry withdraws one, so under sustained failures retries stay near that fraction of
+traffic instead of multiplying load on a struggling provider. `min_retries_per_second`
+keeps a trickle of retries available when traffic is low.
+
+The per-attempt timeout is passed to the attempt, which hands it to the client as the
+request timeout, so a timed-out attempt is really stopped and its connection returned to
+the pool. httpx applies it per network operation (connect, each read, ...), so a sync
+response that keeps trickling in can outlast it; async attempts are additionally cancelled
+on the wall clock.
+
+Each attempt is traced as its own child span ("<parent>.attempt") with its number,
+timeout, latency and error, and the parent span records the attempt count.
+
+    PROVIDER_ATTEMPT_TIMEOUT_SECONDS   timeout for one attempt (default 30)
+    PROVIDER_DEADLINE_SECONDS          overall deadline for a call, retries included (default 90)
+    PROVIDER_MAX_ATTEMPTS              attempts per call, the first one included (default 3)
+    PROVIDER_RETRY_BUDGET_RATIO        retries allowed per call, on average (default 0.2)
+    PROVIDER_MIN_RETRIES_PER_SECOND    retries always allowed at low traffic (default 1)
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+# Base classes of the openai and anthropic SDK errors that are worth retrying; matched by
+# name so this module doesn't have to import either SDK
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempt_timeout_seconds: float = 30.0
+    deadline_seconds: float = 90.0
+    max_attempts: int = 3
+    backoff_base_seconds: float = 0.5
+    backoff_max_seconds: float = 8.0
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            attempt_timeout_seconds=float(os.environ.get("PROVIDER_ATTEMPT_TIMEOUT_SECONDS", cls.attempt_timeout_seconds)),
+            deadline_seconds=float(os.environ.get("PROVIDER_DEADLINE_SECONDS", cls.deadline_seconds)),
+            max_attempts=int(os.environ.get("PROVIDER_MAX_ATTEMPTS", cls.max_attempts)),
+        )
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after
+        # Full jitter keeps many callers that failed together from retrying together
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (attempt - 1)))
+
+
+class RetryBudget:
+    """Token bucket shared by every call in the process that limits retries to a fraction of calls"""
+
+    def __init__(self, ratio: float = 0.2, min_retries_per_second: float = 1.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.retries_denied = 0
+
+    @classmethod
+    def from_env(cls) -> "RetryBudget":
+        return cls(
+            ratio=float(os.environ.get("PROVIDER_RETRY_BUDGET_RATIO", "0.2")),
+            min_retries_per_second=float(os.environ.get("PROVIDER_MIN_RETRIES_PER_SECOND", "1")),
+        )
+
+    def on_call(self):
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def on_attempt(self):
+        with self._lock:
+            self.attempts += 1
+
+    def try_retry(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_tokens, self._tokens + (now - self._refilled_at) * self.min_retries_per_second)
+            self._refilled_at = now
+            if self._tokens < 1:
+                self.retries_denied += 1
+                return False
+            self._tokens -= 1
+            self.retries += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "retry.calls": self.calls,
+                "retry.attempts": self.attempts,
+                "retry.retries": self.retries,
+                "retry.retries_denied": self.retries_denied,
+                # Attempts sent per call; 1.0 means no retries at all
+                "retry.amplification": round(self.attempts / self.calls, 4) if self.calls else 0.0,
+                "retry.budget_tokens": round(self._tokens, 2),
+            }
+
+
+class DeadlineExceededError(TimeoutError):
+    """A provider call ran out of time before any attempt succeeded"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        # httpx.HTTPStatusError (from response.raise_for_status()) only carries the response
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _retry_after_seconds(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Attempts:
+    """Attempt bookkeeping shared by the sync and async retry loops"""
+
+    def __init__(self, tracer, span_name: str, policy: RetryPolicy, budget: RetryBudget, trace_attempts: bool):
+        self.tracer = tracer
+        self.trace_attempts = trace_attempts
+        self.span_name = span_name
+        self.policy = policy
+        self.budget = budget
+        self.deadline = time.monotonic() + policy.deadline_seconds
+        self.number = 0
+        budget.on_call()
+
+    def start(self):
+        """Start the next attempt's span and return (span, timeout); raises when out of time"""
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"{self.span_name} deadline of {self.policy.deadline_seconds}s exceeded after {self.number} attempts")
+        self.number += 1
+        self.budget.on_attempt()
+        timeout = min(self.policy.attempt_timeout_seconds, remaining)
+        if not self.trace_attempts:
+            # Keep the parent current so anything the attempt starts stays in its trace
+            return trace.NonRecordingSpan(trace.get_current_span().get_span_context()), timeout
+        span = self.tracer.start_span(f"{self.span_name}.attempt", kind=trace.SpanKind.CLIENT)
+        span.set_attribute("retry.attempt", self.number)
+        span.set_attribute("retry.attempt_timeout_seconds", round(timeout, 3))
+        return span, timeout
+
+    def succeeded(self, span, started: float):
+        span.set_attribute("retry.attempt_latency_ms", round((time.perf_counter() - started) * 1000, 2))
+        span.set_status(Status(StatusCode.OK))
+        span.end()
+        self.record_on_parent()
+
+    def failed(self, span, started: float, error: BaseException) -> Optional[float]:
+        """End the attempt's span; return how long to wait before retrying, or None to give up"""
+        span.set_attribute("retry.attempt_latency_ms", round((time.perf_counter() - started) * 1000, 2))
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+        retryable = is_retryable(error)
+        span.set_attribute("retry.retryable", retryable)
+        span.end()
+        if not retryable or self.number >= self.policy.max_attempts:
+            self.record_on_parent()
+            return None
+        delay = self.policy.backoff(self.number, error)
+        if time.monotonic() + delay >= self.deadline:
+            self.record_on_parent(give_up_reason="deadline")
+            return None
+        if not self.budget.try_retry():
+            self.record_on_parent(give_up_reason="retry_budget")
+            return None
+        return delay
+
+    def record_on_parent(self, give_up_reason: Optional[str] = None):
+        parent = trace.get_current_span()
+        parent.set_attribute("retry.attempts", self.number)
+        if give_up_reason:
+            parent.set_attribute("retry.give_up_reason", give_up_reason)
+
+
+def call_with_retries(tracer, span_name: str, attempt: Callable[[float], T], policy: RetryPolicy, budget: RetryBudget,
+                      trace_attempts: bool = True) -> T:
+    """Run attempt(timeout_seconds) until it succeeds, each try in a child span of the current span.
+
+    With `trace_attempts` off no attempt spans are created; the attempt count is still
+    recorded on the current span.
+    """
+    attempts = _Attempts(tracer, span_name, policy, budget, trace_attempts)
+    while True:
+        span, timeout = attempts.start()
+        started = time.perf_counter()
+        try:
+            with trace.use_span(span, record_exception=False, set_status_on_exception=False):
+                result = attempt(timeout)
+        except Exception as error:
+            delay = attempts.failed(span, started, error)
+            if delay is None:
+                raise
+            time.sleep(delay)
+        else:
+            attempts.succeeded(span, started)
+            return result
+
+
+async def call_with_retries_async(tracer, span_name: str, attempt: Callable[[float], Awaitable[T]], policy: RetryPolicy, budget: RetryBudget,
+                                  trace_attempts: bool = True) -> T:
+    """Async version of call_with_retries"""
+    attempts = _Attempts(tracer, span_name, policy, budget, trace_attempts)
+    while True:
+        span, timeout = attempts.start()
+        started = time.perf_counter()
+        try:
+            with trace.use_span(span, record_exception=False, set_status_on_exception=False):
+                # Enforced here too, in case the client ignores the per-request timeout
+                result = await asyncio.wait_for(attempt(timeout), timeout)
+        except Exception as error:
+            delay = attempts.failed(span, started, error)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            attempts.succeeded(span, started)
+            return result
@@ -0,0 +1,195 @@
+"""Rate, errors and duration (RED) metrics derived from finished spans, served locally.
+
+RedMetricsProcessor is an OpenTelemetry span processor. For every span that ends it
+updates in-process counters and a fixed-bucket duration histogram keyed by span name,
+model and provider, plus token counters for LLM spans. Nothing is sent anywhere. The
+numbers are rendered in the Prometheus text format, and start_metrics_server() serves
+them on /metrics so dashboards and alerts don't have to round-trip through Arize or Phoenix.
+
+    RED_METRICS_PORT     port for the /metrics endpoint (unset = no server)
+    RED_METRICS_HOST     interface the endpoint binds to (default 127.0.0.1, local only)
+    RED_METRICS_BUCKETS  comma-separated duration bucket bounds in milliseconds
+"""
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.trace import StatusCode
+from openinference.semconv.trace import SpanAttributes
+
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Token counts are read from the OpenInference attributes (set by the auto-instrumentors)
+# or from the llm.response.usage.* attributes the manual spans record
+TOKEN_ATTRIBUTES = {
+    "prompt": (SpanAttributes.LLM_TOKEN_COUNT_PROMPT, "llm.response.usage.prompt_tokens", "llm.response.usage.input_tokens"),
+    "completion": (SpanAttributes.LLM_TOKEN_COUNT_COMPLETION, "llm.response.usage.completion_tokens", "llm.response.usage.output_tokens"),
+}
+
+
+class SpanSeries:
+    """Counters and histogram buckets for one (span name, model, provider) combination"""
+
+    __slots__ = ("count", "errors", "duration_sum_ms", "bucket_counts", "tokens")
+
+    def __init__(self, bucket_count: int):
+        self.count = 0
+        self.errors = 0
+        self.duration_sum_ms = 0.0
+        # One slot per bucket bound plus the +Inf overflow; made cumulative when rendered
+        self.bucket_counts = [0] * (bucket_count + 1)
+        self.tokens = {kind: 0 for kind in TOKEN_ATTRIBUTES}
+
+
+class RedMetrics:
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self._series: dict[tuple[str, str, str], SpanSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, model: str, provider: str, duration_ms: float, error: bool, tokens: dict[str, int]):
+        key = (name, model, provider)
+        bucket = bisect_left(self.buckets_ms, duration_ms)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = SpanSeries(len(self.buckets_ms))
+            series.count += 1
+            series.errors += error
+            series.duration_sum_ms += duration_ms
+            series.bucket_counts[bucket] += 1
+            for kind, count in tokens.items():
+                series.tokens[kind] += count
+
+    def snapshot(self) -> dict[tuple[str, str, str], SpanSeries]:
+        """Copy of every series, taken under the lock so a scrape sees consistent numbers"""
+        with self._lock:
+            copies = {}
+            for key, series in self._series.items():
+                copy = SpanSeries(len(self.buckets_ms))
+                copy.count, copy.errors, copy.duration_sum_ms = series.count, series.errors, series.duration_sum_ms
+                copy.bucket_counts = list(series.bucket_counts)
+                copy.tokens = dict(series.tokens)
+                copies[key] = copy
+            return copies
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP span_requests_total Finished spans",
+            "# TYPE span_requests_total counter",
+        ]
+        snapshot = sorted(self.snapshot().items())
+        for key, series in snapshot:
+            lines.append(f"span_requests_total{{{_labels(key)}}} {series.count}")
+        lines += ["# HELP span_errors_total Finished spans with an error status", "# TYPE span_errors_total counter"]
+        for key, series in snapshot:
+            lines.append(f"span_errors_total{{{_labels(key)}}} {series.errors}")
+        lines += ["# HELP span_duration_milliseconds Span duration", "# TYPE span_duration_milliseconds histogram"]
+        for key, series in snapshot:
+            labels = _labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets_ms, series.bucket_counts):
+                cumulative += count
+                lines.append(f'span_duration_milliseconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'span_duration_milliseconds_bucket{{{labels},le="+Inf"}} {series.count}')
+            lines.append(f"span_duration_milliseconds_sum{{{labels}}} {series.duration_sum_ms:.3f}")
+            lines.append(f"span_duration_milliseconds_count{{{labels}}} {series.count}")
+        lines += ["# HELP llm_tokens_total Tokens reported on LLM spans", "# TYPE llm_tokens_total counter"]
+        for key, series in snapshot:
+            for kind, count in series.tokens.items():
+                if count:
+                    lines.append(f'llm_tokens_total{{{_labels(key)},kind="{kind}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key: tuple[str, str, str]) -> str:
+    name, model, provider = key
+    return f'span_name="{_escape(name)}",model="{_escape(model)}",provider="{_escape(provider)}"'
+
+
+class RedMetricsProcessor(SpanProcessor):
+    """Feeds every finished span into a RedMetrics aggregate; does no I/O on the span path"""
+
+    def __init__(self, metrics: RedMetrics):
+        self.metrics = metrics
+
+    def on_end(self, span: ReadableSpan):
+        attributes = span.attributes or {}
+        tokens = {}
+        for kind, names in TOKEN_ATTRIBUTES.items():
+            for name in names:
+                value = attributes.get(name)
+                if isinstance(value, int):
+                    tokens[kind] = value
+                    break
+        self.metrics.observe(
+            span.name,
+            str(attributes.get(SpanAttributes.LLM_MODEL_NAME, "")),
+            str(attributes.get(SpanAttributes.LLM_PROVIDER, "")),
+            (span.end_time - span.start_time) / 1e6,
+            span.status.status_code == StatusCode.ERROR,
+            tokens,
+        )
+
+
+def start_metrics_server(metrics: RedMetrics, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve metrics.render_prometheus() on http://host:port/metrics from a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="red-metrics-server", daemon=True).start()
+    return server
+
+
+def install(tracer_provider, port=None) -> RedMetrics:
+    """Attach a RedMetricsProcessor to the provider, serving /metrics if a port is given"""
+    buckets = os.environ.get("RED_METRICS_BUCKETS")
+    metrics = RedMetrics([float(bound) for bound in buckets.split(",")] if buckets else DEFAULT_BUCKETS_MS)
+    tracer_provider.add_span_processor(RedMetricsProcessor(metrics))
+    if port is not None:
+        start_metrics_server(metrics, int(port), os.environ.get("RED_METRICS_HOST", "127.0.0.1"))
+    return metrics
+
+
+# Measure the per-span cost of the processor
+if __name__ == "__main__":
+    import time
+
+    from opentelemetry.sdk.trace import TracerProvider
+
+    span_count = 100_000
+    timings = {}
+    for label, with_metrics in (("without metrics", False), ("with metrics", True)):
+        provider = TracerProvider()
+        metrics = install(provider) if with_metrics else None
+        bench_tracer = provider.get_tracer(__name__)
+        start = time.perf_counter()
+        for index in range(span_count):
+            with bench_tracer.start_as_current_span("llm_call") as span:
+                span.set_attribute(SpanAttributes.LLM_MODEL_NAME, "gpt-3.5-turbo")
+                span.set_attribute(SpanAttributes.LLM_PROVIDER, "openai")
+                span.set_attribute(SpanAttributes.LLM_TOKEN_COUNT_PROMPT, 20)
+        timings[label] = (time.perf_counter() - start) / span_count * 1e6
+        print(f"{label}: {timings[label]:.2f} us per span")
+    print(f"Processor overhead: {timings['with metrics'] - timings['without metrics']:.2f} us per span")
+    print(metrics.render_prometheus()[:600])
@@ -0,0 +1,215 @@
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, replace
+from typing import Callable, Optional
+
+
+# One user prompt and the assistant's reply, with their token counts
+@dataclass
+class Turn:
+    prompt: str
+    response: str
+    prompt_tokens: int
+    response_tokens: int
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.response_tokens
+
+
+@dataclass
+class SessionHistory:
+    turns: deque = field(default_factory=deque)
+    # Running summary of turns that were trimmed out of the token budget
+    summary: str = ""
+    summary_tokens: int = 0
+    tokens: int = 0
+    trimmed_turns: int = 0
+
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Approximate token count using the cl100k_base encoding (loaded on first use)"""
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text or ""))
+
+
+class SessionMemory:
+    """Per-session conversation history held under a token budget.
+
+    Each session keeps at most `max_tokens_per_session` tokens of history. When a new turn
+    pushes it over, the oldest turns are dropped, or folded into a running summary if a
+    `summarizer` is given. Across sessions, least recently used sessions are evicted while
+    there are more than `max_sessions` or more than `max_total_tokens` tokens held in total.
+
+    With a `store` (see session_store.py) the store is the source of truth: sessions are
+    re-read from it on every lookup, so any worker process can serve any session, and every
+    new turn is written through to it. The in-process sessions then act as a bounded cache.
+    """
+
+    def __init__(
+        self,
+        max_tokens_per_session: int = 2000,
+        max_sessions: int = 1000,
+        max_total_tokens: int = 2_000_000,
+        summarizer: Optional[Callable[[str, list[Turn]], str]] = None,
+        token_counter: Callable[[str], int] = count_tokens,
+        store=None,
+    ):
+        self.max_tokens_per_session = max_tokens_per_session
+        self.max_sessions = max_sessions
+        self.max_total_tokens = max_total_tokens
+        self.summarizer = summarizer
+        self.count_tokens = token_counter
+        self.store = store
+        self._sessions: OrderedDict[str, SessionHistory] = OrderedDict()
+        self._total_tokens = 0
+        self._lock = threading.Lock()
+
+    def _refresh_from_store(self, session_id: str):
+        stored = self.store.load(session_id)
+        with self._lock:
+            local = self._sessions.pop(session_id, None)
+            if local is not None:
+                self._total_tokens -= local.tokens
+            if stored is not None:
+                self._sessions[session_id] = stored
+                self._total_tokens += stored.tokens
+
+    def get(self, session_id: str) -> Optional[SessionHistory]:
+        if self.store is not None:
+            self._refresh_from_store(session_id)
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is not None:
+                self._sessions.move_to_end(session_id)
+            return history
+
+    def openai_messages(self, session_id: str) -> list[dict]:
+        """History as OpenAI chat messages, with any summary as a leading system message"""
+        history = self.get(session_id)
+        if history is None:
+            return []
+        messages = []
+        if history.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {history.summary}"})
+        for turn in list(history.turns):
+            messages.append({"role": "user", "content": turn.prompt})
+            messages.append({"role": "assistant", "content": turn.response})
+        return messages
+
+    def anthropic_messages(self, session_id: str) -> tuple[Optional[str], list[dict]]:
+        """History as (system prompt, messages) for the Anthropic messages API"""
+        history = self.get(session_id)
+        if history is None:
+            return None, []
+        system = f"Summary of the earlier conversation: {history.summary}" if history.summary else None
+        messages = []
+        for turn in list(history.turns):
+            messages.append({"role": "user", "content": turn.prompt})
+            messages.append({"role": "assistant", "content": turn.response})
+        return system, messages
+
+    def add_turn(self, session_id: str, prompt: str, response: str) -> Turn:
+        turn = Turn(prompt, response, self.count_tokens(prompt), self.count_tokens(response))
+        if self.store is not None:
+            # Appended inside one store transaction, so concurrent workers don't lose turns
+            history, trimmed = self.store.update(session_id, lambda stored: self._append(stored, turn))
+        else:
+            with self._lock:
+                history = self._copy(self._sessions.get(session_id))
+                trimmed = self._append(history, turn)
+                self._cache(session_id, history)
+        # Summarize outside the lock and the store transaction, it may call a model
+        if trimmed and self.summarizer is not None:
+            history = self._summarize(session_id, history, trimmed)
+        with self._lock:
+            if self.store is not None and history is not None:
+                self._cache(session_id, history)
+            self._evict()
+        return turn
+
+    @staticmethod
+    def _copy(history: Optional[SessionHistory]) -> SessionHistory:
+        # Cached histories are replaced rather than changed in place, so _total_tokens always
+        # matches the histories it counts, even when one is evicted while being updated
+        return replace(history, turns=deque(history.turns)) if history is not None else SessionHistory()
+
+    def _cache(self, session_id: str, history: SessionHistory):
+        local = self._sessions.pop(session_id, None)
+        if local is not None:
+            self._total_tokens -= local.tokens
+        self._sessions[session_id] = history
+        self._total_tokens += history.tokens
+
+    def _append(self, history: SessionHistory, turn: Turn) -> list[Turn]:
+        history.turns.append(turn)
+        history.tokens += turn.tokens
+        return self._trim(history)
+
+    def _trim(self, history: SessionHistory) -> list[Turn]:
+        # Drop the oldest turns until the session fits, always keeping the latest one
+        trimmed = []
+        while history.tokens > self.max_tokens_per_session and len(history.turns) > 1:
+            turn = history.turns.popleft()
+            history.tokens -= turn.tokens
+            history.trimmed_turns += 1
+            trimmed.append(turn)
+        return trimmed
+
+    def _summarize(self, session_id: str, history: SessionHistory, trimmed: list[Turn]) -> Optional[SessionHistory]:
+        """Fold trimmed turns into the session's summary; returns the updated history"""
+        previous = history.summary
+        while True:
+            summary = self.summarizer(previous, trimmed)
+            summary_tokens = self.count_tokens(summary)
+
+            def apply(stored: SessionHistory) -> bool:
+                # Another turn's summary landed first; summarize on top of it instead
+                if stored.summary != previous:
+                    return False
+                stored.tokens += summary_tokens - stored.summary_tokens
+                stored.summary, stored.summary_tokens = summary, summary_tokens
+                return True
+
+            if self.store is not None:
+                history, applied = self.store.update(session_id, apply)
+            else:
+                with self._lock:
+                    current = self._sessions.get(session_id)
+                    if current is None:
+                        # Evicted or cleared meanwhile
+                        return None
+                    history = self._copy(current)
+                    applied = apply(history)
+                    if applied:
+                        self._cache(session_id, history)
+            if applied:
+                return history
+            previous = history.summary
+
+    def _evict(self):
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._total_tokens > self.max_total_tokens):
+            _, history = self._sessions.popitem(last=False)
+            self._total_tokens -= history.tokens
+
+    def clear(self, session_id: str):
+        with self._lock:
+            history = self._sessions.pop(session_id, None)
+            if history is not None:
+                self._total_tokens -= history.tokens
+        if self.store is not None:
+            self.store.delete(session_id)
+
+    @property
+    def session_count(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def total_tokens(self) -> int:
+        return self._total_tokens
@@ -0,0 +1,201 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Callable, Optional, TypeVar
+
+import orjson
+
+from session_memory import SessionHistory, Turn
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+# --- Serialization ---
+# A session is stored as one zlib-compressed orjson array prefixed with a format version
+# byte: [summary, summary_tokens, trimmed_turns, [[prompt, response, prompt_tokens, response_tokens], ...]]
+
+FORMAT_VERSION = 1
+
+def serialize_history(history: SessionHistory) -> bytes:
+    payload = [
+        history.summary,
+        history.summary_tokens,
+        history.trimmed_turns,
+        [[turn.prompt, turn.response, turn.prompt_tokens, turn.response_tokens] for turn in history.turns],
+    ]
+    return bytes([FORMAT_VERSION]) + zlib.compress(orjson.dumps(payload), 6)
+
+def deserialize_history(data: bytes) -> SessionHistory:
+    if data[0] != FORMAT_VERSION:
+        raise ValueError(f"Unknown session format version: {data[0]}")
+    summary, summary_tokens, trimmed_turns, turns = orjson.loads(zlib.decompress(data[1:]))
+    history = SessionHistory(
+        turns=deque(Turn(*turn) for turn in turns),
+        summary=summary,
+        summary_tokens=summary_tokens,
+        trimmed_turns=trimmed_turns,
+    )
+    history.tokens = summary_tokens + sum(turn.tokens for turn in history.turns)
+    return history
+
+
+class SqliteSessionStore:
+    """Durable session history store shared by every worker process on a host.
+
+    Sessions live in one SQLite file in WAL mode, so many processes can read while one
+    writes. Lookups go through the session_id primary key, expired sessions are removed by
+    a background compaction thread, and free pages are handed back incrementally.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, compaction_interval_seconds: Optional[float] = 300):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        # sqlite3 connections can't be shared across threads, so keep one per thread (and
+        # a list of all of them, for close())
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._create_schema()
+        self._compactor = None
+        if compaction_interval_seconds:
+            self._compactor = threading.Thread(
+                target=self._compaction_loop, args=(compaction_interval_seconds,), name="session-store-compaction", daemon=True
+            )
+            self._compactor.start()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Only the creating thread uses it, but close() may run on another thread
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _create_schema(self):
+        connection = self._connection()
+        # auto_vacuum only takes effect on a new database, before the first table exists
+        connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def load(self, session_id: str) -> Optional[SessionHistory]:
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, time.time())
+        ).fetchone()
+        return deserialize_history(row[0]) if row else None
+
+    def save(self, session_id: str, history: SessionHistory):
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO sessions (session_id, data, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, tokens = excluded.tokens,"
+            " updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+            (session_id, serialize_history(history), history.tokens, now, now + self.ttl_seconds),
+        )
+
+    def update(self, session_id: str, apply: Callable[[SessionHistory], T]) -> tuple[SessionHistory, T]:
+        """Load a session, change it with `apply` and save it, in one write transaction.
+
+        BEGIN IMMEDIATE takes the database write lock before the read, so concurrent updates
+        from other threads and processes wait their turn instead of overwriting each other.
+        Returns the saved history and what `apply` returned.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            history = self.load(session_id) or SessionHistory()
+            result = apply(history)
+            self.save(session_id, history)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return history, result
+
+    def delete(self, session_id: str):
+        self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def compact(self, vacuum_pages: int = 1000) -> int:
+        """Delete expired sessions and release up to `vacuum_pages` free pages; returns rows deleted"""
+        connection = self._connection()
+        deleted = connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+        connection.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+        connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return deleted
+
+    def _compaction_loop(self, interval_seconds: float):
+        while not self._stop.wait(interval_seconds):
+            try:
+                self.compact()
+            except sqlite3.OperationalError as error:
+                # Another process holds the write lock; try again next interval
+                logger.warning("Session store compaction skipped: %s", error)
+
+    def close(self):
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+
+# Benchmark read/write latency with 100k sessions
+if __name__ == "__main__":
+    import random
+    import tempfile
+
+    session_count = int(os.environ.get("SESSION_BENCH_COUNT", "100000"))
+
+    def percentiles(samples: list[float]) -> str:
+        samples = sorted(samples)
+        p50 = samples[len(samples) // 2] * 1e6
+        p99 = samples[int(len(samples) * 0.99)] * 1e6
+        return f"p50={p50:.1f}us p99={p99:.1f}us"
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SqliteSessionStore(os.path.join(directory, "sessions.db"), compaction_interval_seconds=None)
+        history = SessionHistory()
+        for index in range(3):
+            history.turns.append(Turn(f"What's a dinner recipe using eggs and spinach? ({index})", "Spinach and egg fried rice. " * 20, 15, 120))
+        history.tokens = sum(turn.tokens for turn in history.turns)
+        print(f"Serialized session size: {len(serialize_history(history))} bytes")
+
+        write_times = []
+        for index in range(session_count):
+            start = time.perf_counter()
+            store.save(f"session-{index}", history)
+            write_times.append(time.perf_counter() - start)
+        print(f"Writes ({session_count}): {percentiles(write_times)}")
+
+        read_times = []
+        for _ in range(session_count):
+            session_id = f"session-{random.randrange(session_count)}"
+            start = time.perf_counter()
+            store.load(session_id)
+            read_times.append(time.perf_counter() - start)
+        print(f"Reads ({session_count}): {percentiles(read_times)}")
+        print(f"Database size: {os.path.getsize(os.path.join(directory, 'sessions.db')) / 1e6:.1f} MB")
+        store.close()
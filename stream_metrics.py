@@ -0,0 +1,57 @@
+import time
+from typing import Optional
+
+
+class StreamTimer:
+    """Collects time-to-first-token and inter-token gaps for one streamed generation.
+
+    Everything is summarized onto the span in record(): a single "first_token" event plus
+    aggregate attributes, never one span event per token.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = start if start is not None else time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.token_count = 0
+        self.gaps: list[float] = []
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.gaps.append(now - self.last_token_at)
+        self.last_token_at = now
+        self.token_count += 1
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return (self.first_token_at - self.start) * 1000
+
+    def tokens_per_second(self, token_count: Optional[int] = None) -> Optional[float]:
+        """Output rate after the first token, using the provider's token count if known"""
+        if self.first_token_at is None or self.last_token_at == self.first_token_at:
+            return None
+        tokens = token_count if token_count is not None else self.token_count
+        return tokens / (self.last_token_at - self.first_token_at)
+
+    def record(self, span, prefix: str = "llm.stream", token_count: Optional[int] = None):
+        span.set_attribute(f"{prefix}.chunk_count", self.token_count)
+        if self.ttft_ms is None:
+            return
+        ttft_ms = round(self.ttft_ms, 2)
+        span.add_event("first_token", {f"{prefix}.ttft_ms": ttft_ms})
+        span.set_attribute(f"{prefix}.ttft_ms", ttft_ms)
+        span.set_attribute(f"{prefix}.duration_ms", round((self.last_token_at - self.start) * 1000, 2))
+        tokens_per_second = self.tokens_per_second(token_count)
+        if tokens_per_second is not None:
+            span.set_attribute(f"{prefix}.tokens_per_second", round(tokens_per_second, 2))
+        if self.gaps:
+            gaps_ms = sorted(gap * 1000 for gap in self.gaps)
+            span.set_attribute(f"{prefix}.inter_token_ms.mean", round(sum(gaps_ms) / len(gaps_ms), 2))
+            span.set_attribute(f"{prefix}.inter_token_ms.p50", round(gaps_ms[len(gaps_ms) // 2], 2))
+            span.set_attribute(f"{prefix}.inter_token_ms.p95", round(gaps_ms[min(len(gaps_ms) - 1, int(len(gaps_ms) * 0.95))], 2))
+            span.set_attribute(f"{prefix}.inter_token_ms.max", round(gaps_ms[-1], 2))
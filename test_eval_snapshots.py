@@ -0,0 +1,82 @@
+import glob
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from eval_snapshots import compact_snapshot, iter_snapshot_batches, load_snapshot, write_snapshot
+
+
+def spans(rows: dict[str, tuple[str, str]]) -> pd.DataFrame:
+    """Span id -> (start time, model) as a query_spans()-like frame"""
+    start = pd.to_datetime([start for start, _ in rows.values()], utc=True)
+    return pd.DataFrame(
+        {
+            "input": [f"input {span_id}" for span_id in rows],
+            "output": [f"output {span_id}" for span_id in rows],
+            "start_time": start,
+            "end_time": start + pd.Timedelta(seconds=2),
+            "model": [model for _, model in rows.values()],
+        },
+        index=pd.Index(list(rows), name="context.span_id"),
+    )
+
+
+class WriteSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def test_overlapping_export_keeps_stored_categories(self):
+        write_snapshot(spans({"a": ("2026-01-01T10:00", "gpt-4o"), "b": ("2026-01-01T11:00", "gpt-4o")}), self.root)
+        # Same day, only models the first batch didn't have: b is re-exported, c and d are new
+        write_snapshot(
+            spans({"b": ("2026-01-01T11:00", "gpt-4.1"), "c": ("2026-01-01T12:00", "gpt-4.1"), "d": ("2026-01-02T09:00", None)}),
+            self.root,
+        )
+
+        loaded = load_snapshot(self.root).sort_index()
+        self.assertEqual(list(loaded.index), ["a", "b", "c", "d"])
+        self.assertEqual(loaded["model"].tolist()[:3], ["gpt-4o", "gpt-4.1", "gpt-4.1"])
+        self.assertTrue(pd.isna(loaded.loc["d", "model"]))
+        self.assertEqual(loaded.loc["a", "input"], "input a")
+        self.assertIsInstance(loaded["model"].dtype, pd.CategoricalDtype)
+        self.assertEqual(loaded["input"].dtype, pd.StringDtype("pyarrow"))
+
+    def test_reexporting_the_same_window_is_idempotent(self):
+        batch = spans({"a": ("2026-01-01T10:00", "gpt-4o"), "b": ("2026-01-01T11:00", "gpt-4.1")})
+        write_snapshot(batch, self.root)
+        write_snapshot(batch, self.root)
+
+        loaded = load_snapshot(self.root).sort_index()
+        self.assertEqual(list(loaded.index), ["a", "b"])
+        self.assertEqual(loaded["model"].tolist(), ["gpt-4o", "gpt-4.1"])
+
+    def test_exports_add_part_files_and_reads_keep_the_latest_copy(self):
+        write_snapshot(spans({"a": ("2026-01-01T10:00", "gpt-4o"), "b": ("2026-01-01T11:00", "gpt-4o")}), self.root)
+        first_parts = set(glob.glob(os.path.join(self.root, "date=2026-01-01", "*.parquet")))
+        write_snapshot(spans({"b": ("2026-01-01T11:00", "gpt-4.1")}), self.root)
+        parts = set(glob.glob(os.path.join(self.root, "date=2026-01-01", "*.parquet")))
+        self.assertTrue(first_parts < parts)
+
+        batches = list(iter_snapshot_batches(self.root, batch_rows=1))
+        self.assertEqual(sorted(span_id for batch in batches for span_id in batch.index), ["a", "b"])
+        self.assertEqual(pd.concat(batches).loc["b", "model"], "gpt-4.1")
+
+        self.assertEqual(compact_snapshot(self.root), 1)
+        self.assertEqual(len(glob.glob(os.path.join(self.root, "date=2026-01-01", "*.parquet"))), 1)
+        loaded = load_snapshot(self.root).sort_index()
+        self.assertEqual(loaded["model"].tolist(), ["gpt-4o", "gpt-4.1"])
+
+    def test_metadata_is_kept(self):
+        batch = spans({"a": ("2026-01-01T10:00", "gpt-4o"), "b": ("2026-01-01T11:00", "gpt-4o")})
+        batch["metadata"] = [{"eval.traffic": "judge"}, None]
+        write_snapshot(batch, self.root)
+
+        loaded = load_snapshot(self.root).sort_index()
+        self.assertIn("eval.traffic", loaded.loc["a", "metadata"])
+        self.assertTrue(pd.isna(loaded.loc["b", "metadata"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
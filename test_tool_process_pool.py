@@ -0,0 +1,48 @@
+import os
+import socket
+import sys
+import types
+import unittest
+from functools import partial
+from unittest import mock
+
+from opentelemetry.sdk.trace import TracerProvider
+
+import manual_tracing
+from tool_process_pool import ProcessToolPool
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure_offline_worker(config: dict):
+    """manual_tracing.configure_worker, with Arize registration kept in-process"""
+    arize_otel = types.ModuleType("arize.otel")
+    arize_otel.register = lambda **kwargs: TracerProvider()
+    with mock.patch.dict(sys.modules, {"arize": types.ModuleType("arize"), "arize.otel": arize_otel}):
+        manual_tracing.configure_worker(config)
+
+
+def worker_state():
+    return manual_tracing._configured, manual_tracing.red_metrics, manual_tracing.flight_recorder
+
+
+class ToolProcessPoolTest(unittest.TestCase):
+    def test_workers_leave_the_metrics_and_dump_ports_to_the_main_process(self):
+        ports = {"RED_METRICS_PORT": str(free_port()), "FLIGHT_RECORDER_PORT": str(free_port())}
+        with mock.patch.dict(os.environ, {**ports, "ARIZE_SPACE_ID": "space", "ARIZE_API_KEY": "key"}):
+            # The main process serves both ports, so a worker binding them would fail to start
+            manual_tracing.configure(provider=TracerProvider(), load_env=False)
+            self.assertIsNotNone(manual_tracing.flight_recorder)
+            pool = ProcessToolPool(2, setup=partial(configure_offline_worker, dict(manual_tracing._worker_config)))
+            try:
+                self.assertEqual(pool.run("tool_process.worker_state", worker_state), (True, None, None))
+            finally:
+                pool.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from cachetools import TTLCache
+
+
+# How long a tool's results stay valid and how many of them to keep
+@dataclass(frozen=True)
+class CachePolicy:
+    ttl_seconds: float
+    max_entries: int = 256
+    # Treat "London" and " london" as the same call
+    case_insensitive: bool = False
+
+
+def canonicalize_args(args: dict, case_insensitive: bool = False) -> str:
+    """Turn tool arguments into a stable cache key (sorted keys, trimmed strings)"""
+    def normalize(value: Any) -> Any:
+        if isinstance(value, str):
+            value = value.strip()
+            return value.casefold() if case_insensitive else value
+        if isinstance(value, dict):
+            return {key: normalize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [normalize(item) for item in value]
+        return value
+
+    return json.dumps(normalize(args), sort_keys=True, separators=(",", ":"))
+
+
+class ToolResultCache:
+    """Per-tool TTL cache for tool results, keyed on (tool name, canonicalized arguments).
+
+    Each tool with a registered CachePolicy gets its own size-bounded TTLCache, so a chatty
+    tool can't evict another tool's entries. Tools without a policy are never cached.
+    """
+
+    def __init__(self, policies: Optional[dict[str, CachePolicy]] = None):
+        self._policies: dict[str, CachePolicy] = {}
+        self._caches: dict[str, TTLCache] = {}
+        # Tools run concurrently on the tool pool, and TTLCache is not thread safe
+        self._lock = threading.Lock()
+        for tool_name, policy in (policies or {}).items():
+            self.register(tool_name, policy)
+
+    def register(self, tool_name: str, policy: CachePolicy):
+        with self._lock:
+            self._policies[tool_name] = policy
+            self._caches[tool_name] = TTLCache(maxsize=policy.max_entries, ttl=policy.ttl_seconds, timer=time.monotonic)
+
+    def is_cached_tool(self, tool_name: str) -> bool:
+        return tool_name in self._policies
+
+    def _key(self, tool_name: str, args: dict) -> str:
+        return canonicalize_args(args, self._policies[tool_name].case_insensitive)
+
+    def get(self, tool_name: str, args: dict) -> Optional[tuple[str, float]]:
+        """Return (result, age in seconds) for a live entry, or None on a miss"""
+        if not self.is_cached_tool(tool_name):
+            return None
+        key = self._key(tool_name, args)
+        with self._lock:
+            entry = self._caches[tool_name].get(key)
+        if entry is None:
+            return None
+        result, stored_at = entry
+        return result, time.monotonic() - stored_at
+
+    def set(self, tool_name: str, args: dict, result: str):
+        if not self.is_cached_tool(tool_name):
+            return
+        key = self._key(tool_name, args)
+        with self._lock:
+            self._caches[tool_name][key] = (result, time.monotonic())
+
+    def clear(self, tool_name: Optional[str] = None):
+        with self._lock:
+            for name, cache in self._caches.items():
+                if tool_name is None or name == tool_name:
+                    cache.clear()
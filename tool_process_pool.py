@@ -0,0 +1,111 @@
+"""Run tool handlers in a pool of worker processes, traced as part of the caller's trace.
+
+Threads are fine for tools that wait on the network, but a CPU-heavy tool holds the GIL
+and a misbehaving one can take the whole app down. ProcessToolPool runs such tools in
+separate processes instead. The caller's span context is sent with each task as a W3C
+`traceparent` header, and the worker opens a `tool_process.<name>` span from it, so the
+worker's spans are real children in the same trace rather than a separate trace joined by
+a link.
+
+Workers are started with "spawn" by default (TOOL_PROCESS_START_METHOD), because forking a
+process that already runs thread pools and HTTP clients can deadlock. Spawned workers
+re-import the main module, so scripts using the pool need an `if __name__ == "__main__":`
+guard. A `setup` callable runs once in each worker, typically to configure tracing; spans
+still buffered in a worker are flushed when it exits.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from typing import Callable, Optional
+
+from opentelemetry import trace
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+_propagator = TraceContextTextMapPropagator()
+
+
+def inject_trace_context() -> dict:
+    """The current span context as W3C trace context headers (traceparent, tracestate)"""
+    carrier: dict[str, str] = {}
+    _propagator.inject(carrier)
+    return carrier
+
+
+def _init_worker(setup: Optional[Callable[[], None]]):
+    if setup is not None:
+        setup()
+    # Worker processes skip atexit handlers, but multiprocessing runs its finalizers
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        Finalize(None, provider.shutdown, exitpriority=10)
+
+
+def _run_traced(carrier: dict, span_name: str, submitted_at: float, function: Callable, args: tuple):
+    context = _propagator.extract(carrier)
+    with trace.get_tracer(__name__).start_as_current_span(span_name, context=context, kind=trace.SpanKind.INTERNAL) as span:
+        span.set_attribute("process.pid", os.getpid())
+        # Wall clock, since perf_counter isn't comparable across processes
+        span.set_attribute("tool.dispatch_ms", round((time.time() - submitted_at) * 1000, 3))
+        return function(*args)
+
+
+class ProcessToolPool:
+    def __init__(self, max_workers: int = 2, setup: Optional[Callable[[], None]] = None, start_method: Optional[str] = None):
+        start_method = start_method or os.environ.get("TOOL_PROCESS_START_METHOD", "spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(setup,),
+        )
+
+    def submit(self, span_name: str, function: Callable, *args) -> Future:
+        """Run function(*args) in a worker under a span that is a child of the current span.
+
+        `function` and `args` must be picklable, so the function has to be defined at module level.
+        """
+        return self._executor.submit(_run_traced, inject_trace_context(), span_name, time.time(), function, args)
+
+    def run(self, span_name: str, function: Callable, *args):
+        return self.submit(span_name, function, *args).result()
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def _noop() -> None:
+    return None
+
+
+# Benchmark the cost of dispatching a trivial tool to a worker vs running it in-thread
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    from opentelemetry.sdk.trace import TracerProvider
+
+    trace.set_tracer_provider(TracerProvider())
+    bench_tracer = trace.get_tracer(__name__)
+    iterations = int(os.environ.get("TOOL_DISPATCH_BENCH_ITERATIONS", "2000"))
+
+    def per_call_us(label: str, call: Callable[[], None]):
+        with bench_tracer.start_as_current_span("bench"):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                call()
+            elapsed = time.perf_counter() - start
+        print(f"{label:>22}: {elapsed / iterations * 1e6:8.1f} us per call")
+
+    per_call_us("in-thread", _noop)
+    with ThreadPoolExecutor(max_workers=2) as thread_pool:
+        per_call_us("thread pool", lambda: thread_pool.submit(_noop).result())
+
+    start = time.perf_counter()
+    pool = ProcessToolPool(max_workers=2)
+    # Start the workers before timing so process start-up isn't counted as dispatch cost
+    for future in [pool.submit("tool_process.warmup", _noop) for _ in range(4)]:
+        future.result()
+    print(f"{'process pool start-up':>22}: {(time.perf_counter() - start) * 1000:8.1f} ms")
+    per_call_us("process pool", lambda: pool.run("tool_process.noop", _noop))
+    pool.shutdown()